@@ -0,0 +1,215 @@
+"""
+Learnnect Admission Control - Load shedding for the storage API
+Caps concurrent uploads and upload bytes in flight per worker. Requests over
+the budget wait in a short FIFO queue; when the queue is full or the wait runs
+out they are shed straight away with 503 + Retry-After instead of piling up in
+memory and pushing Drive into throttling. An upload bigger than the whole byte
+budget could never be admitted, so it is refused with 413 without queueing. Cheap reads have their own, larger
+budget, so they are never queued behind uploads.
+"""
+
+import os
+import json
+import math
+import time
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from upload_gate import UPLOAD_RULES
+
+ADMISSION_MAX_UPLOADS = int(os.getenv('ADMISSION_MAX_UPLOADS', 8))
+ADMISSION_MAX_UPLOAD_BYTES = int(os.getenv('ADMISSION_MAX_UPLOAD_BYTES', 64 * 1024 * 1024))
+ADMISSION_MAX_READS = int(os.getenv('ADMISSION_MAX_READS', 32))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 16))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 2))
+
+# Never shed the health check (load balancers rely on it); progress streams are
+# long-lived and nearly free, so they don't hold read slots
+ADMISSION_EXEMPT_PATHS = {'/api/storage/health', '/api/storage/upload-progress'}
+
+RETRY_AFTER_MAX = 30
+
+class Shed(Exception):
+    """Request rejected by admission control"""
+
+    def __init__(self, reason: str, retry_after: Optional[int], status_code: int = 503):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+class AdmissionController:
+    """Per-worker concurrency and bytes-in-flight budget with a bounded wait queue.
+
+    Runs entirely on the event loop, so no locking is needed.
+    """
+
+    def __init__(self, max_uploads: int = ADMISSION_MAX_UPLOADS, max_upload_bytes: int = ADMISSION_MAX_UPLOAD_BYTES,
+                 max_reads: int = ADMISSION_MAX_READS, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.limits = {'upload': max_uploads, 'read': max_reads}
+        self.max_upload_bytes = max_upload_bytes
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = {'upload': 0, 'read': 0}
+        self.bytes_in_flight = 0
+        self.waiters: Dict[str, Deque[Tuple[asyncio.Future, int]]] = {'upload': deque(), 'read': deque()}
+        self.stats = {
+            kind: {'admitted': 0, 'queued': 0, 'shed_queue_full': 0, 'shed_timeout': 0, 'shed_too_large': 0}
+            for kind in ('upload', 'read')
+        }
+        self.wait_times: Deque[float] = deque(maxlen=1000)
+        # Smoothed upload duration, used to suggest Retry-After
+        self.upload_seconds = 2.0
+
+    def _fits(self, kind: str, size: int) -> bool:
+        if self.in_flight[kind] >= self.limits[kind]:
+            return False
+        if kind == 'upload' and self.bytes_in_flight + size > self.max_upload_bytes:
+            return False
+        return True
+
+    def _take(self, kind: str, size: int):
+        self.in_flight[kind] += 1
+        if kind == 'upload':
+            self.bytes_in_flight += size
+        self.stats[kind]['admitted'] += 1
+
+    def _wake(self, kind: str):
+        """Admit queued requests, oldest first, while they fit"""
+        waiters = self.waiters[kind]
+        while waiters and self._fits(kind, waiters[0][1]):
+            future, size = waiters.popleft()
+            if future.done():
+                continue
+            self._take(kind, size)
+            future.set_result(True)
+
+    def retry_after(self, kind: str) -> int:
+        """Rough seconds until a slot frees up"""
+        if kind != 'upload':
+            return 1
+        queued = len(self.waiters[kind]) + 1
+        return max(1, min(RETRY_AFTER_MAX, math.ceil(self.upload_seconds * queued / self.limits[kind])))
+
+    async def acquire(self, kind: str, size: int = 0):
+        """Wait for capacity or raise Shed"""
+        if kind == 'upload' and size > self.max_upload_bytes:
+            # Would sit at the head of the queue forever, blocking everything behind it
+            self.stats[kind]['shed_too_large'] += 1
+            raise Shed('too large', None, status_code=413)
+
+        if not self.waiters[kind] and self._fits(kind, size):
+            self._take(kind, size)
+            self.wait_times.append(0.0)
+            return
+
+        if len(self.waiters[kind]) >= self.queue_size:
+            self.stats[kind]['shed_queue_full'] += 1
+            raise Shed('queue full', self.retry_after(kind))
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (future, size)
+        self.waiters[kind].append(entry)
+        self.stats[kind]['queued'] += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Admitted right as the wait ran out: give the slot back if we're being cancelled
+                if isinstance(e, asyncio.CancelledError):
+                    self.release(kind, size)
+                    raise
+            else:
+                future.cancel()
+                if entry in self.waiters[kind]:
+                    self.waiters[kind].remove(entry)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self.stats[kind]['shed_timeout'] += 1
+                raise Shed('queue timeout', self.retry_after(kind))
+        finally:
+            self.wait_times.append(time.perf_counter() - start)
+
+    def release(self, kind: str, size: int = 0, duration: Optional[float] = None):
+        """Give a slot back and admit whoever is next"""
+        self.in_flight[kind] -= 1
+        if kind == 'upload':
+            self.bytes_in_flight -= size
+            if duration is not None:
+                self.upload_seconds = 0.8 * self.upload_seconds + 0.2 * duration
+        self._wake(kind)
+
+    def metrics(self) -> Dict:
+        waits: List[float] = sorted(self.wait_times)
+
+        def percentile(fraction: float):
+            return round(waits[min(int(len(waits) * fraction), len(waits) - 1)] * 1000, 1) if waits else 0
+
+        metrics = {
+            kind: {
+                'inFlight': self.in_flight[kind],
+                'limit': self.limits[kind],
+                'waiting': len(self.waiters[kind]),
+                'admitted': self.stats[kind]['admitted'],
+                'queued': self.stats[kind]['queued'],
+                'shedQueueFull': self.stats[kind]['shed_queue_full'],
+                'shedTimeout': self.stats[kind]['shed_timeout'],
+                'shedTooLarge': self.stats[kind]['shed_too_large'],
+                **({'bytesInFlight': self.bytes_in_flight, 'bytesLimit': self.max_upload_bytes} if kind == 'upload' else {})
+            }
+            for kind in ('upload', 'read')
+        }
+        metrics.update({
+            'queueWaitMs': {'p50': percentile(0.5), 'p95': percentile(0.95), 'max': percentile(1.0)},
+            'queueSize': self.queue_size,
+            'queueTimeoutSeconds': self.queue_timeout,
+            'avgUploadSeconds': round(self.upload_seconds, 2)
+        })
+        return metrics
+
+admission = AdmissionController()
+
+class AdmissionMiddleware:
+    """Admit or shed each request before its body is read"""
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    def classify(self, scope) -> Tuple[str, int]:
+        """('upload', declared bytes) for upload posts, ('read', 0) for everything else"""
+        rule = UPLOAD_RULES.get(scope['path'])
+        if rule is None or scope['method'] != 'POST':
+            return 'read', 0
+        for key, value in scope.get('headers', []):
+            if key == b'content-length' and value.isdigit():
+                return 'upload', int(value)
+        # Chunked body: assume the largest allowed upload
+        return 'upload', rule['max_bytes']
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] in ADMISSION_EXEMPT_PATHS or scope['method'] == 'OPTIONS':
+            await self.app(scope, receive, send)
+            return
+
+        kind, size = self.classify(scope)
+        try:
+            await self.controller.acquire(kind, size)
+        except Shed as shed:
+            detail = 'Upload is too large.' if shed.status_code == 413 else 'Server is busy. Please retry shortly.'
+            body = json.dumps({'detail': detail}).encode()
+            headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+            if shed.retry_after is not None:
+                headers.append((b'retry-after', str(shed.retry_after).encode()))
+            await send({'type': 'http.response.start', 'status': shed.status_code, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(kind, size, time.perf_counter() - start)
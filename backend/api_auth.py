@@ -0,0 +1,486 @@
+"""
+Learnnect API Auth - API key, signed request and JWT authentication
+Callers prove who they are with one of:
+  X-API-Key: <API_SECRET_KEY>                      (backend services; any user)
+  X-Learnnect-Timestamp + X-Learnnect-Signature    (same, without sending the key;
+    + X-Learnnect-Content-SHA256                     the body's digest is signed too;
+    + X-Learnnect-Nonce                              each signature is accepted once)
+  X-Admin-Key: <ADMIN_API_KEY>                     (admin tools and routes)
+  Authorization: Bearer <HS256 JWT, JWT_SECRET_KEY> (a user; sub must match userId)
+  ?token=<short-lived JWT> on the progress stream  (EventSource can't send headers)
+Keys are held as SHA-256 digests and compared in constant time; verified JWT
+claims are cached in a bounded LRU so a token is only checked once. Keys are
+rotated without a restart through AUTH_KEYS_FILE (see generate_api_keys.py
+--rotate), whose first entries sign and whose later entries are still accepted.
+
+Bad credentials always get 401. Missing ones are let through (and counted)
+on the routes today's frontend calls without a token until AUTH_REQUIRED=true,
+so clients can be rolled out first; every other route needs credentials.
+"""
+
+import os
+import sys
+import json
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from shared_state import shared_state
+
+AUTH_REQUIRED = os.getenv('AUTH_REQUIRED', 'false').lower() == 'true'
+AUTH_KEYS_FILE = os.getenv('AUTH_KEYS_FILE')
+
+# How often the keys file is checked for a rotation
+AUTH_RELOAD_INTERVAL = float(os.getenv('AUTH_RELOAD_INTERVAL', 5))
+
+# Signed requests older (or newer) than this are rejected; within it each signature is accepted once
+AUTH_SIGNATURE_TOLERANCE = int(os.getenv('AUTH_SIGNATURE_TOLERANCE', 300))
+
+JWT_CACHE_SIZE = int(os.getenv('JWT_CACHE_SIZE', 10000))
+JWT_LEEWAY = 30
+
+# Load balancer health checks
+AUTH_EXEMPT_PATHS = {'/api/storage/health'}
+
+# Routes the frontend calls without credentials; until AUTH_REQUIRED=true only these admit anonymous callers
+AUTH_ANONYMOUS_PATHS = {
+    '/api/storage/upload-resume', '/api/storage/user-resumes', '/api/storage/delete-resume',
+    '/api/storage/download-url', '/api/storage/upload-image', '/api/storage/check-existing-image',
+    '/api/storage/delete-image', '/api/storage/check-user-folder'
+}
+# Write-behind uploads hand their caller a status URL under here
+AUTH_ANONYMOUS_PREFIXES = ('/api/storage/upload-status/',)
+
+# The one route that takes a token in the query string, and how long its tokens live
+STREAM_TOKEN_PATH = '/api/storage/upload-progress'
+STREAM_TOKEN_TTL = int(os.getenv('STREAM_TOKEN_TTL', 10 * 60))
+
+SIGNATURE_HEADER = b'x-learnnect-signature'
+TIMESTAMP_HEADER = b'x-learnnect-timestamp'
+CONTENT_DIGEST_HEADER = b'x-learnnect-content-sha256'
+NONCE_HEADER = b'x-learnnect-nonce'
+
+# Signed requests without a digest header are signed as having no body
+EMPTY_BODY_SHA256 = hashlib.sha256(b'').hexdigest()
+
+# Keys file entries and the environment variables used when there is no file
+KEY_SOURCES = {
+    'service': ('apiKeys', ['API_SECRET_KEY', 'API_SECRET_KEY_PREVIOUS']),
+    'admin': ('adminKeys', ['ADMIN_API_KEY', 'ADMIN_API_KEY_PREVIOUS']),
+    'jwt': ('jwtSecrets', ['JWT_SECRET_KEY', 'JWT_SECRET_KEY_PREVIOUS'])
+}
+
+current_principal: ContextVar[Optional[Dict]] = ContextVar('current_principal', default=None)
+
+class AuthError(Exception):
+    """Credentials that were sent but don't verify"""
+
+def b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+def signing_message(timestamp: int, method: str, path: str, query: str, digest: str, nonce: str = '') -> bytes:
+    """What a signature covers; the nonce line is only there when the caller sent one"""
+    message = f"{timestamp}\n{method}\n{path}\n{query}\n{digest}"
+    return (f"{message}\n{nonce}" if nonce else message).encode()
+
+def sign_request(secret: str, method: str, path: str, query: str = '', body: bytes = b'',
+                 timestamp: Optional[int] = None, nonce: Optional[str] = None) -> Dict[str, str]:
+    """Headers for a signed request (for backend callers and the benchmark)"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    # Signatures are single use, so identical requests within a second need different nonces
+    nonce = secrets.token_hex(16) if nonce is None else nonce
+    digest = hashlib.sha256(body).hexdigest()
+    signature = hmac.new(secret.encode(), signing_message(timestamp, method, path, query, digest, nonce), hashlib.sha256).hexdigest()
+    return {
+        'X-Learnnect-Timestamp': str(timestamp),
+        'X-Learnnect-Content-SHA256': digest,
+        'X-Learnnect-Nonce': nonce,
+        'X-Learnnect-Signature': signature
+    }
+
+def make_jwt(secret: str, claims: Dict) -> str:
+    """HS256 token (for backend callers and the benchmark)"""
+    def encode(part: bytes) -> str:
+        return base64.urlsafe_b64encode(part).rstrip(b'=').decode()
+    signing_input = encode(b'{"alg":"HS256","typ":"JWT"}') + '.' + encode(json.dumps(claims, separators=(',', ':')).encode())
+    return signing_input + '.' + encode(hmac.new(secret.encode(), signing_input.encode(), hashlib.sha256).digest())
+
+class Authenticator:
+    """Current keys (reloaded on rotation), credential checks and the JWT claims cache"""
+
+    def __init__(self, keys_file: Optional[str] = AUTH_KEYS_FILE, required: bool = AUTH_REQUIRED):
+        self.keys_file = keys_file
+        self.required = required
+        self.key_digests: List[Tuple[str, bytes]] = []
+        self.service_secrets: List[bytes] = []
+        self.jwt_secrets: List[bytes] = []
+        self.jwt_cache: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._keys_mtime = None
+        self._checked_at = 0.0
+        self.stats = {
+            'service': 0, 'admin': 0, 'user': 0, 'anonymous': 0, 'rejected': 0,
+            'jwt_cache_hits': 0, 'jwt_cache_misses': 0, 'reloads': 0,
+            'checks': 0, 'check_ns': 0
+        }
+        self.load_keys()
+
+    def load_keys(self):
+        """Read keys from AUTH_KEYS_FILE, falling back to the environment per kind"""
+        from_file = {}
+        self._keys_mtime = None
+        if self.keys_file and os.path.exists(self.keys_file):
+            self._keys_mtime = os.stat(self.keys_file).st_mtime
+            with open(self.keys_file) as f:
+                from_file = json.load(f)
+
+        keys = {}
+        for kind, (file_entry, env_names) in KEY_SOURCES.items():
+            values = from_file.get(file_entry) or [os.getenv(name) for name in env_names]
+            keys[kind] = [value for value in values if value]
+
+        self.key_digests = [
+            (kind, hashlib.sha256(key.encode()).digest())
+            for kind in ('service', 'admin') for key in keys[kind]
+        ]
+        self.service_secrets = [key.encode() for key in keys['service']]
+        self.jwt_secrets = [secret.encode() for secret in keys['jwt']]
+        # Tokens signed with a retired secret must stop working straight away
+        self.jwt_cache.clear()
+
+    def maybe_reload(self):
+        """Pick up a rotated keys file (stat at most every AUTH_RELOAD_INTERVAL)"""
+        if not self.keys_file:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < AUTH_RELOAD_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            try:
+                mtime = os.stat(self.keys_file).st_mtime
+            except FileNotFoundError:
+                mtime = None  # No file (yet): the environment's keys apply
+            if mtime != self._keys_mtime:
+                self.load_keys()
+                self.stats['reloads'] += 1
+                print(f"🔑 Reloaded auth keys from {self.keys_file}")
+        except Exception as e:
+            # Keep the current keys rather than locking everyone out mid-rotation
+            print(f"⚠️ Could not reload auth keys: {e}")
+
+    def verify_api_key(self, provided: bytes) -> str:
+        """Kind of key ('service' or 'admin'); every digest is compared, so timing reveals nothing"""
+        digest = hashlib.sha256(provided).digest()
+        matched = None
+        for kind, key_digest in self.key_digests:
+            if hmac.compare_digest(digest, key_digest):
+                matched = kind
+        if matched is None:
+            raise AuthError('Invalid API key')
+        return matched
+
+    def is_admin_key(self, provided: bytes) -> bool:
+        """Whether this is a current admin key (for admin checks outside the auth headers)"""
+        self.maybe_reload()
+        try:
+            return self.verify_api_key(provided) == 'admin'
+        except AuthError:
+            return False
+
+    def verify_signature(self, method: str, path: str, query: str, timestamp: bytes, signature: bytes,
+                         content_digest: str = EMPTY_BODY_SHA256, nonce: str = '') -> int:
+        """HMAC-SHA256 of timestamp, method, path, query, body digest and nonce under a service key.
+
+        Only the declared digest is checked here; AuthMiddleware compares it
+        with the body as it arrives. Returns the signing time.
+        """
+        try:
+            signed_at = int(timestamp)
+        except ValueError:
+            raise AuthError('Invalid signature timestamp')
+        if abs(time.time() - signed_at) > AUTH_SIGNATURE_TOLERANCE:
+            raise AuthError('Signature expired')
+        if len(content_digest) != 64 or content_digest.strip('0123456789abcdef'):
+            raise AuthError('Invalid content digest')
+
+        message = signing_message(signed_at, method, path, query, content_digest, nonce)
+        valid = False
+        for secret in self.service_secrets:
+            expected = hmac.new(secret, message, hashlib.sha256).hexdigest().encode()
+            valid |= hmac.compare_digest(expected, signature)
+        if not valid:
+            raise AuthError('Invalid signature')
+        return signed_at
+
+    def claim_signature(self, signature: str, signed_at: int):
+        """Accept a signature once (across workers) for as long as its timestamp is valid"""
+        ttl = signed_at + AUTH_SIGNATURE_TOLERANCE - time.time()
+        if not shared_state.try_acquire(f"signature:{signature}", ttl=max(ttl, 1)):
+            raise AuthError('Signature already used')
+
+    def issue_stream_token(self, user_id: str, upload_id: str) -> str:
+        """Short-lived token that lets its user follow one upload's progress stream"""
+        if not self.jwt_secrets:
+            raise AuthError('No JWT secret configured')
+        claims = {'sub': user_id, 'uploadId': upload_id, 'exp': int(time.time()) + STREAM_TOKEN_TTL}
+        return make_jwt(self.jwt_secrets[0].decode(), claims)
+
+    def verify_jwt(self, token: str) -> Dict:
+        """Claims of a valid HS256 token, from the LRU when it was seen before"""
+        claims = self.jwt_cache.get(token)
+        if claims is not None:
+            self.jwt_cache.move_to_end(token)
+            self.stats['jwt_cache_hits'] += 1
+        else:
+            self.stats['jwt_cache_misses'] += 1
+            claims = self._decode_jwt(token)
+            self.jwt_cache[token] = claims
+            if len(self.jwt_cache) > JWT_CACHE_SIZE:
+                self.jwt_cache.popitem(last=False)
+
+        # Checked on every use: a cached token still expires
+        now = time.time()
+        if 'exp' in claims and now > claims['exp'] + JWT_LEEWAY:
+            self.jwt_cache.pop(token, None)
+            raise AuthError('Token expired')
+        if 'nbf' in claims and now < claims['nbf'] - JWT_LEEWAY:
+            raise AuthError('Token not yet valid')
+        return claims
+
+    def _decode_jwt(self, token: str) -> Dict:
+        try:
+            header_segment, payload_segment, signature_segment = token.split('.')
+            header = json.loads(b64url_decode(header_segment))
+            signature = b64url_decode(signature_segment)
+        except ValueError:
+            raise AuthError('Malformed token')
+        if not isinstance(header, dict):
+            raise AuthError('Malformed token')
+        # Pinned: never let the token pick its own algorithm
+        if header.get('alg') != 'HS256':
+            raise AuthError('Unsupported token algorithm')
+
+        signing_input = f"{header_segment}.{payload_segment}".encode()
+        valid = False
+        for secret in self.jwt_secrets:
+            valid |= hmac.compare_digest(hmac.new(secret, signing_input, hashlib.sha256).digest(), signature)
+        if not valid:
+            raise AuthError('Invalid token signature')
+
+        try:
+            claims = json.loads(b64url_decode(payload_segment))
+        except ValueError:
+            raise AuthError('Malformed token')
+        if not isinstance(claims, dict) or not (claims.get('sub') or claims.get('userId')):
+            raise AuthError('Token has no subject')
+        if any(not isinstance(claims.get(name, 0), (int, float)) for name in ('exp', 'nbf')):
+            raise AuthError('Malformed token')
+        return claims
+
+    def authenticate(self, scope, headers: Dict[bytes, bytes]) -> Dict:
+        """Principal for a request: {'type': service|admin|user|anonymous, 'userId': ...}"""
+        self.maybe_reload()
+
+        api_key = headers.get(b'x-api-key') or headers.get(b'x-admin-key')
+        if api_key:
+            return {'type': self.verify_api_key(api_key), 'userId': None}
+
+        signature = headers.get(SIGNATURE_HEADER)
+        if signature:
+            content_digest = headers.get(CONTENT_DIGEST_HEADER, EMPTY_BODY_SHA256.encode()).decode('latin-1').lower()
+            signed_at = self.verify_signature(
+                scope['method'], scope['path'], scope.get('query_string', b'').decode('latin-1'),
+                headers.get(TIMESTAMP_HEADER, b''), signature, content_digest,
+                headers.get(NONCE_HEADER, b'').decode('latin-1')
+            )
+            # The replay check needs shared state; AuthMiddleware runs it off the event loop
+            return {'type': 'service', 'userId': None, 'bodySha256': content_digest,
+                    'signature': signature.decode('latin-1'), 'signedAt': signed_at}
+
+        authorization = headers.get(b'authorization', b'')
+        if authorization[:7].lower() == b'bearer ':
+            claims = self.verify_jwt(authorization[7:].strip().decode('latin-1'))
+            if claims.get('uploadId'):
+                raise AuthError('Progress stream tokens only open the progress stream')
+            return {'type': 'user', 'userId': str(claims.get('sub') or claims.get('userId'))}
+
+        if scope['path'] == STREAM_TOKEN_PATH and scope.get('query_string'):
+            token = parse_qs(scope['query_string'].decode('latin-1')).get('token', [''])[0]
+            if token:
+                claims = self.verify_jwt(token)
+                if not claims.get('uploadId'):
+                    raise AuthError('Not a progress stream token')
+                return {'type': 'user', 'userId': str(claims['sub']), 'uploadId': claims['uploadId']}
+
+        return {'type': 'anonymous', 'userId': None}
+
+    def metrics(self) -> Dict:
+        checks = self.stats['checks']
+        return {
+            'required': self.required,
+            'keysFile': self.keys_file,
+            'principals': {kind: self.stats[kind] for kind in ('service', 'admin', 'user', 'anonymous')},
+            'rejected': self.stats['rejected'],
+            'jwtCache': {
+                'size': len(self.jwt_cache),
+                'hits': self.stats['jwt_cache_hits'],
+                'misses': self.stats['jwt_cache_misses']
+            },
+            'reloads': self.stats['reloads'],
+            'avgCheckMicros': round(self.stats['check_ns'] / checks / 1000, 1) if checks else 0
+        }
+
+authenticator = Authenticator()
+
+def allows_anonymous(path: str) -> bool:
+    """Whether a route admits callers without credentials while AUTH_REQUIRED is off"""
+    return path in AUTH_ANONYMOUS_PATHS or path.startswith(AUTH_ANONYMOUS_PREFIXES)
+
+def authorize_user(user_id: Optional[str]):
+    """Reject a user token acting for someone else (every route that serves or changes a user's files)"""
+    principal = current_principal.get()
+    if principal and principal['type'] == 'user' and principal['userId'] != user_id:
+        raise HTTPException(status_code=403, detail="Token does not match userId")
+
+class AuthMiddleware:
+    """Authenticate each request before any other work is done for it"""
+
+    def __init__(self, app, auth: Authenticator = authenticator):
+        self.app = app
+        self.auth = auth
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] == 'OPTIONS' or scope['path'] in AUTH_EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers', []))
+        stats = self.auth.stats
+        start = time.perf_counter_ns()
+        try:
+            principal = self.auth.authenticate(scope, headers)
+            if principal.get('signature'):
+                await run_in_threadpool(self.auth.claim_signature, principal['signature'], principal['signedAt'])
+        except AuthError as e:
+            stats['rejected'] += 1
+            await self._send_json(send, 401, {'detail': str(e)})
+            return
+        finally:
+            stats['checks'] += 1
+            stats['check_ns'] += time.perf_counter_ns() - start
+
+        if principal['type'] == 'anonymous' and (self.auth.required or not allows_anonymous(scope['path'])):
+            stats['rejected'] += 1
+            await self._send_json(send, 401, {'detail': 'Authentication required'})
+            return
+
+        if principal['type'] == 'user':
+            # userId in the query string (or X-User-Id) is checked here; body fields by the route
+            user_id = headers.get(b'x-user-id', b'').decode('latin-1')
+            if not user_id and scope.get('query_string'):
+                user_id = parse_qs(scope['query_string'].decode('latin-1')).get('userId', [''])[0]
+            if user_id and user_id != principal['userId']:
+                stats['rejected'] += 1
+                await self._send_json(send, 403, {'detail': 'Token does not match userId'})
+                return
+
+        stats[principal['type']] += 1
+        body_check = None
+        app_receive, app_send = receive, send
+        if principal.get('bodySha256'):
+            app_receive, app_send, body_check = self._check_body(principal['bodySha256'], receive, send)
+        token = current_principal.set(principal)
+        try:
+            await self.app(scope, app_receive, app_send)
+        except AuthError:
+            # The body check's error reached us; answer 401 unless the route's error response already became one
+            if not (body_check and body_check['tampered']):
+                raise
+            if not body_check['responded']:
+                await self._send_json(send, 401, {'detail': 'Body does not match the signature'})
+        finally:
+            current_principal.reset(token)
+
+    def _check_body(self, expected: str, receive, send):
+        """Wrap receive/send so a body that doesn't match the signed digest is refused with 401.
+
+        The mismatch is raised on the last chunk, before the route can act on
+        the body; whatever error response that produces is replaced. Returns
+        the wrapped receive and send, and the check's state.
+        """
+        digest = hashlib.sha256()
+        state = {'tampered': False, 'responded': False}
+
+        async def checked_receive():
+            message = await receive()
+            if message['type'] == 'http.request':
+                digest.update(message.get('body', b''))
+                if not message.get('more_body') and not hmac.compare_digest(digest.hexdigest(), expected):
+                    state['tampered'] = True
+                    self.auth.stats['rejected'] += 1
+                    raise AuthError('Body does not match the signature')
+            return message
+
+        async def checked_send(message):
+            if not state['tampered']:
+                await send(message)
+            elif message['type'] == 'http.response.start':
+                state['responded'] = True
+                await self._send_json(send, 401, {'detail': 'Body does not match the signature'})
+
+        return checked_receive, checked_send, state
+
+    async def _send_json(self, send, status: int, payload: Dict):
+        body = json.dumps(payload).encode()
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        if status == 401:
+            headers.append((b'www-authenticate', b'Bearer'))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+def benchmark(iterations: int = 20000):
+    """Time each kind of credential check (python api_auth.py)"""
+    api_key = 'benchmark-api-key'
+    jwt_secret = 'benchmark-jwt-secret'
+    os.environ.update(API_SECRET_KEY=api_key, ADMIN_API_KEY='benchmark-admin-key', JWT_SECRET_KEY=jwt_secret)
+    auth = Authenticator(keys_file=None)
+
+    query = 'userId=user-1234&userEmail=user%40example.com'
+    signed = sign_request(api_key, 'GET', '/api/storage/user-resumes', query)
+    token = make_jwt(jwt_secret, {'sub': 'user-1234', 'exp': int(time.time()) + 3600})
+    cases = {
+        'API key': {b'x-api-key': api_key.encode()},
+        'Signed request': {SIGNATURE_HEADER: signed['X-Learnnect-Signature'].encode(),
+                           TIMESTAMP_HEADER: signed['X-Learnnect-Timestamp'].encode(),
+                           CONTENT_DIGEST_HEADER: signed['X-Learnnect-Content-SHA256'].encode(),
+                           NONCE_HEADER: signed['X-Learnnect-Nonce'].encode()},
+        'JWT (cached)': {b'authorization': f"Bearer {token}".encode()},
+        'No credentials': {}
+    }
+    scope = {'method': 'GET', 'path': '/api/storage/user-resumes', 'query_string': query.encode()}
+
+    print("🔐 Learnnect API Auth Benchmark")
+    print("=" * 50)
+    for name, headers in cases.items():
+        auth.authenticate(scope, headers)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            auth.authenticate(scope, headers)
+        print(f"   {name}: {(time.perf_counter() - start) / iterations * 1e6:.1f}µs per request")
+
+    start = time.perf_counter()
+    for i in range(iterations // 10):
+        auth._decode_jwt(make_jwt(jwt_secret, {'sub': f'user-{i}'}))
+    print(f"   JWT (uncached, incl. signing): {(time.perf_counter() - start) / (iterations // 10) * 1e6:.1f}µs per request")
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,180 @@
+"""
+Learnnect Cache Snapshots - Warm restarts for the Drive metadata caches
+The folder, file and listing caches are snapshotted every few minutes (and on
+shutdown) to one gzipped file. A freshly deployed instance loads it before it
+serves traffic, then replays the Drive changes feed from the cursor saved with
+the snapshot, so entries changed since are corrected instead of served stale.
+Point CACHE_SNAPSHOT_PATH at a disk that survives deploys.
+"""
+
+import os
+import json
+import gzip
+import time
+import threading
+from typing import Callable, Dict, Optional
+
+from shared_state import shared_state
+
+CACHE_SNAPSHOT_ENABLED = os.getenv('CACHE_SNAPSHOT_ENABLED', 'true').lower() == 'true'
+CACHE_SNAPSHOT_PATH = os.getenv(
+    'CACHE_SNAPSHOT_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache_snapshot.json.gz')
+)
+CACHE_SNAPSHOT_INTERVAL = int(os.getenv('CACHE_SNAPSHOT_INTERVAL', 300))
+
+# Older snapshots are ignored; without the changes feed nothing can correct them, so trust them less
+CACHE_SNAPSHOT_MAX_AGE = int(os.getenv('CACHE_SNAPSHOT_MAX_AGE', 24 * 60 * 60))
+CACHE_SNAPSHOT_MAX_AGE_UNSYNCED = int(os.getenv('CACHE_SNAPSHOT_MAX_AGE_UNSYNCED', 60 * 60))
+
+SNAPSHOT_VERSION = 1
+
+# Drive metadata only: never tokens, upload jobs or idempotency records
+SNAPSHOT_NAMESPACES = ['folders', 'folder_keys', 'folder_owners', 'files', 'thumbnails', 'listing_versions', 'responses', 'drive_sync']
+
+class CacheSnapshotter:
+    """Periodic snapshots of the metadata caches, and the restore at startup"""
+
+    def __init__(self, root_folder_id: str, path: str = CACHE_SNAPSHOT_PATH,
+                 interval: int = CACHE_SNAPSHOT_INTERVAL, enabled: bool = CACHE_SNAPSHOT_ENABLED):
+        self.root_folder_id = root_folder_id
+        self.path = path
+        self.interval = interval
+        self.enabled = enabled
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {
+            'saved': 0,
+            'last_saved_at': None,
+            'last_entries': 0,
+            'last_bytes': 0,
+            'restored_entries': 0,
+            'restored_age': None,
+            'last_error': None
+        }
+
+    def start(self):
+        """Snapshot periodically in a background thread"""
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='cache-snapshot', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and take a final snapshot"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self.enabled:
+            self.save()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.save()
+
+    def save(self) -> bool:
+        """Write a snapshot (one worker at a time, at most once per interval across workers)"""
+        owner = shared_state.try_acquire('cache-snapshot', ttl=60)
+        if not owner:
+            return False
+        try:
+            last = shared_state.get('cache_snapshot', 'saved_at', 0)
+            if time.time() - last < min(self.interval / 2, 30):
+                return False
+
+            start = time.perf_counter()
+            rows = shared_state.export_rows(SNAPSHOT_NAMESPACES)
+            snapshot = {
+                'version': SNAPSHOT_VERSION,
+                'rootFolderId': self.root_folder_id,
+                'createdAt': time.time(),
+                'rows': rows
+            }
+            # Write, fsync, then rename so a crash never leaves a truncated snapshot
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as compressed:
+                    compressed.write(json.dumps(snapshot, separators=(',', ':')).encode('utf-8'))
+                raw.flush()
+                os.fsync(raw.fileno())
+                size = raw.tell()
+            os.replace(temp_path, self.path)
+
+            shared_state.set('cache_snapshot', 'saved_at', snapshot['createdAt'])
+            self.stats.update(saved=self.stats['saved'] + 1, last_saved_at=snapshot['createdAt'],
+                              last_entries=len(rows), last_bytes=size, last_error=None)
+            print(f"💾 Cache snapshot saved: {len(rows)} entries, {size} bytes in {(time.perf_counter() - start) * 1000:.0f}ms")
+            return True
+        except Exception as e:
+            self.stats['last_error'] = str(e)
+            print(f"⚠️ Cache snapshot failed: {e}")
+            return False
+        finally:
+            shared_state.release('cache-snapshot', owner)
+
+    def restore(self, catch_up: Optional[Callable[[], int]] = None) -> int:
+        """Load the snapshot into empty caches; returns the entries restored.
+
+        catch_up replays Drive changes made since the snapshot (the drive sync
+        poll). If it fails the restored entries are dropped again, since
+        nothing would correct them.
+        """
+        if not self.enabled or not os.path.exists(self.path):
+            return 0
+
+        with shared_state.single_flight('cache-snapshot-restore', ttl=120, wait=120):
+            try:
+                with gzip.open(self.path, 'rb') as compressed:
+                    snapshot = json.loads(compressed.read())
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable cache snapshot: {e}")
+                return 0
+
+            if shared_state.get('cache_snapshot', 'restored_from') == snapshot.get('createdAt'):
+                return 0  # Another worker already restored it
+            age = time.time() - snapshot.get('createdAt', 0)
+            max_age = CACHE_SNAPSHOT_MAX_AGE if catch_up else CACHE_SNAPSHOT_MAX_AGE_UNSYNCED
+            if snapshot.get('version') != SNAPSHOT_VERSION or snapshot.get('rootFolderId') != self.root_folder_id:
+                print("⚠️ Ignoring cache snapshot from another configuration")
+                return 0
+            if age > max_age:
+                print(f"⚠️ Ignoring cache snapshot from {age / 3600:.1f}h ago (max {max_age / 3600:.1f}h)")
+                return 0
+
+            rows = [tuple(row) for row in snapshot['rows']]
+            if not catch_up:
+                # No changes feed to advance, so don't restore its cursor
+                rows = [row for row in rows if row[0] != 'drive_sync']
+            inserted = shared_state.import_rows(rows)
+            restored = len(inserted)
+            shared_state.set('cache_snapshot', 'restored_from', snapshot['createdAt'])
+
+            if restored and catch_up:
+                try:
+                    applied = catch_up()
+                    print(f"🔄 Applied {applied} Drive changes made since the snapshot")
+                except Exception as e:
+                    # Only what the restore added: live rows the import skipped stay as they are
+                    print(f"⚠️ Could not catch up with Drive changes, dropping restored caches: {e}")
+                    shared_state.remove_rows(inserted)
+                    return 0
+
+            if restored:
+                self.stats.update(restored_entries=restored, restored_age=round(age))
+                print(f"♨️ Restored {restored} cache entries from a snapshot taken {age:.0f}s ago")
+            return restored
+
+    def metrics(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'path': self.path,
+            'saved': self.stats['saved'],
+            'lastSavedAt': self.stats['last_saved_at'],
+            'lastEntries': self.stats['last_entries'],
+            'lastBytes': self.stats['last_bytes'],
+            'restoredEntries': self.stats['restored_entries'],
+            'restoredAgeSeconds': self.stats['restored_age'],
+            'lastError': self.stats['last_error']
+        }
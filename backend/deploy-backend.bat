@@ -10,6 +10,26 @@ mkdir backend-deploy
 echo.
 echo 📋 Step 2: Copying files...
 copy learnnect_storage_api.py backend-deploy\
+copy shared_state.py backend-deploy\
+copy cache_snapshot.py backend-deploy\
+copy resume_thumbnails.py backend-deploy\
+copy drive_sync.py backend-deploy\
+copy upload_gate.py backend-deploy\
+copy drive_http.py backend-deploy\
+copy drive_recorder.py backend-deploy\
+copy drive_hedging.py backend-deploy\
+copy drive_accounts.py backend-deploy\
+copy token_refresher.py backend-deploy\
+copy request_profiler.py backend-deploy\
+copy request_deadline.py backend-deploy\
+copy admission_control.py backend-deploy\
+copy idempotency.py backend-deploy\
+copy rate_limit.py backend-deploy\
+copy api_auth.py backend-deploy\
+copy storage_usage.py backend-deploy\
+copy upload_spool.py backend-deploy\
+copy upload_progress.py backend-deploy\
+copy gunicorn.conf.py backend-deploy\
 copy requirements.txt backend-deploy\
 copy service-account-key.json backend-deploy\
 copy .env.production backend-deploy\.env
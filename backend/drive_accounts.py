@@ -0,0 +1,256 @@
+"""
+Learnnect Drive Accounts - Shard Drive API load across several service accounts
+Users are assigned to an account with consistent hashing (so folder ownership
+stays stable when accounts are added), requests fail over to the next account
+on the ring when one is throttled, and per-account metrics are tracked.
+
+PooledHttp is an httplib2-compatible transport, so the Drive client built on
+top of it needs no changes: the account is chosen per request from the user
+set with user_context().
+"""
+
+import os
+import time
+import bisect
+import hashlib
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional
+
+from google_auth_httplib2 import AuthorizedHttp
+
+from drive_http import InstrumentedHttp, DRIVE_HTTP_TIMEOUT
+from drive_hedging import Hedger
+
+# Virtual nodes per account on the hash ring (smooths the user distribution)
+RING_REPLICAS = 64
+
+# How long a throttled account is skipped (doubles on repeated throttling)
+THROTTLE_COOLDOWN = float(os.getenv('DRIVE_THROTTLE_COOLDOWN', 30))
+THROTTLE_COOLDOWN_MAX = 600
+
+THROTTLE_REASONS = (b'rateLimitExceeded', b'userRateLimitExceeded', b'sharingRateLimitExceeded')
+
+current_user: ContextVar[Optional[str]] = ContextVar('current_drive_user', default=None)
+
+@contextmanager
+def user_context(user_id: Optional[str]):
+    """Route Drive calls made inside the block to this user's service account"""
+    token = current_user.set(user_id)
+    try:
+        yield
+    finally:
+        current_user.reset(token)
+
+def for_user(method):
+    """Decorator for service methods whose first argument is the user ID"""
+    @wraps(method)
+    def wrapper(self, user_id, *args, **kwargs):
+        with user_context(user_id):
+            return method(self, user_id, *args, **kwargs)
+    return wrapper
+
+def is_throttled(response, content) -> bool:
+    """Drive signals throttling with 429, or 403 + a rate-limit reason"""
+    if response.status == 429:
+        return True
+    if response.status == 403 and content:
+        body = content if isinstance(content, bytes) else str(content).encode()
+        return any(reason in body for reason in THROTTLE_REASONS)
+    return False
+
+class DriveAccount:
+    """One service account, its transport and its metrics"""
+
+    def __init__(self, name: str, credentials):
+        self.name = name
+        self.credentials = credentials
+        self._local = threading.local()
+        self.throttled_until = 0.0
+        self.cooldown = THROTTLE_COOLDOWN
+        self.lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'errors': 0,
+            'throttled': 0,
+            'failovers_out': 0,
+            'total_latency_ms': 0.0
+        }
+        self.quota: Dict = {}
+
+    @property
+    def http(self) -> AuthorizedHttp:
+        """This thread's transport (httplib2 connections can't be shared across threads)"""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = AuthorizedHttp(self.credentials, http=InstrumentedHttp(timeout=DRIVE_HTTP_TIMEOUT))
+        return http
+
+    def available(self) -> bool:
+        return time.time() >= self.throttled_until
+
+    def mark_throttled(self):
+        with self.lock:
+            self.stats['throttled'] += 1
+            self.throttled_until = time.time() + self.cooldown
+            self.cooldown = min(self.cooldown * 2, THROTTLE_COOLDOWN_MAX)
+        print(f"🐢 Drive account {self.name} throttled; skipping for {self.throttled_until - time.time():.0f}s")
+
+    def mark_healthy(self):
+        self.cooldown = THROTTLE_COOLDOWN
+
+    def record(self, latency_ms: float, error: bool):
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['total_latency_ms'] += latency_ms
+            if error:
+                self.stats['errors'] += 1
+
+    def metrics(self) -> Dict:
+        requests = self.stats['requests']
+        return {
+            'account': self.name,
+            'requests': requests,
+            'errors': self.stats['errors'],
+            'throttled': self.stats['throttled'],
+            'failoversOut': self.stats['failovers_out'],
+            'avgLatencyMs': round(self.stats['total_latency_ms'] / requests, 1) if requests else None,
+            'throttledFor': max(round(self.throttled_until - time.time()), 0),
+            'quota': self.quota
+        }
+
+class ServiceAccountPool:
+    """Consistent-hash ring of service accounts"""
+
+    def __init__(self, accounts: List[DriveAccount]):
+        if not accounts:
+            raise ValueError("At least one service account is required")
+        self.accounts = accounts
+        self.ring: List[int] = []
+        self.ring_accounts: List[DriveAccount] = []
+        for account in accounts:
+            for replica in range(RING_REPLICAS):
+                point = self._hash(f"{account.name}#{replica}")
+                index = bisect.bisect(self.ring, point)
+                self.ring.insert(index, point)
+                self.ring_accounts.insert(index, account)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+    @property
+    def primary(self) -> DriveAccount:
+        return self.accounts[0]
+
+    def candidates(self, user_id: Optional[str]) -> List[DriveAccount]:
+        """Accounts to try for a user: their home account first, then ring order"""
+        if user_id is None or len(self.accounts) == 1:
+            ordered = list(self.accounts)
+        else:
+            start = bisect.bisect(self.ring, self._hash(user_id)) % len(self.ring)
+            ordered = []
+            for offset in range(len(self.ring)):
+                account = self.ring_accounts[(start + offset) % len(self.ring)]
+                if account not in ordered:
+                    ordered.append(account)
+                    if len(ordered) == len(self.accounts):
+                        break
+
+        # Skip throttled accounts, but never end up with nothing to try
+        available = [account for account in ordered if account.available()]
+        return available or ordered
+
+    def account_for(self, user_id: Optional[str]) -> DriveAccount:
+        """The account that should serve this user right now"""
+        return self.candidates(user_id)[0]
+
+    def metrics(self) -> List[Dict]:
+        return [account.metrics() for account in self.accounts]
+
+    def refresh_quota(self, build_service):
+        """Fetch Drive storage quota for every account"""
+        for account in self.accounts:
+            try:
+                about = build_service(account.http).about().get(fields='user, storageQuota').execute()
+                quota = about.get('storageQuota', {})
+                account.quota = {
+                    'email': about.get('user', {}).get('emailAddress'),
+                    'usageBytes': int(quota.get('usage', 0)),
+                    'limitBytes': int(quota['limit']) if quota.get('limit') else None
+                }
+            except Exception as e:
+                account.quota = {'error': str(e)}
+
+class PooledHttp:
+    """httplib2-compatible transport that sends each request through the current user's account"""
+
+    def __init__(self, pool: ServiceAccountPool, hedger: Optional[Hedger] = None):
+        self.pool = pool
+        self.hedger = hedger
+        self.timeout = DRIVE_HTTP_TIMEOUT
+
+    @property
+    def credentials(self):
+        """Credentials of the current user's account (googleapiclient uses these for batch parts)"""
+        return self.pool.account_for(current_user.get()).credentials
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        if self.hedger is None:
+            return self._send(uri, method, body, headers, *args, **kwargs)
+        return self.hedger.request(method, uri, lambda: self._send(uri, method, body, headers, *args, **kwargs))
+
+    def _send(self, uri, method, body, headers, *args, **kwargs):
+        """Send through the user's account, failing over while accounts are throttled"""
+        candidates = self.pool.candidates(current_user.get())
+        body_position = body.tell() if hasattr(body, 'tell') else None
+        for attempt, account in enumerate(candidates):
+            start = time.perf_counter()
+            try:
+                response, content = account.http.request(uri, method, body, headers, *args, **kwargs)
+            except Exception:
+                account.record((time.perf_counter() - start) * 1000, error=True)
+                raise
+
+            account.record((time.perf_counter() - start) * 1000, error=response.status >= 400)
+
+            if is_throttled(response, content) and attempt + 1 < len(candidates):
+                # Fail over to the next account on the ring (Drive requests are replayable)
+                account.mark_throttled()
+                account.stats['failovers_out'] += 1
+                if body_position is not None:
+                    body.seek(body_position)
+                continue
+
+            if response.status < 400:
+                account.mark_healthy()
+            return response, content
+
+    def close(self):
+        for account in self.pool.accounts:
+            account.http.close()
+
+def load_extra_credentials(credentials_from_json, scopes: List[str]) -> List:
+    """Extra service accounts from GOOGLE_SERVICE_ACCOUNT_JSON_2.. or service-account-key-2.json.."""
+    from google.oauth2 import service_account
+
+    credentials = []
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    index = 2
+    while True:
+        raw_json = os.getenv(f'GOOGLE_SERVICE_ACCOUNT_JSON_{index}')
+        key_file = os.path.join(backend_dir, f'service-account-key-{index}.json')
+        if raw_json:
+            credentials.append(credentials_from_json(raw_json))
+        elif os.path.exists(key_file):
+            credentials.append(service_account.Credentials.from_service_account_file(key_file, scopes=scopes))
+        else:
+            break
+        index += 1
+    return credentials
+
+def account_name(credentials, fallback: str) -> str:
+    """Service account email, used as the stable ring identity"""
+    return getattr(credentials, 'service_account_email', None) or fallback
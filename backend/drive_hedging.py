@@ -0,0 +1,150 @@
+"""
+Learnnect Drive Hedging - Hedged Drive reads to cut tail latency
+An idempotent read that hasn't answered within the p90 latency of its kind of
+call gets a second identical request, and whichever answers first wins. A hedge
+budget caps the extra requests at a small fraction of reads, so a slow Drive
+never sees its load multiplied. Hedged reads run both attempts on worker threads,
+each with its own connection, so the winner returns while the loser finishes.
+"""
+
+import os
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Deque, Dict, Tuple
+
+from drive_http import describe_call
+from drive_recorder import current_recording
+
+DRIVE_HEDGE_ENABLED = os.getenv('DRIVE_HEDGE_ENABLED', 'false').lower() == 'true'
+
+# Extra requests allowed, as a fraction of reads (per worker, so the same fraction overall)
+DRIVE_HEDGE_BUDGET = float(os.getenv('DRIVE_HEDGE_BUDGET', 0.05))
+DRIVE_HEDGE_PERCENTILE = float(os.getenv('DRIVE_HEDGE_PERCENTILE', 0.9))
+DRIVE_HEDGE_WORKERS = int(os.getenv('DRIVE_HEDGE_WORKERS', 64))
+
+# No hedging for a kind of call until its p90 is known
+HEDGE_MIN_SAMPLES = 50
+HEDGE_MIN_DELAY = 0.05
+HEDGE_SAMPLES = 500
+# The delay is recomputed from the window every this many new samples, not per read
+HEDGE_RECOMPUTE_EVERY = 25
+
+# Unused budget carried over, in hedges (bounds a burst after a quiet spell)
+HEDGE_BURST = 10
+
+def is_hedgeable(method: str, uri: str) -> bool:
+    """Metadata reads only: not writes, uploads, batches or media downloads"""
+    return method == 'GET' and '/drive/v3/' in uri and '/upload/' not in uri and 'alt=media' not in uri
+
+class Hedger:
+    """Adaptive hedge delay per kind of read, a hedge budget, and win metrics"""
+
+    def __init__(self, enabled: bool = DRIVE_HEDGE_ENABLED, budget: float = DRIVE_HEDGE_BUDGET,
+                 percentile: float = DRIVE_HEDGE_PERCENTILE, workers: int = DRIVE_HEDGE_WORKERS):
+        self.enabled = enabled
+        self.budget = budget
+        self.percentile = percentile
+        self.workers = workers
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.delays: Dict[str, float] = {}
+        self._fresh: Dict[str, int] = {}
+        self.credit = 0.0
+        self._lock = threading.Lock()
+        self._executor = None
+        self.stats = {'reads': 0, 'hedged': 0, 'hedge_wins': 0, 'budget_denied': 0}
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='drive-hedge')
+            return self._executor
+
+    def delay_for(self, label: str):
+        """Seconds to wait before hedging, or None while too few samples are known"""
+        return self.delays.get(label)
+
+    def _observe(self, label: str, seconds: float):
+        with self._lock:
+            samples = self.latencies.setdefault(label, deque(maxlen=HEDGE_SAMPLES))
+            samples.append(seconds)
+            self._fresh[label] = self._fresh.get(label, 0) + 1
+            if len(samples) < HEDGE_MIN_SAMPLES or (label in self.delays and self._fresh[label] < HEDGE_RECOMPUTE_EVERY):
+                return
+            self._fresh[label] = 0
+            snapshot = list(samples)
+        # Sorted off the lock; a concurrent recompute from a slightly different window is harmless
+        ordered = sorted(snapshot)
+        self.delays[label] = max(ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)], HEDGE_MIN_DELAY)
+
+    def _spend(self) -> bool:
+        with self._lock:
+            if self.credit >= 1:
+                self.credit -= 1
+                self.stats['hedged'] += 1
+                return True
+            self.stats['budget_denied'] += 1
+            return False
+
+    def request(self, method: str, uri: str, send: Callable[[], Tuple]) -> Tuple:
+        """Run send(), hedging it if it's a read that runs past its delay"""
+        if not self.enabled or not is_hedgeable(method, uri):
+            return send()
+
+        label = describe_call(method, uri)
+        with self._lock:
+            self.stats['reads'] += 1
+            self.credit = min(self.credit + self.budget, HEDGE_BURST)
+
+        def attempt(hedge: bool):
+            # The hedge is extra load, not part of the request's recorded traffic
+            if hedge:
+                current_recording.set(None)
+            start = time.perf_counter()
+            result = send()
+            self._observe(label, time.perf_counter() - start)
+            return result
+
+        delay = self.delay_for(label)
+        if delay is None:
+            return attempt(False)
+
+        pool = self._pool()
+        primary = pool.submit(contextvars.copy_context().run, attempt, False)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._spend():
+            return primary.result()
+
+        hedge = pool.submit(contextvars.copy_context().run, attempt, True)
+        done, pending = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        winner = next(iter(done))
+        if winner.exception() is not None and pending:
+            # The first to answer failed; the other one may still succeed
+            winner = next(iter(pending))
+        if winner is hedge:
+            with self._lock:
+                self.stats['hedge_wins'] += 1
+        return winner.result()
+
+    def metrics(self) -> Dict:
+        reads = self.stats['reads']
+        hedged = self.stats['hedged']
+        delays = {}
+        for label in list(self.latencies):
+            delay = self.delay_for(label)
+            delays[label] = round(delay * 1000, 1) if delay is not None else None
+        return {
+            'enabled': self.enabled,
+            'reads': reads,
+            'hedged': hedged,
+            'hedgeWins': self.stats['hedge_wins'],
+            'budgetDenied': self.stats['budget_denied'],
+            'hedgeRate': round(hedged / reads, 4) if reads else 0,
+            'winRate': round(self.stats['hedge_wins'] / hedged, 4) if hedged else 0,
+            'budget': self.budget,
+            'hedgeDelayMs': delays
+        }
+
+hedger = Hedger()
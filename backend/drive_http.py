@@ -0,0 +1,127 @@
+"""
+Learnnect Drive HTTP - Instrumented transport for Google Drive API calls
+Every Drive and OAuth token request made by the storage service goes through
+InstrumentedHttp, so cross-cutting concerns (profiling spans, timing, request
+deadlines, recording) have a single place to hook in
+"""
+
+import os
+import time
+import socket
+from urllib.parse import urlparse
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+
+from request_profiler import drive_span
+from request_deadline import current_deadline
+from drive_recorder import current_recording
+
+DRIVE_HTTP_TIMEOUT = int(os.getenv('DRIVE_HTTP_TIMEOUT', 60))
+
+def describe_call(method: str, uri: str) -> str:
+    """Short, ID-free label for a Drive/OAuth request, e.g. 'GET files/{id}'"""
+    parsed = urlparse(uri)
+    if parsed.netloc == 'oauth2.googleapis.com':
+        return 'token refresh'
+
+    path = parsed.path
+    for prefix in ('/upload/drive/v3/', '/drive/v3/', '/batch/drive/v3'):
+        if path.startswith(prefix):
+            kind = 'upload ' if prefix.startswith('/upload') else ('batch' if prefix.startswith('/batch') else '')
+            path = path[len(prefix):]
+            break
+    else:
+        kind = ''
+
+    # files/<id>/permissions -> files/{id}/permissions
+    parts = path.strip('/').split('/')
+    parts = [part if index % 2 == 0 else '{id}' for index, part in enumerate(parts) if part]
+    return f"{method} {kind}{'/'.join(parts)}".strip()
+
+class InstrumentedHttp(httplib2.Http):
+    """httplib2 transport that records a span for every request.
+
+    Inside a request with a deadline, each call is checked against it, socket
+    timeouts are capped to the time left, and cancelling the deadline aborts
+    the connection (so a transfer stops mid-body). Not thread-safe: use one
+    instance per thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Drive answers resumable upload chunks with 308, which is not a redirect
+        # (same adjustment googleapiclient.http.build_http makes)
+        self.redirect_codes = self.redirect_codes - {308}
+        self.default_timeout = self.timeout
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        deadline = current_deadline.get()
+        if deadline is None:
+            return self._send(uri, method, body, headers, *args, **kwargs)
+
+        deadline.check()
+        self._set_timeout(max(min(self.default_timeout or DRIVE_HTTP_TIMEOUT, deadline.remaining()), 0.1))
+        try:
+            with deadline.on_cancel(self.abort):
+                try:
+                    return self._send(uri, method, body, headers, *args, **kwargs)
+                except Exception:
+                    # Report the cancellation rather than the broken socket it caused
+                    deadline.check()
+                    raise
+        finally:
+            self._set_timeout(self.default_timeout)
+
+    def _send(self, uri, method, body, headers, *args, **kwargs):
+        """One request, as a profiling span (and a cassette entry when recording)"""
+        label = describe_call(method, uri)
+        start = time.perf_counter()
+        with drive_span(label):
+            response, content = super().request(uri, method, body, headers, *args, **kwargs)
+        recording = current_recording.get()
+        if recording is not None:
+            recording.add_call(label, method, uri, response, content, time.perf_counter() - start)
+        return response, content
+
+    def _conn_request(self, conn, request_uri, method, body, headers):
+        deadline = current_deadline.get()
+        if deadline is None:
+            return super()._conn_request(conn, request_uri, method, body, headers)
+
+        # httplib2 reconnects and resends after some socket errors; never after a cancel
+        connect = conn.connect
+
+        def checked_connect():
+            deadline.check()
+            connect()
+
+        conn.connect = checked_connect
+        try:
+            return super()._conn_request(conn, request_uri, method, body, headers)
+        finally:
+            del conn.connect
+
+    def _set_timeout(self, timeout):
+        """Timeout for new connections and the sockets already open"""
+        self.timeout = timeout
+        for conn in list(self.connections.values()):
+            if getattr(conn, 'sock', None) is not None:
+                conn.sock.settimeout(timeout)
+
+    def abort(self):
+        """Break open connections so a blocked send/recv fails immediately"""
+        for conn in list(self.connections.values()):
+            sock = getattr(conn, 'sock', None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+def build_drive_service(credentials=None, http=None):
+    """Build a Drive v3 client on top of the instrumented transport (or a given one)"""
+    if http is None:
+        http = AuthorizedHttp(credentials, http=InstrumentedHttp(timeout=DRIVE_HTTP_TIMEOUT))
+    return build('drive', 'v3', http=http, cache_discovery=False)
@@ -0,0 +1,152 @@
+"""
+Learnnect Drive Recorder - Capture Drive traffic per API request (staging only)
+With DRIVE_RECORD_DIR set, every API request is written to a gzipped JSON Lines
+cassette together with the Drive calls it made: method, path, response status,
+headers, body and latency of each one. drive_replay.py replays a cassette
+against the API to catch changes that add Drive calls or latency.
+
+Cassettes contain request bodies (uploaded files included) and Drive responses,
+so only record in staging, with test accounts.
+"""
+
+import os
+import json
+import gzip
+import time
+import base64
+import threading
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+# Unset = recording off
+DRIVE_RECORD_DIR = os.getenv('DRIVE_RECORD_DIR')
+
+# Request bodies above this are recorded without the body (not replayable)
+DRIVE_RECORD_MAX_BODY = int(os.getenv('DRIVE_RECORD_MAX_BODY', 16 * 1024 * 1024))
+
+# Request headers kept in the cassette (never credentials)
+RECORDED_REQUEST_HEADERS = ('content-type', 'if-none-match', 'idempotency-key')
+RECORDED_RESPONSE_HEADERS = ('content-type', 'location', 'etag')
+
+def encode_body(data) -> Optional[object]:
+    """Text as a plain string, anything else as {'b64': ...}"""
+    if data is None:
+        return None
+    if isinstance(data, str):
+        return data
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return {'b64': base64.b64encode(data).decode('ascii')}
+
+def decode_body(value) -> bytes:
+    if value is None:
+        return b''
+    if isinstance(value, dict):
+        return base64.b64decode(value['b64'])
+    return value.encode('utf-8')
+
+class Recording:
+    """Drive calls made while serving one API request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.calls: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add_call(self, label: str, method: str, uri: str, response, content, elapsed: float):
+        # Token minting belongs to the token refresher, not to the request
+        if label == 'token refresh':
+            return
+        parsed = urlparse(uri)
+        call = {
+            'label': label,
+            'method': method,
+            'path': parsed.path,
+            'query': parsed.query,
+            'status': response.status,
+            'headers': {name: response[name] for name in RECORDED_RESPONSE_HEADERS if name in response},
+            'body': encode_body(content),
+            'ms': round(elapsed * 1000, 1),
+            'at': round((time.perf_counter() - self.start - elapsed) * 1000, 1)
+        }
+        with self._lock:
+            self.calls.append(call)
+
+current_recording: ContextVar[Optional[Recording]] = ContextVar('current_recording', default=None)
+
+class CassetteWriter:
+    """Appends one gzip member per request, so a crash never corrupts earlier entries"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(
+            directory, f"drive-{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}-{os.getpid()}.jsonl.gz"
+        )
+        self._lock = threading.Lock()
+
+    def write(self, entry: Dict):
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with gzip.open(self.path, 'at', encoding='utf-8') as cassette:
+                cassette.write(line)
+
+class RecordingMiddleware:
+    """Record each API request and the Drive calls made for it"""
+
+    def __init__(self, app, directory: Optional[str] = DRIVE_RECORD_DIR):
+        self.app = app
+        self.writer = CassetteWriter(directory) if directory else None
+
+    async def __call__(self, scope, receive, send):
+        if self.writer is None or scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        body: List[bytes] = []
+        body_size = 0
+        status = {'code': None}
+
+        async def recording_receive():
+            nonlocal body_size
+            message = await receive()
+            if message['type'] == 'http.request':
+                chunk = message.get('body', b'')
+                body_size += len(chunk)
+                if body_size <= DRIVE_RECORD_MAX_BODY:
+                    body.append(chunk)
+            return message
+
+        async def recording_send(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        recording = Recording()
+        token = current_recording.set(recording)
+        try:
+            await self.app(scope, recording_receive, recording_send)
+        finally:
+            current_recording.reset(token)
+            headers = {}
+            for key, value in scope.get('headers', []):
+                name = key.decode('latin-1')
+                if name in RECORDED_REQUEST_HEADERS:
+                    headers[name] = value.decode('latin-1')
+            try:
+                self.writer.write({
+                    'method': scope['method'],
+                    'path': scope['path'],
+                    'query': scope.get('query_string', b'').decode('latin-1'),
+                    'headers': headers,
+                    'body': encode_body(b''.join(body)) if body_size <= DRIVE_RECORD_MAX_BODY else None,
+                    'bodySize': body_size,
+                    'status': status['code'],
+                    'ms': round((time.perf_counter() - recording.start) * 1000, 1),
+                    'calls': recording.calls
+                })
+            except Exception as e:
+                print(f"⚠️ Failed to record request: {e}")
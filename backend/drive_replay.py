@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Learnnect Drive Replay - Replay recorded Drive traffic as a performance regression check
+Runs every API request in one or more cassettes (see drive_recorder.py) against
+the API in-process. Drive calls are answered from the recording instead of the
+network, after sleeping the recorded latency times --latency-scale. The run
+fails when a request makes more Drive calls than it did when recorded, or a
+route's p95 latency goes over budget, so CI catches e.g. one extra files().list
+per upload.
+
+Replay starts from empty shared state, like a freshly started staging server,
+so record a cassette right after a restart. Direct-to-Drive upload sessions
+don't go through the Drive client and are skipped.
+
+Usage:
+    python drive_replay.py cassettes/drive-20250101_120000-4242.jsonl.gz
+    python drive_replay.py cassettes/*.jsonl.gz --latency-scale 0 --budget replay_budget.json
+"""
+
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import argparse
+import tempfile
+import threading
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse
+
+import httplib2
+
+# Not replayable: these talk to Drive through a plain requests session
+REPLAY_SKIPPED_PATHS = {'/api/storage/upload-session'}
+
+# In-process replay skips network and server overhead that staging paid for
+LATENCY_SLACK_MS = 50
+
+REPLAY_ADMIN_KEY = 'drive-replay'
+
+BATCH_CONTENT_ID = re.compile(rb'Content-ID: <(?:response-)?([^+>]+)\+\d+>')
+
+def load_cassettes(paths: List[str]) -> List[Dict]:
+    """Recorded API requests, in recording order"""
+    entries = []
+    for path in paths:
+        with gzip.open(path, 'rt', encoding='utf-8') as cassette:
+            entries.extend(json.loads(line) for line in cassette if line.strip())
+    return entries
+
+def busy_ms(calls: List[Dict]) -> float:
+    """Time at least one Drive call was in flight (parallel calls overlap)"""
+    total = 0.0
+    end = None
+    for call in sorted(calls, key=lambda call: call['at']):
+        start, stop = call['at'], call['at'] + call['ms']
+        if end is None or start > end:
+            total += call['ms']
+            end = stop
+        elif stop > end:
+            total += stop - end
+            end = stop
+    return total
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+class ReplayHttp:
+    """httplib2-compatible transport that answers Drive calls from a cassette.
+
+    Each call is matched to an unused recorded call of the current request
+    with the same method, path and query (IDs line up because they come from
+    recorded responses). Anything else is counted as unrecorded and answered
+    with the last recorded response for the same kind of call, or a 404.
+    """
+
+    def __init__(self, entries: List[Dict], latency_scale: float = 1.0):
+        from drive_http import describe_call
+        from drive_recorder import decode_body
+        self.describe_call = describe_call
+        self.decode_body = decode_body
+        self.latency_scale = latency_scale
+        self.fallback: Dict[str, Dict] = {}
+        for entry in entries:
+            for call in entry['calls']:
+                self.fallback[call['label']] = call
+        self.pending: List[Dict] = []
+        self.made: List[str] = []
+        self.unrecorded: List[str] = []
+        self._lock = threading.Lock()
+
+    def begin(self, entry: Dict):
+        """Expect the Drive calls recorded for this API request"""
+        with self._lock:
+            self.pending = list(entry['calls'])
+            self.made = []
+            self.unrecorded = []
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        label = self.describe_call(method, uri)
+        parsed = urlparse(uri)
+        with self._lock:
+            self.made.append(label)
+            call = next((
+                call for call in self.pending
+                if (call['method'], call['path'], call['query']) == (method, parsed.path, parsed.query)
+            ), None)
+            if call is not None:
+                self.pending.remove(call)
+            else:
+                self.unrecorded.append(label)
+                call = self.fallback.get(label)
+
+        if call is None:
+            error = json.dumps({'error': {'code': 404, 'message': f'No recorded response for {label}'}})
+            return httplib2.Response({'status': '404', 'content-type': 'application/json'}), error.encode()
+
+        if self.latency_scale:
+            time.sleep(call['ms'] * self.latency_scale / 1000)
+
+        content = self.decode_body(call['body'])
+        if label.endswith('batch'):
+            content = self._match_batch_ids(body, content)
+        return httplib2.Response(dict(call['headers'], status=str(call['status']))), content
+
+    def _match_batch_ids(self, body, content: bytes) -> bytes:
+        """Batch parts are matched by Content-ID, which embeds a random per-batch ID"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        sent = BATCH_CONTENT_ID.search(body or b'')
+        recorded = BATCH_CONTENT_ID.search(content)
+        if not sent or not recorded:
+            return content
+        return content.replace(recorded.group(1), sent.group(1))
+
+def replay(entries: List[Dict], latency_scale: float) -> List[Dict]:
+    """Run each recorded request against the API; returns one result per request"""
+    # Fresh state, no background workers, rate limits or auth, and never record the replay itself
+    os.environ['LEARNNECT_STATE_DB'] = os.path.join(tempfile.mkdtemp(prefix='drive-replay-'), 'state.db')
+    os.environ['DRIVE_SYNC_ENABLED'] = 'false'
+    os.environ['RATE_LIMIT_ENABLED'] = 'false'
+    os.environ['RESUME_THUMBNAILS_ENABLED'] = 'false'  # Thumbnail calls run in the background, off the recorded path
+    os.environ['AUTH_REQUIRED'] = 'false'  # Cassettes never hold credentials
+    os.environ.pop('AUTH_KEYS_FILE', None)
+    os.environ['ADMIN_API_KEY'] = REPLAY_ADMIN_KEY
+    os.environ.pop('DRIVE_RECORD_DIR', None)
+
+    # Imported only now: the recorder and rate limiter read their settings at import time
+    from fastapi.testclient import TestClient
+    import learnnect_storage_api
+    from drive_http import build_drive_service
+    from drive_recorder import decode_body
+
+    http = ReplayHttp(entries, latency_scale)
+    learnnect_storage_api.storage_service.service = build_drive_service(http=http)
+    # Not used as a context manager, so startup hooks (real credentials, workers) never run
+    client = TestClient(learnnect_storage_api.app, raise_server_exceptions=False)
+
+    results = []
+    for entry in entries:
+        route = f"{entry['method']} {entry['path']}"
+        if entry['path'] in REPLAY_SKIPPED_PATHS or entry['body'] is None:
+            results.append({'route': route, 'skipped': True})
+            continue
+
+        http.begin(entry)
+        url = entry['path'] + (f"?{entry['query']}" if entry['query'] else '')
+        start = time.perf_counter()
+        response = client.request(
+            entry['method'], url,
+            content=decode_body(entry['body']),
+            headers=dict(entry['headers'], **{'x-admin-key': REPLAY_ADMIN_KEY})
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        drive_ms = busy_ms(entry['calls'])
+        results.append({
+            'route': route,
+            'skipped': False,
+            'status': response.status_code,
+            'recordedStatus': entry['status'],
+            'calls': len(http.made),
+            'recordedCalls': len(entry['calls']),
+            'unrecorded': list(http.unrecorded),
+            'ms': elapsed_ms,
+            # What the recorded request should take with Drive latency scaled
+            'expectedMs': max(entry['ms'] - drive_ms, 0) + drive_ms * latency_scale
+        })
+    return results
+
+def check_budgets(results: List[Dict], budget: Dict, extra_calls: int, latency_tolerance: float) -> Tuple[Dict, List[str]]:
+    """Per-route summary and the list of budget violations"""
+    routes: Dict[str, Dict] = {}
+    violations = []
+    for result in results:
+        summary = routes.setdefault(result['route'], {
+            'requests': 0, 'skipped': 0, 'calls': [], 'recordedCalls': [], 'ms': [], 'expectedMs': []
+        })
+        summary['requests'] += 1
+        if result['skipped']:
+            summary['skipped'] += 1
+            continue
+        summary['calls'].append(result['calls'])
+        summary['recordedCalls'].append(result['recordedCalls'])
+        summary['ms'].append(result['ms'])
+        summary['expectedMs'].append(result['expectedMs'])
+
+        if result['status'] != result['recordedStatus']:
+            violations.append(f"{result['route']}: status {result['status']} (recorded {result['recordedStatus']})")
+        if result['calls'] > result['recordedCalls'] + extra_calls:
+            violations.append(
+                f"{result['route']}: {result['calls']} Drive calls (recorded {result['recordedCalls']}); "
+                f"unrecorded: {', '.join(result['unrecorded']) or 'none'}"
+            )
+
+    for route, summary in routes.items():
+        if not summary['ms']:
+            continue
+        limits = budget.get(route, {})
+        max_calls = limits.get('maxCalls')
+        if max_calls is not None and max(summary['calls']) > max_calls:
+            violations.append(f"{route}: {max(summary['calls'])} Drive calls per request (budget {max_calls})")
+
+        p95 = percentile(summary['ms'], 0.95)
+        p95_budget = limits.get('p95Ms', percentile(summary['expectedMs'], 0.95) * latency_tolerance + LATENCY_SLACK_MS)
+        summary['p95Ms'] = p95
+        summary['p95BudgetMs'] = p95_budget
+        if p95 > p95_budget:
+            violations.append(f"{route}: p95 {p95:.0f}ms (budget {p95_budget:.0f}ms)")
+    return routes, violations
+
+def main():
+    """Parse arguments, replay the cassettes and check the budgets"""
+    parser = argparse.ArgumentParser(description="Replay recorded Drive traffic and enforce per-route budgets")
+    parser.add_argument('cassettes', nargs='+', help="Cassette files written with DRIVE_RECORD_DIR")
+    parser.add_argument('--latency-scale', type=float, default=1.0, help="Multiply recorded Drive latencies (0 = no waiting)")
+    parser.add_argument('--extra-calls', type=int, default=0, help="Drive calls a request may make beyond the recording")
+    parser.add_argument('--latency-tolerance', type=float, default=1.25, help="Allowed p95 growth over the recording")
+    parser.add_argument('--budget', help='JSON file of {"METHOD /path": {"maxCalls": n, "p95Ms": ms}}')
+    args = parser.parse_args()
+
+    print("📼 Learnnect Drive Replay")
+    print("=" * 50)
+
+    entries = load_cassettes(args.cassettes)
+    budget = {}
+    if args.budget:
+        with open(args.budget) as f:
+            budget = json.load(f)
+    print(f"📂 {len(entries)} recorded requests, latency x{args.latency_scale}")
+
+    results = replay(entries, args.latency_scale)
+    routes, violations = check_budgets(results, budget, args.extra_calls, args.latency_tolerance)
+
+    print()
+    print("📊 Replay Summary")
+    print("=" * 50)
+    for route, summary in sorted(routes.items()):
+        if not summary['ms']:
+            print(f"   ⏭️  {route}: {summary['skipped']} skipped")
+            continue
+        calls = sum(summary['calls']) / len(summary['calls'])
+        recorded = sum(summary['recordedCalls']) / len(summary['recordedCalls'])
+        print(
+            f"   {route}: {len(summary['ms'])} requests, {calls:.1f} Drive calls/request "
+            f"(recorded {recorded:.1f}), p95 {summary['p95Ms']:.0f}ms (budget {summary['p95BudgetMs']:.0f}ms)"
+        )
+
+    print()
+    if violations:
+        print(f"❌ {len(violations)} budget violations:")
+        for violation in violations:
+            print(f"   - {violation}")
+        return 1
+    print("✅ All requests within budget")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
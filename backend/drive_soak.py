@@ -0,0 +1,929 @@
+#!/usr/bin/env python3
+"""
+Learnnect Drive Soak - Hours of realistic traffic to catch slow memory and resource leaks
+Runs a weighted mix of uploads, listings and deletes for a fixed pool of users
+against the API in-process, with its real startup, middleware, background
+workers and pooled httplib2 transports. Drive is a local stand-in server in a
+separate process, so its own memory never shows up in the numbers.
+
+After a warm-up (caches filled, connections open) a baseline is taken, then
+every --sample-interval the soak records traced Python memory, RSS, open file
+descriptors, threads and live objects by type. Each request's change in traced
+memory peak (full-body copies show up there) and the log output it printed are
+charged to its endpoint. Retention can't be charged per request under mixed
+traffic (work finishing late lands on whichever request runs next), so each
+sample also probes every endpoint with a short burst of its own requests
+between two settled, collected heap readings. The report flags endpoints that
+retain memory through both halves of the run, process-wide growth and failing
+endpoints, and lists the allocation sites and object types that grew most.
+Exits 1 when anything is flagged.
+
+--smoke is a CI-sized run (a couple of hundred requests, about a minute): it
+catches endpoints that fail or crash under the soak's traffic, skips the
+retention probes and takes only the first and last samples, too few for growth
+to be judged.
+
+Usage:
+    python drive_soak.py --duration 4h
+    python drive_soak.py --duration 20m --write-behind --report soak_report.json
+    python drive_soak.py --smoke
+"""
+
+import io
+import os
+import re
+import gc
+import sys
+import json
+import time
+import random
+import secrets
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import multiprocessing
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# Relative weights of each endpoint in the traffic mix
+TRAFFIC_MIX = {
+    'upload-resume': 8,
+    'upload-image': 8,
+    'user-resumes': 25,
+    'profile-bundle': 15,
+    'check-existing-image': 15,
+    'check-user-folder': 8,
+    'usage': 8,
+    'delete-resume': 8,
+    'delete-image': 5
+}
+
+# Users keep a bounded number of files, so a leak-free run has a flat working set
+MAX_RESUMES_PER_USER = 3
+RESUME_SIZE_RANGE = (40 * 1024, 400 * 1024)
+IMAGE_SIZE_RANGE = (20 * 1024, 300 * 1024)
+
+GOOGLE_API_HOSTS = ('https://www.googleapis.com', 'https://oauth2.googleapis.com')
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# Growth allowed before the report flags it
+LEAK_BYTES_PER_REQUEST = 256
+HEAP_GROWTH_MB = 32
+RSS_GROWTH_MB = 64
+FD_GROWTH = 8
+THREAD_GROWTH = 4
+ERROR_RATE = 0.01
+
+# --smoke settings: enough requests to reach every endpoint, no probes or samples in between
+SMOKE_REQUESTS = 200
+SMOKE_WARMUP = 40
+SMOKE_PROBE_REQUESTS = 0
+SMOKE_DURATION = 120
+SMOKE_DRIVE_LATENCY_MS = 2
+
+# Retention probes: requests per endpoint, and the pause that lets background work finish
+PROBE_REQUESTS = 10
+PROBE_SETTLE = 0.5
+
+REPORT_TOP = 15
+
+# The synthetic traffic calls routes that need credentials, as a backend service would
+SOAK_API_KEY = 'drive-soak'
+
+# ----------------------------------------------------------------------
+# Drive stand-in (runs in its own process)
+# ----------------------------------------------------------------------
+
+QUERY_KEYWORD = re.compile(r'(and|or)\s')
+QUERY_TERMS: List[Tuple['re.Pattern', Callable]] = [
+    (re.compile(r"appProperties has \{ key='([^']*)' and value='([^']*)' \}"),
+     lambda m: lambda f: (f.get('appProperties') or {}).get(m[1]) == m[2]),
+    (re.compile(r"'([^']*)' in parents|parents in '([^']*)'"),
+     lambda m: lambda f: (m[1] or m[2]) in f.get('parents', [])),
+    # Drive's `contains` on names is a prefix match
+    (re.compile(r"(name|mimeType) ?(!=|=|contains) ?'([^']*)'"),
+     lambda m: {
+         '=': lambda f: f.get(m[1]) == m[3],
+         '!=': lambda f: f.get(m[1]) != m[3],
+         'contains': lambda f: f.get(m[1], '').startswith(m[3])
+     }[m[2]]),
+    (re.compile(r"trashed ?= ?(true|false)"),
+     lambda m: lambda f: f.get('trashed', False) == (m[1] == 'true'))
+]
+
+def parse_query(query: str) -> Callable[[Dict], bool]:
+    """Predicate for the subset of Drive's query language the API uses"""
+    tokens = []
+    position = 0
+    while position < len(query):
+        if query[position].isspace():
+            position += 1
+            continue
+        if query[position] in '()':
+            tokens.append(query[position])
+            position += 1
+            continue
+        keyword = QUERY_KEYWORD.match(query, position)
+        if keyword:
+            tokens.append(keyword[1])
+            position = keyword.end()
+            continue
+        for pattern, build in QUERY_TERMS:
+            match = pattern.match(query, position)
+            if match:
+                tokens.append(build(match))
+                position = match.end()
+                break
+        else:
+            raise ValueError(f"Unsupported query near: {query[position:position + 40]}")
+
+    def parse_or(index: int) -> Tuple[Callable, int]:
+        left, index = parse_and(index)
+        while index < len(tokens) and tokens[index] == 'or':
+            right, index = parse_and(index + 1)
+            left = (lambda a, b: lambda f: a(f) or b(f))(left, right)
+        return left, index
+
+    def parse_and(index: int) -> Tuple[Callable, int]:
+        left, index = parse_term(index)
+        while index < len(tokens) and tokens[index] == 'and':
+            right, index = parse_term(index + 1)
+            left = (lambda a, b: lambda f: a(f) and b(f))(left, right)
+        return left, index
+
+    def parse_term(index: int) -> Tuple[Callable, int]:
+        if index >= len(tokens):
+            raise ValueError("Query ends early")
+        if tokens[index] == '(':
+            inner, index = parse_or(index + 1)
+            if index >= len(tokens) or tokens[index] != ')':
+                raise ValueError("Unbalanced parentheses in query")
+            return inner, index + 1
+        if not callable(tokens[index]):
+            raise ValueError(f"Unexpected '{tokens[index]}' in query")
+        return tokens[index], index + 1
+
+    predicate, end = parse_or(0)
+    if end != len(tokens):
+        raise ValueError("Trailing tokens in query")
+    return predicate
+
+def split_head(data: bytes) -> Tuple[bytes, bytes]:
+    """Split headers from body at the first blank line (CRLF or LF)"""
+    ends = [(data.find(separator), separator) for separator in (b'\r\n\r\n', b'\n\n') if separator in data]
+    if not ends:
+        return data, b''
+    index, separator = min(ends)
+    return data[:index], data[index + len(separator):]
+
+def parse_headers(lines: List[str]) -> Dict[str, str]:
+    headers = {}
+    name = None
+    for line in lines:
+        if line[:1] in (' ', '\t') and name:
+            # Folded continuation of the previous header (long batch Content-IDs)
+            headers[name] = f"{headers[name]} {line.strip()}".strip()
+            continue
+        name, _, value = line.partition(':')
+        name = name.strip().lower()
+        headers[name] = value.strip()
+    return headers
+
+def split_multipart(body: bytes, content_type: str) -> List[Tuple[Dict[str, str], bytes]]:
+    """(headers, payload) of each part of a multipart body"""
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type).group(1).encode()
+    parts = []
+    for chunk in body.split(b'--' + boundary)[1:]:
+        if chunk.startswith(b'--'):
+            break
+        chunk = chunk[2:] if chunk.startswith(b'\r\n') else chunk[1:] if chunk.startswith(b'\n') else chunk
+        head, payload = split_head(chunk)
+        payload = payload[:-2] if payload.endswith(b'\r\n') else payload[:-1] if payload.endswith(b'\n') else payload
+        parts.append((parse_headers(head.decode('latin-1').splitlines()), payload))
+    return parts
+
+class DriveStandIn:
+    """In-memory Drive v3: the files, uploads, permissions and batch calls the API makes"""
+
+    def __init__(self, root_folder_id: str):
+        self.files: Dict[str, Dict] = {}
+        self.media: Dict[str, bytes] = {}
+        self.uploads: Dict[str, Dict] = {}
+        self.lock = threading.RLock()
+        self.sequence = 0
+        self.epoch = time.time()
+        self._create({'id': root_folder_id, 'name': 'Learnnect', 'mimeType': FOLDER_MIME_TYPE, 'parents': []})
+
+    def handle(self, method: str, path: str, query: str, headers: Dict[str, str], body: bytes,
+               base_url: str) -> Tuple[int, Dict[str, str], bytes]:
+        """Answer one request: (status, headers, body)"""
+        params = {key: values[0] for key, values in parse_qs(query).items()}
+        with self.lock:
+            try:
+                return self._route(method, path, params, headers, body, base_url)
+            except ValueError as e:
+                return self._error(400, str(e), 'invalid')
+
+    def _route(self, method, path, params, headers, body, base_url):
+        if path.startswith('/batch/'):
+            return self._batch(headers, body, base_url)
+        if path.startswith('/upload/drive/v3/files'):
+            return self._upload(method, params, headers, body, base_url)
+        if path == '/drive/v3/about':
+            used = sum(len(content) for content in self.media.values())
+            return self._json({'user': {'emailAddress': 'soak@learnnect.test'},
+                               'storageQuota': {'limit': str(15 * 1024 ** 3), 'usage': str(used)}})
+        if path == '/drive/v3/files/generateIds':
+            count = int(params.get('count', 10))
+            return self._json({'kind': 'drive#generatedIds', 'space': 'drive', 'ids': [self._new_id() for _ in range(count)]})
+        if path == '/drive/v3/files':
+            if method == 'POST':
+                return self._json(self._create(json.loads(body or b'{}')))
+            return self._list(params)
+
+        match = re.fullmatch(r'/drive/v3/files/([^/]+)(/permissions)?', path)
+        if not match:
+            return self._error(404, f"No route for {method} {path}", 'notFound')
+        file = self.files.get(match[1])
+        if file is None:
+            return self._error(404, f"File not found: {match[1]}", 'notFound')
+        if match[2]:
+            return self._json({'kind': 'drive#permission', 'id': 'anyoneWithLink', 'type': 'anyone', 'role': 'reader'})
+        if method == 'DELETE':
+            del self.files[file['id']]
+            self.media.pop(file['id'], None)
+            return 204, {}, b''
+        if method == 'PATCH':
+            return self._json(self._update(file, json.loads(body or b'{}'), params))
+        if params.get('alt') == 'media':
+            return 200, {'Content-Type': file['mimeType']}, self.media.get(file['id'], b'')
+        return self._json(file)
+
+    def _new_id(self) -> str:
+        return secrets.token_urlsafe(24)
+
+    def _timestamp(self) -> str:
+        # Strictly increasing, so createdTime ordering is stable
+        self.sequence += 1
+        moment = datetime.fromtimestamp(self.epoch + self.sequence / 1000, timezone.utc)
+        return moment.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+    def _create(self, metadata: Dict, content: Optional[bytes] = None, mime_type: Optional[str] = None) -> Dict:
+        now = self._timestamp()
+        file = dict(metadata)
+        file.setdefault('id', self._new_id())
+        file['mimeType'] = metadata.get('mimeType') or mime_type or 'application/octet-stream'
+        file.setdefault('parents', ['root'])
+        file.update(createdTime=now, modifiedTime=now, trashed=False,
+                    webViewLink=f"https://drive.google.com/file/d/{file['id']}/view")
+        if content is not None:
+            file['size'] = str(len(content))
+            self.media[file['id']] = content
+        self.files[file['id']] = file
+        return file
+
+    def _update(self, file: Dict, changes: Dict, params: Dict) -> Dict:
+        for key, value in changes.items():
+            if key == 'appProperties':
+                # Drive merges appProperties; null removes a key
+                properties = dict(file.get('appProperties') or {}, **value)
+                file['appProperties'] = {name: item for name, item in properties.items() if item is not None}
+            else:
+                file[key] = value
+        removed = set(filter(None, params.get('removeParents', '').split(',')))
+        added = [parent for parent in params.get('addParents', '').split(',') if parent]
+        file['parents'] = [parent for parent in file['parents'] if parent not in removed] + added
+        file['modifiedTime'] = self._timestamp()
+        return file
+
+    def _list(self, params: Dict):
+        predicate = parse_query(params['q']) if params.get('q') else (lambda f: True)
+        files = [file for file in self.files.values() if predicate(file)]
+        if params.get('orderBy', '').startswith('createdTime'):
+            files.sort(key=lambda f: f['createdTime'], reverse=params['orderBy'].endswith('desc'))
+        offset = int(params.get('pageToken') or 0)
+        size = int(params.get('pageSize', 100))
+        result = {'files': files[offset:offset + size]}
+        if offset + size < len(files):
+            result['nextPageToken'] = str(offset + size)
+        return self._json(result)
+
+    def _upload(self, method, params, headers, body, base_url):
+        if method == 'POST' and params.get('uploadType') == 'resumable':
+            upload_id = self._new_id()
+            self.uploads[upload_id] = {
+                'metadata': json.loads(body or b'{}'),
+                'mimeType': headers.get('x-upload-content-type'),
+                'data': bytearray()
+            }
+            location = f"{base_url}/upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}"
+            return 200, {'Location': location}, b''
+
+        if method == 'POST' and params.get('uploadType') == 'multipart':
+            (_, metadata), (media_headers, content) = split_multipart(body, headers['content-type'])[:2]
+            return self._json(self._create(json.loads(metadata), content, media_headers.get('content-type')))
+
+        if method == 'POST':
+            return self._json(self._create({}, body, headers.get('content-type')))
+
+        upload = self.uploads.get(params.get('upload_id', ''))
+        if upload is None:
+            return self._error(404, "Upload session not found", 'notFound')
+        content_range = headers.get('content-range', '')
+        total = None
+        if content_range:
+            match = re.fullmatch(r'bytes (?:\d+-\d+|\*)/(\d+|\*)', content_range)
+            if not match:
+                return self._error(400, f"Bad Content-Range: {content_range}", 'badContent')
+            total = None if match[1] == '*' else int(match[1])
+        upload['data'].extend(body)
+        if content_range and (total is None or len(upload['data']) < total):
+            return 308, ({'Range': f"bytes=0-{len(upload['data']) - 1}"} if upload['data'] else {}), b''
+
+        del self.uploads[params['upload_id']]
+        return self._json(self._create(upload['metadata'], bytes(upload['data']), upload['mimeType']))
+
+    def _batch(self, headers, body, base_url):
+        boundary = f"batch_{secrets.token_hex(8)}"
+        parts = []
+        for part_headers, payload in split_multipart(body, headers['content-type']):
+            head, inner_body = split_head(payload)
+            request_line, *header_lines = head.decode('latin-1').splitlines()
+            method, target, _ = request_line.split(' ', 2)
+            target = urlparse(target)
+            status, response_headers, content = self.handle(
+                method, target.path, target.query, parse_headers(header_lines), inner_body, base_url
+            )
+            content_id = part_headers.get('content-id', '').strip('<>')
+            response_head = ''.join(f"{name}: {value}\r\n" for name, value in response_headers.items())
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n{response_head}\r\n".encode() + content + b"\r\n"
+            )
+        return 200, {'Content-Type': f"multipart/mixed; boundary={boundary}"}, b''.join(parts) + f"--{boundary}--".encode()
+
+    def _json(self, value: Dict, status: int = 200):
+        return status, {'Content-Type': 'application/json; charset=UTF-8'}, json.dumps(value).encode()
+
+    def _error(self, code: int, message: str, reason: str):
+        return self._json({'error': {'code': code, 'message': message,
+                                     'errors': [{'domain': 'global', 'reason': reason, 'message': message}]}}, code)
+
+class DriveStandInHandler(BaseHTTPRequestHandler):
+    """Keep-alive HTTP front for the stand-in, with simulated Drive latency"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _dispatch(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.server.latency:
+            time.sleep(self.server.latency * random.uniform(0.5, 1.5))
+
+        parsed = urlparse(self.path)
+        headers = {name.lower(): value for name, value in self.headers.items()}
+        status, response_headers, content = self.server.drive.handle(
+            self.command, parsed.path, parsed.query, headers, body, f"http://{self.headers.get('Host')}"
+        )
+        self.send_response(status)
+        for name, value in response_headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_drive(port_queue, root_folder_id: str, latency_ms: float):
+    """Stand-in process entry point: serve on a free local port and report it"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DriveStandInHandler)
+    server.daemon_threads = True
+    server.drive = DriveStandIn(root_folder_id)
+    server.latency = latency_ms / 1000
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+def start_drive_stand_in(root_folder_id: str, latency_ms: float) -> Tuple[multiprocessing.Process, str]:
+    """Run the stand-in in a spawned process; returns (process, base URL)"""
+    context = multiprocessing.get_context('spawn')
+    port_queue = context.Queue()
+    process = context.Process(target=serve_drive, args=(port_queue, root_folder_id, latency_ms),
+                              name='drive-stand-in', daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+
+# ----------------------------------------------------------------------
+# API side: transports pointed at the stand-in
+# ----------------------------------------------------------------------
+
+class StandInHttp:
+    """The API's instrumented httplib2 transport, with Google API URLs sent to the stand-in"""
+
+    def __init__(self, drive_url: str, timeout: float):
+        from drive_http import InstrumentedHttp
+        self.http = InstrumentedHttp(timeout=timeout)
+        self.drive_url = drive_url
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        for host in GOOGLE_API_HOSTS:
+            if uri.startswith(host):
+                uri = self.drive_url + uri[len(host):]
+                break
+        return self.http.request(uri, method, body, headers, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+def stand_in_account(name: str, credentials, drive_url: str):
+    """A pool account whose per-thread transports talk to the stand-in"""
+    from google_auth_httplib2 import AuthorizedHttp
+    from drive_accounts import DriveAccount
+    from drive_http import DRIVE_HTTP_TIMEOUT
+
+    class StandInAccount(DriveAccount):
+        @property
+        def http(self):
+            http = getattr(self._local, 'http', None)
+            if http is None:
+                http = self._local.http = AuthorizedHttp(self.credentials, http=StandInHttp(drive_url, DRIVE_HTTP_TIMEOUT))
+            return http
+
+    return StandInAccount(name, credentials)
+
+class LogCounter(io.TextIOBase):
+    """stdout replacement that counts what the API prints and drops it"""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, text: str) -> int:
+        self.bytes += len(text)
+        return len(text)
+
+def say(message: str):
+    """Soak progress goes to the real stdout even while API logs are counted"""
+    print(message, file=sys.__stdout__, flush=True)
+
+# ----------------------------------------------------------------------
+# Process metrics
+# ----------------------------------------------------------------------
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def open_fds() -> Optional[int]:
+    for directory in ('/proc/self/fd', '/dev/fd'):
+        try:
+            return len(os.listdir(directory))
+        except OSError:
+            continue
+    return None
+
+def object_counts() -> Counter:
+    """Live GC-tracked objects by type"""
+    return Counter(f"{type(obj).__module__}.{type(obj).__qualname__}" for obj in gc.get_objects())
+
+def heap_snapshot() -> tracemalloc.Snapshot:
+    """Traced allocations, minus the soak's own bookkeeping"""
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__)
+    ])
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+def parse_duration(text: str) -> float:
+    """Seconds from '90', '90s', '30m' or '4h'"""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([smh]?)', text.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid duration: {text}")
+    return float(match[1]) * {'': 1, 's': 1, 'm': 60, 'h': 3600}[match[2]]
+
+def short_path(filename: str) -> str:
+    """Allocation site path relative to the backend, site-packages or the standard library"""
+    for marker in ('site-packages' + os.sep, os.path.dirname(os.path.abspath(__file__)) + os.sep,
+                   os.path.dirname(os.__file__) + os.sep):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    return filename
+
+# ----------------------------------------------------------------------
+# Traffic
+# ----------------------------------------------------------------------
+
+class SoakTraffic:
+    """Picks and sends the next request for a fixed pool of users"""
+
+    def __init__(self, client, users: int, rng: random.Random):
+        self.client = client
+        self.rng = rng
+        self.users = [
+            {'userId': f"soakuser{index:08d}", 'userEmail': f"soak.user{index}@learnnect.test", 'resumes': []}
+            for index in range(users)
+        ]
+        self.endpoints = list(TRAFFIC_MIX)
+        self.weights = [TRAFFIC_MIX[endpoint] for endpoint in self.endpoints]
+
+    def pick(self, endpoint: Optional[str] = None) -> Tuple[str, Dict]:
+        """The next (endpoint, user): from the mix, or a user that suits the given endpoint"""
+        if endpoint is None:
+            endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        suitable = [
+            user for user in self.users
+            if (endpoint != 'upload-resume' or len(user['resumes']) < MAX_RESUMES_PER_USER)
+            and (endpoint != 'delete-resume' or user['resumes'])
+        ]
+        user = self.rng.choice(suitable or self.users)
+        # Keep each user's resume count bounded and deletes meaningful
+        if endpoint == 'upload-resume' and len(user['resumes']) >= MAX_RESUMES_PER_USER:
+            endpoint = 'delete-resume'
+        elif endpoint == 'delete-resume' and not user['resumes']:
+            endpoint = 'upload-resume'
+        return endpoint, user
+
+    def payload(self, endpoint: str) -> Tuple[str, bytes, str]:
+        """(file name, content, content type) for an upload"""
+        if endpoint == 'upload-resume':
+            size = self.rng.randint(*RESUME_SIZE_RANGE)
+            return 'resume.pdf', b'%PDF-1.4\n' + self.rng.randbytes(size), 'application/pdf'
+        size = self.rng.randint(*IMAGE_SIZE_RANGE)
+        return 'image.png', b'\x89PNG\r\n\x1a\n' + self.rng.randbytes(size), 'image/png'
+
+    def send(self, endpoint: str, user: Dict, upload: Optional[Tuple[str, bytes, str]]) -> int:
+        """Send one request and update what we know about the user's files; returns the status"""
+        identity = {'userId': user['userId'], 'userEmail': user['userEmail']}
+        if endpoint == 'upload-resume':
+            response = self.client.post('/api/storage/upload-resume', data=dict(identity, fileName=upload[0]),
+                                        files={'file': upload})
+            file_id = response.json().get('fileId') if response.status_code == 200 else None
+            if file_id:
+                user['resumes'].append(file_id)
+        elif endpoint == 'upload-image':
+            image_type = self.rng.choice(['profile', 'banner'])
+            response = self.client.post('/api/storage/upload-image', files={'file': upload},
+                                        data=dict(identity, imageType=image_type, fileName=f"{image_type}_{int(time.time())}.png"))
+        elif endpoint == 'user-resumes':
+            response = self.client.get('/api/storage/user-resumes', params=identity)
+            if response.status_code == 200:
+                user['resumes'] = [file['id'] for file in response.json().get('files', [])]
+        elif endpoint == 'profile-bundle':
+            response = self.client.get('/api/storage/profile-bundle', params=identity)
+        elif endpoint == 'check-existing-image':
+            response = self.client.get('/api/storage/check-existing-image',
+                                       params=dict(identity, imageType=self.rng.choice(['profile', 'banner'])))
+        elif endpoint == 'check-user-folder':
+            response = self.client.get('/api/storage/check-user-folder', params=identity)
+        elif endpoint == 'usage':
+            response = self.client.get('/api/storage/usage', params=identity)
+        elif endpoint == 'delete-resume':
+            file_id = user['resumes'].pop(0)
+            response = self.client.request('DELETE', '/api/storage/delete-resume', json=dict(identity, fileId=file_id))
+        else:
+            response = self.client.request('DELETE', '/api/storage/delete-image',
+                                           json=dict(identity, imageType=self.rng.choice(['profile', 'banner'])))
+        return response.status_code
+
+# ----------------------------------------------------------------------
+# Soak run
+# ----------------------------------------------------------------------
+
+class SoakRecorder:
+    """Per-endpoint accounting plus the periodic process samples"""
+
+    def __init__(self, log_counter: Optional[LogCounter]):
+        self.log_counter = log_counter
+        self.endpoints: Dict[str, Dict] = {
+            endpoint: {'requests': 0, 'errors': 0, 'logBytes': 0, 'peakBytes': 0,
+                       'maxPeakBytes': 0, 'payloadBytes': 0, 'window': []}
+            for endpoint in TRAFFIC_MIX
+        }
+        self.samples: List[Dict] = []
+        self.baseline_objects: Optional[Counter] = None
+        self.baseline_heap: Optional[tracemalloc.Snapshot] = None
+        self.last_heap: Optional[tracemalloc.Snapshot] = None
+        self.started = time.monotonic()
+
+    def measure(self, endpoint: str, send: Callable[[], int], payload_bytes: int, counted: bool) -> int:
+        """Run one request, charging its latency, peak traced memory and log output to the endpoint"""
+        logged = self.log_counter.bytes if self.log_counter else 0
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        status = send()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if not counted:
+            return status
+        peak = tracemalloc.get_traced_memory()[1]
+
+        stats = self.endpoints[endpoint]
+        stats['requests'] += 1
+        stats['errors'] += status >= 500
+        stats['peakBytes'] += peak - before
+        stats['maxPeakBytes'] = max(stats['maxPeakBytes'], peak - before)
+        stats['payloadBytes'] += payload_bytes
+        stats['logBytes'] += (self.log_counter.bytes - logged) if self.log_counter else 0
+        stats['window'].append(elapsed_ms)
+        return status
+
+    def settle(self):
+        """Let background work finish and collect the cycles requests leave behind"""
+        time.sleep(PROBE_SETTLE)
+        gc.collect()
+
+    def burst(self, traffic: 'SoakTraffic', endpoint: str, requests: int) -> Optional[int]:
+        """Traced bytes retained by a burst of one endpoint's requests, or None if it couldn't run them all"""
+        # Payloads are made up front so they are not counted
+        uploads = [traffic.payload(endpoint) if endpoint.startswith('upload-') else None for _ in range(requests)]
+        self.settle()
+        before = tracemalloc.get_traced_memory()[0]
+        for upload in uploads:
+            picked, user = traffic.pick(endpoint)
+            if picked != endpoint:
+                return None
+            traffic.send(endpoint, user, upload)
+        self.settle()
+        return tracemalloc.get_traced_memory()[0] - before
+
+    def probe(self, traffic: 'SoakTraffic', requests: int) -> Dict[str, Optional[float]]:
+        """Retained bytes per request of each endpoint, from a burst of its own requests"""
+        rates: Dict[str, Optional[float]] = {endpoint: None for endpoint in TRAFFIC_MIX}
+        if not requests:
+            return rates
+        for endpoint in TRAFFIC_MIX:
+            # The mixed traffic leaves caches sized for it; an unmeasured burst first brings them to this endpoint's steady state
+            self.burst(traffic, endpoint, requests)
+            retained = self.burst(traffic, endpoint, requests)
+            rates[endpoint] = retained / requests if retained is not None else None
+        return rates
+
+    def take_baseline(self, traffic: 'SoakTraffic', probe_requests: int):
+        self.probe(traffic, probe_requests)  # The first burst of each endpoint warms what it lazily creates
+        self.settle()
+        self.baseline_heap = heap_snapshot()
+        self.baseline_objects = object_counts()
+        self.started = time.monotonic()
+        self.sample(traffic, probe_requests)
+
+    def sample(self, traffic: 'SoakTraffic', probe_requests: int) -> Dict:
+        """Probe each endpoint, then record process-wide numbers and per-endpoint totals so far"""
+        rates = self.probe(traffic, probe_requests)
+        self.settle()
+        heap = heap_snapshot()
+        sample = {
+            'elapsedSeconds': round(time.monotonic() - self.started, 1),
+            'heapBytes': sum(stat.size for stat in heap.statistics('filename')),
+            'rssBytes': rss_bytes(),
+            'fds': open_fds(),
+            'threads': threading.active_count(),
+            'objects': len(gc.get_objects()),
+            'endpoints': {}
+        }
+        for endpoint, stats in self.endpoints.items():
+            sample['endpoints'][endpoint] = {
+                'requests': stats['requests'],
+                'retainedBytesPerRequest': rates[endpoint],
+                'p95Ms': round(percentile(stats['window'], 0.95), 1)
+            }
+            stats['window'] = []
+        self.samples.append(sample)
+        self.last_heap = heap
+        return sample
+
+    def report(self, thresholds: Dict) -> Dict:
+        """Growth per endpoint and process-wide, the top growth sites and the flags"""
+        baseline, final = self.samples[0], self.samples[-1]
+        middle = self.samples[len(self.samples) // 2]
+        flags = []
+
+        endpoints = {}
+        for endpoint, stats in self.endpoints.items():
+            if not stats['requests']:
+                continue
+            halves = []
+            for samples in (self.samples[:len(self.samples) // 2], self.samples[len(self.samples) // 2:]):
+                rates = [sample['endpoints'][endpoint]['retainedBytesPerRequest'] for sample in samples]
+                rates = [rate for rate in rates if rate is not None]
+                halves.append(sum(rates) / len(rates) if rates else 0.0)
+            p95s = [sample['endpoints'][endpoint]['p95Ms'] for sample in self.samples[1:] if sample['endpoints'][endpoint]['p95Ms']]
+            summary = {
+                'requests': stats['requests'],
+                'errors': stats['errors'],
+                'retainedBytesPerRequestByHalf': [round(rate, 1) for rate in halves],
+                'avgPeakBytes': round(stats['peakBytes'] / stats['requests']),
+                'maxPeakBytes': stats['maxPeakBytes'],
+                'logBytesPerRequest': round(stats['logBytes'] / stats['requests'], 1),
+                'p95MsFirst': p95s[0] if p95s else None,
+                'p95MsLast': p95s[-1] if p95s else None
+            }
+            if stats['payloadBytes']:
+                # How many copies of the upload body were alive at once
+                summary['peakPayloadCopies'] = round(stats['peakBytes'] / stats['payloadBytes'], 2)
+            endpoints[endpoint] = summary
+
+            if len(self.samples) >= 3 and min(halves) > thresholds['leakBytes']:
+                flags.append(f"{endpoint}: retains {halves[0]:.0f} then {halves[1]:.0f} bytes/request")
+            if stats['errors'] > stats['requests'] * ERROR_RATE:
+                flags.append(f"{endpoint}: {stats['errors']} of {stats['requests']} requests failed")
+
+        growth = {}
+        for key, limit, scale, unit in (
+            ('heapBytes', thresholds['heapMb'], 1024 * 1024, 'MB'),
+            ('rssBytes', thresholds['rssMb'], 1024 * 1024, 'MB'),
+            ('fds', thresholds['fds'], 1, ''),
+            ('threads', thresholds['threads'], 1, '')
+        ):
+            if baseline[key] is None or final[key] is None:
+                continue
+            growth[key] = final[key] - baseline[key]
+            # Flag growth that is over the limit and still rising in the second half
+            if growth[key] / scale > limit and final[key] > middle[key]:
+                flags.append(f"{key}: grew {growth[key] / scale:.1f}{unit} (limit {limit}{unit}) and is still rising")
+
+        key_type = 'traceback' if tracemalloc.get_traceback_limit() > 1 else 'lineno'
+        sites = [
+            {
+                'site': [f"{short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback],
+                'sizeDiff': stat.size_diff,
+                'countDiff': stat.count_diff
+            }
+            for stat in self.last_heap.compare_to(self.baseline_heap, key_type)[:REPORT_TOP]
+            if stat.size_diff > 0
+        ]
+        objects = (object_counts() - self.baseline_objects).most_common(REPORT_TOP)
+
+        return {
+            'durationSeconds': final['elapsedSeconds'],
+            'thresholds': thresholds,
+            'growth': growth,
+            'endpoints': endpoints,
+            'growthSites': sites,
+            'objectGrowth': [{'type': name, 'count': count} for name, count in objects],
+            'samples': self.samples,
+            'flags': flags
+        }
+
+def soak(args) -> Dict:
+    """Warm up, then drive traffic until the duration (or request count) is reached"""
+    # Fresh state and spool, nothing written next to the code, no limits and a service key for one synthetic client
+    workdir = tempfile.mkdtemp(prefix='drive-soak-')
+    os.environ['LEARNNECT_STATE_DB'] = os.path.join(workdir, 'state.db')
+    os.environ['UPLOAD_SPOOL_DIR'] = os.path.join(workdir, 'upload_spool')
+    os.environ['UPLOAD_WRITE_BEHIND'] = 'true' if args.write_behind else 'false'
+    os.environ['DRIVE_SYNC_ENABLED'] = 'false'  # The stand-in has no changes feed
+    os.environ['CACHE_SNAPSHOT_ENABLED'] = 'false'
+    os.environ['RESUME_THUMBNAILS_ENABLED'] = 'false'  # Rendering happens in other processes
+    os.environ['RATE_LIMIT_ENABLED'] = 'false'
+    os.environ['AUTH_REQUIRED'] = 'false'
+    os.environ.pop('AUTH_KEYS_FILE', None)
+    os.environ['API_SECRET_KEY'] = SOAK_API_KEY
+    os.environ.pop('DRIVE_RECORD_DIR', None)
+
+    # Start tracing before the API is imported so everything it allocates is attributed
+    tracemalloc.start(args.frames)
+
+    # Imported only now: these modules read their settings at import time
+    from fastapi.testclient import TestClient
+    from google.oauth2.credentials import Credentials
+    import learnnect_storage_api as api
+    from drive_accounts import PooledHttp, ServiceAccountPool
+    from drive_http import build_drive_service
+
+    process, drive_url = start_drive_stand_in(api.LEARNNECT_FOLDER_ID, args.drive_latency_ms)
+    say(f"🗄️ Drive stand-in at {drive_url} (pid {process.pid}, ~{args.drive_latency_ms:.0f}ms per call)")
+
+    def connect_to_stand_in():
+        # Never expires, so the token refresher leaves it alone
+        credentials = Credentials(token='soak', expiry=datetime.utcnow() + timedelta(days=365))
+        api.storage_service.pool = ServiceAccountPool([stand_in_account('soak@learnnect.test', credentials, drive_url)])
+        api.storage_service.credentials = credentials
+        api.storage_service.service = build_drive_service(http=PooledHttp(api.storage_service.pool, hedger=api.hedger))
+
+    # Startup would load real service-account credentials; everything else it starts runs as in production
+    api.storage_service.initialize_drive_service = connect_to_stand_in
+
+    log_counter = None if args.show_logs else LogCounter()
+    if log_counter:
+        sys.stdout = log_counter
+    recorder = SoakRecorder(log_counter)
+    rng = random.Random(args.seed)
+
+    try:
+        with TestClient(api.app, raise_server_exceptions=False, headers={'X-API-Key': SOAK_API_KEY}) as client:
+            traffic = SoakTraffic(client, args.users, rng)
+
+            def run_one(counted: bool) -> int:
+                endpoint, user = traffic.pick()
+                upload = traffic.payload(endpoint) if endpoint.startswith('upload-') else None
+                return recorder.measure(endpoint, lambda: traffic.send(endpoint, user, upload),
+                                        len(upload[1]) if upload else 0, counted)
+
+            say(f"🔥 Warming up with {args.warmup} requests...")
+            for _ in range(args.warmup):
+                run_one(counted=False)
+            recorder.take_baseline(traffic, args.probe_requests)
+            say(f"📏 Baseline: heap {recorder.samples[0]['heapBytes'] / 1e6:.1f}MB, "
+                f"{recorder.samples[0]['fds']} fds, {recorder.samples[0]['threads']} threads")
+
+            deadline = time.monotonic() + args.duration
+            next_sample = time.monotonic() + args.sample_interval
+            requests = 0
+            while time.monotonic() < deadline and (not args.requests or requests < args.requests):
+                run_one(counted=True)
+                requests += 1
+                if time.monotonic() >= next_sample:
+                    sample = recorder.sample(traffic, args.probe_requests)
+                    baseline = recorder.samples[0]
+                    say(
+                        f"⏱️ {sample['elapsedSeconds'] / 60:.1f}m: {requests} requests, "
+                        f"heap {sample['heapBytes'] / 1e6:.1f}MB ({(sample['heapBytes'] - baseline['heapBytes']) / 1e6:+.1f}), "
+                        f"RSS {(sample['rssBytes'] or 0) / 1e6:.0f}MB, fds {sample['fds']}, threads {sample['threads']}"
+                    )
+                    next_sample = time.monotonic() + args.sample_interval
+            recorder.sample(traffic, args.probe_requests)
+            return recorder.report({
+                'leakBytes': args.leak_bytes,
+                'heapMb': args.heap_growth_mb,
+                'rssMb': args.rss_growth_mb,
+                'fds': args.fd_growth,
+                'threads': args.thread_growth
+            })
+    finally:
+        sys.stdout = sys.__stdout__
+        process.terminate()
+        process.join(timeout=5)
+
+def main():
+    """Parse arguments, run the soak and write the report"""
+    parser = argparse.ArgumentParser(description="Soak the storage API against a local Drive stand-in and report leaks")
+    parser.add_argument('--duration', type=parse_duration, default=3600, help="How long to run: 90s, 30m, 4h")
+    parser.add_argument('--requests', type=int, default=0, help="Stop after this many requests (0 = no limit)")
+    parser.add_argument('--warmup', type=int, default=300, help="Requests before the baseline is taken")
+    parser.add_argument('--sample-interval', type=parse_duration, default=60, help="Time between samples")
+    parser.add_argument('--probe-requests', type=int, default=PROBE_REQUESTS, help="Requests per endpoint in each retention probe (0 skips them)")
+    parser.add_argument('--users', type=int, default=40, help="Synthetic users in the traffic mix")
+    parser.add_argument('--drive-latency-ms', type=float, default=20, help="Average stand-in latency per Drive call")
+    parser.add_argument('--write-behind', action='store_true', help="Stage uploads in the spool (UPLOAD_WRITE_BEHIND)")
+    parser.add_argument('--frames', type=int, default=1, help="Traceback depth per allocation (more is slower)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the traffic mix")
+    parser.add_argument('--show-logs', action='store_true', help="Print API logs instead of counting them")
+    parser.add_argument('--leak-bytes', type=float, default=LEAK_BYTES_PER_REQUEST, help="Retained bytes/request flagged per endpoint")
+    parser.add_argument('--heap-growth-mb', type=float, default=HEAP_GROWTH_MB)
+    parser.add_argument('--rss-growth-mb', type=float, default=RSS_GROWTH_MB)
+    parser.add_argument('--fd-growth', type=int, default=FD_GROWTH)
+    parser.add_argument('--thread-growth', type=int, default=THREAD_GROWTH)
+    parser.add_argument('--report', default='soak_report.json', help="Where to write the JSON report")
+    parser.add_argument('--smoke', action='store_true', help="Short CI run that only checks for failing endpoints")
+    args = parser.parse_args()
+    if args.smoke:
+        args.requests, args.warmup, args.probe_requests = SMOKE_REQUESTS, SMOKE_WARMUP, SMOKE_PROBE_REQUESTS
+        args.duration, args.drive_latency_ms = SMOKE_DURATION, SMOKE_DRIVE_LATENCY_MS
+        args.sample_interval = SMOKE_DURATION + 1  # Baseline and final samples only
+
+    say("🧪 Learnnect Drive Soak")
+    say("=" * 50)
+    report = soak(args)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    say("")
+    say("📊 Soak Summary")
+    say("=" * 50)
+    for endpoint, summary in sorted(report['endpoints'].items()):
+        copies = f", {summary['peakPayloadCopies']}x payload at peak" if 'peakPayloadCopies' in summary else ''
+        say(
+            f"   {endpoint}: {summary['requests']} requests, {summary['errors']} errors, "
+            f"retained {summary['retainedBytesPerRequestByHalf'][0]:.0f}/{summary['retainedBytesPerRequestByHalf'][1]:.0f} B/request, "
+            f"peak {summary['avgPeakBytes'] / 1024:.0f}KB{copies}, logs {summary['logBytesPerRequest']:.0f} B/request"
+        )
+    say(f"   Growth: " + ', '.join(f"{key} {value:+,}" for key, value in report['growth'].items()))
+    say("")
+    say("🔎 Top allocation growth:")
+    for site in report['growthSites'][:5]:
+        say(f"   {site['sizeDiff'] / 1024:+.1f}KB ({site['countDiff']:+} blocks) {' <- '.join(site['site'])}")
+    say(f"📝 Report written to {args.report}")
+
+    say("")
+    if report['flags']:
+        say(f"❌ {len(report['flags'])} growth flags:")
+        for flag in report['flags']:
+            say(f"   - {flag}")
+        return 1
+    say("✅ No growth beyond thresholds")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Learnnect Drive Sync - Incremental sync from the Google Drive Changes feed
+Keeps the shared folder/file metadata caches correct when files are changed
+outside the API (Drive UI, setup scripts) without full rescans
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Optional, Set
+
+from shared_state import shared_state
+
+DRIVE_SYNC_ENABLED = os.getenv('DRIVE_SYNC_ENABLED', 'true').lower() == 'true'
+DRIVE_SYNC_INTERVAL = int(os.getenv('DRIVE_SYNC_INTERVAL', 30))
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+CHANGE_FIELDS = 'nextPageToken, newStartPageToken, changes(fileId, removed, file(id, name, mimeType, parents, trashed, size, createdTime))'
+
+class DriveChangesSync:
+    def __init__(self, storage, root_folder_id: str, interval: int = DRIVE_SYNC_INTERVAL):
+        self.storage = storage
+        self.root_folder_id = root_folder_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'polls': 0, 'changes_applied': 0, 'errors': 0, 'last_poll': None}
+
+    def start(self):
+        """Start polling in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='drive-changes-sync', daemon=True)
+        self._thread.start()
+        print(f"🔄 Drive changes sync started (every {self.interval}s)")
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"⚠️ Drive changes sync failed: {e}")
+
+    def poll_once(self) -> int:
+        """Fetch and apply all changes since the stored cursor; returns changes applied.
+
+        Only one worker polls at a time; the cursor lives in shared state so
+        whichever worker wins the lock continues where the last one stopped.
+        """
+        if not self.storage.service:
+            return 0
+
+        owner = shared_state.try_acquire('drive-changes-sync', ttl=max(self.interval * 2, 60))
+        if not owner:
+            return 0
+
+        try:
+            page_token = shared_state.get('drive_sync', 'page_token')
+            if not page_token:
+                # First run: start from "now", the caches are filled lazily by lookups
+                start = self.storage.service.changes().getStartPageToken().execute()
+                shared_state.set('drive_sync', 'page_token', start['startPageToken'])
+                print(f"🔄 Drive changes sync cursor initialised: {start['startPageToken']}")
+                return 0
+
+            applied = 0
+            while page_token:
+                response = self.storage.service.changes().list(
+                    pageToken=page_token,
+                    fields=CHANGE_FIELDS,
+                    pageSize=1000,
+                    includeRemoved=True,
+                    spaces='drive'
+                ).execute()
+
+                for change in response.get('changes', []):
+                    if self.apply_change(change):
+                        applied += 1
+
+                if 'newStartPageToken' in response:
+                    # Caught up: persist the cursor for the next poll
+                    shared_state.set('drive_sync', 'page_token', response['newStartPageToken'])
+                    break
+
+                page_token = response.get('nextPageToken')
+                shared_state.set('drive_sync', 'page_token', page_token)
+
+            self.stats['polls'] += 1
+            self.stats['changes_applied'] += applied
+            self.stats['last_poll'] = time.time()
+            if applied:
+                print(f"🔄 Applied {applied} Drive changes to local caches")
+            return applied
+
+        finally:
+            shared_state.release('drive-changes-sync', owner)
+
+    def apply_change(self, change: Dict) -> bool:
+        """Apply one change (add, rename, trash or delete) to the caches.
+
+        Returns True if the change touched anything we track.
+        """
+        file_id = change.get('fileId')
+        file = change.get('file') or {}
+        removed = change.get('removed') or file.get('trashed', False)
+
+        previous = shared_state.get('files', file_id)
+        known_folder = shared_state.get('folder_keys', file_id) is not None
+
+        parents = set(file.get('parents') or [])
+        if previous:
+            parents.update(previous.get('parents') or [])
+
+        tracked_parents = {p for p in parents if self._is_tracked_folder(p)}
+        if not (previous or known_folder or tracked_parents):
+            return False
+
+        # Users whose listings may have changed
+        owners: Set[str] = set()
+        for folder_id in tracked_parents | {file_id}:
+            owner = shared_state.get('folder_owners', folder_id)
+            if owner:
+                owners.add(owner)
+
+        if removed:
+            self.storage.forget_folder(file_id)
+            shared_state.delete('files', file_id)
+            shared_state.delete('folder_owners', file_id)
+        elif file.get('mimeType') == FOLDER_MIME_TYPE:
+            # Added, moved or renamed folder: drop the old key and cache the new one
+            self.storage.forget_folder(file_id)
+            for parent in file.get('parents') or []:
+                if self._is_tracked_folder(parent):
+                    self.storage.cache_folder(parent, file['name'], file_id)
+        else:
+            new_parents = [p for p in file.get('parents') or [] if self._is_tracked_folder(p)]
+            if new_parents:
+                self.storage.remember_file(file, new_parents[0])
+            else:
+                # Moved out of our tree
+                shared_state.delete('files', file_id)
+
+        for owner in owners:
+            self.storage.bump_listing_version(owner)
+        return True
+
+    def _is_tracked_folder(self, folder_id: str) -> bool:
+        """True for the Learnnect root and any folder we have resolved"""
+        return folder_id == self.root_folder_id or shared_state.get('folder_keys', folder_id) is not None
@@ -2,8 +2,14 @@
 """
 Generate Secure API Keys for Learnnect Storage API
 Creates cryptographically secure random keys for production use
+
+Rotate the keys the running API accepts (AUTH_KEYS_FILE), without a restart:
+    python generate_api_keys.py --rotate auth_keys.json
 """
 
+import os
+import sys
+import json
 import secrets
 import string
 import hashlib
@@ -115,5 +121,42 @@ def main():
     
     return keys
 
+def rotate_keys_file(path, keep_previous=1):
+    """Put new keys first in an auth keys file, keeping the previous ones valid for now"""
+    current = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            current = json.load(f)
+
+    # The first rotation carries over the keys the API was started with
+    env_keys = {"apiKeys": "API_SECRET_KEY", "adminKeys": "ADMIN_API_KEY", "jwtSecrets": "JWT_SECRET_KEY"}
+    new_keys = {
+        "apiKeys": generate_secure_key(64, True),
+        "adminKeys": generate_api_key_with_prefix("learnnect_admin", 32),
+        "jwtSecrets": generate_jwt_secret(48)
+    }
+    rotated = {
+        entry: [new_key] + (current.get(entry) or [key for key in [os.getenv(env_keys[entry])] if key])[:keep_previous]
+        for entry, new_key in new_keys.items()
+    }
+    rotated["rotatedAt"] = datetime.now().isoformat()
+
+    # Written in place atomically: the API polls this file and must never read half of it
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(rotated, f, indent=2)
+    os.chmod(temp_path, 0o600)
+    os.replace(temp_path, path)
+
+    print(f"🔄 Rotated keys in {path} (previous keys stay valid until the next rotation)")
+    for entry, new_key in new_keys.items():
+        print(f"{entry}: {new_key}")
+    print()
+    print("⚠️  Give clients the new keys, then rotate again to retire the old ones")
+    return new_keys
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) == 3 and sys.argv[1] == '--rotate':
+        rotate_keys_file(sys.argv[2])
+    else:
+        main()
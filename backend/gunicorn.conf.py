@@ -0,0 +1,36 @@
+"""
+Gunicorn configuration for the Learnnect Storage API
+Runs multiple uvicorn worker processes: web: gunicorn -c gunicorn.conf.py learnnect_storage_api:app
+"""
+
+import os
+import multiprocessing
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 8001)}"
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# Default to one worker per core (+1), capped so small instances don't exhaust memory
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() + 1, 8)))
+
+# Each worker loads the app itself so the Drive client (httplib2) is never shared across a fork
+preload_app = False
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically to bound memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+
+def on_starting(server):
+    print(f"🚀 Starting Learnnect Storage API with {workers} workers on {bind}")
+
+def post_fork(server, worker):
+    """Drop any state inherited from the master before the worker serves requests"""
+    from shared_state import shared_state
+    shared_state.reset_after_fork()
+    print(f"👷 Worker started (pid {worker.pid})")
@@ -0,0 +1,282 @@
+"""
+Learnnect Idempotency - Idempotency-Key support for upload and delete endpoints
+The first request with a given key runs normally and its response is stored in
+shared state for IDEMPOTENCY_TTL. A retry with the same key gets the stored
+response replayed without touching Drive; a retry that arrives while the
+original is still running waits for it and then replays its result.
+
+Keys are scoped to the caller (and, for unauthenticated callers, to their IP),
+and a key reused with a different body (by SHA-256) is rejected rather than
+replayed. The in-flight claim is renewed while the original runs. Only final outcomes are stored:
+successes and 4xx errors that a retry would get again.
+"""
+
+import os
+import json
+import time
+import base64
+import asyncio
+import hashlib
+from typing import Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from shared_state import shared_state
+from api_auth import current_principal
+from rate_limit import claimed_user_id, client_ip, request_user_id
+
+IDEMPOTENCY_HEADER = b'idempotency-key'
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+# How long a duplicate waits for the original request to finish
+IDEMPOTENCY_WAIT = float(os.getenv('IDEMPOTENCY_WAIT', 120))
+
+# Renewed every IN_FLIGHT_HEARTBEAT while the original runs (however long that is),
+# so a key is freed within IN_FLIGHT_TTL of a worker dying mid-request
+IN_FLIGHT_TTL = 60
+IN_FLIGHT_HEARTBEAT = IN_FLIGHT_TTL / 3
+POLL_INTERVAL = 0.1
+
+MAX_KEY_LENGTH = 255
+MAX_STORED_BODY = 64 * 1024
+
+# 4xx outcomes that depend on timing or load rather than the request, so a retry may succeed
+TRANSIENT_STATUSES = {408, 409, 425, 429, 499}
+
+IDEMPOTENT_ROUTES = {
+    ('POST', '/api/storage/upload-resume'),
+    ('POST', '/api/storage/upload-image'),
+    ('POST', '/api/storage/upload-session'),
+    ('POST', '/api/storage/upload-session/finalize'),
+    ('POST', '/api/storage/provision'),
+    ('DELETE', '/api/storage/delete-resume'),
+    ('DELETE', '/api/storage/delete-image')
+}
+
+class IdempotencyStore:
+    """Responses kept per Idempotency-Key, plus the in-flight claims"""
+
+    def __init__(self, ttl: int = IDEMPOTENCY_TTL):
+        self.ttl = ttl
+        self.stats = {'stored': 0, 'replayed': 0, 'attached': 0, 'conflicts': 0}
+
+    def get(self, store_key: str) -> Optional[Dict]:
+        return shared_state.get('idempotency', store_key)
+
+    def claim(self, store_key: str) -> Optional[str]:
+        """Become the request that runs the operation for this key"""
+        return shared_state.try_acquire(f"idempotency:{store_key}", ttl=IN_FLIGHT_TTL)
+
+    def renew(self, store_key: str, owner: str) -> bool:
+        """Keep the claim while the original is still running; False if it was lost"""
+        return shared_state.renew(f"idempotency:{store_key}", owner, IN_FLIGHT_TTL)
+
+    def release(self, store_key: str, owner: str):
+        shared_state.release(f"idempotency:{store_key}", owner)
+
+    def save(self, store_key: str, fingerprint: str, status: Optional[int], headers: List, body: bytes):
+        """Keep the response unless a retry could get a different one, or it's too big to replay"""
+        if not is_final(status) or len(body) > MAX_STORED_BODY:
+            return
+        shared_state.set('idempotency', store_key, {
+            'fingerprint': fingerprint,
+            'status': status,
+            'headers': [[name.decode('latin-1'), value.decode('latin-1')] for name, value in headers],
+            'body': base64.b64encode(body).decode('ascii')
+        }, ttl=self.ttl)
+        self.stats['stored'] += 1
+
+    def metrics(self) -> Dict:
+        return {
+            'stored': self.stats['stored'],
+            'replayed': self.stats['replayed'],
+            'attached': self.stats['attached'],
+            'conflicts': self.stats['conflicts'],
+            'ttlSeconds': self.ttl
+        }
+
+idempotency = IdempotencyStore()
+
+def is_final(status: Optional[int]) -> bool:
+    """Successes and the 4xx errors a retry would get again"""
+    return status is not None and (200 <= status < 300 or (400 <= status < 500 and status not in TRANSIENT_STATUSES))
+
+def caller_identity(scope, headers: Dict[bytes, bytes]) -> str:
+    """Who the key belongs to: the authenticated principal and the user it acts for.
+
+    Anyone can claim a userId without credentials, so unauthenticated callers'
+    keys are also scoped to their IP; otherwise a caller who guessed another
+    user's key could be replayed that user's response.
+    """
+    principal = current_principal.get()
+    if principal and principal['type'] != 'anonymous':
+        return f"{principal['type']}:{request_user_id(scope, headers) or claimed_user_id(scope, headers) or ''}"
+    return f"anonymous:{client_ip(scope, headers) or ''}:{claimed_user_id(scope, headers) or ''}"
+
+class BodyFingerprint:
+    """SHA-256 of a request body as it streams past.
+
+    Multipart boundaries are left out: clients pick a new random one for
+    every send, so a genuine retry would otherwise never match.
+    """
+
+    def __init__(self, headers: Dict[bytes, bytes]):
+        self.digest = hashlib.sha256()
+        self.complete = False
+        self.boundary = None
+        self.pending = b''
+        content_type = headers.get(b'content-type', b'').decode('latin-1')
+        if content_type.lower().startswith('multipart/'):
+            for param in content_type.split(';')[1:]:
+                name, _, value = param.strip().partition('=')
+                if name.lower() == 'boundary' and value:
+                    self.boundary = b'--' + value.strip('"').encode('latin-1')
+
+    def update(self, message: Dict):
+        chunk = message.get('body', b'')
+        if self.boundary:
+            # Hold back a boundary's length so one split across chunks is still found
+            data = (self.pending + chunk).replace(self.boundary, b'--')
+            keep = len(self.boundary) - 1
+            self.pending = data[-keep:] if len(data) > keep else data
+            chunk = data[:len(data) - len(self.pending)]
+        self.digest.update(chunk)
+        if not message.get('more_body'):
+            self.complete = True
+
+    def hexdigest(self) -> str:
+        digest = self.digest.copy()
+        digest.update(self.pending)
+        return digest.hexdigest()
+
+async def hash_body(receive, fingerprint: BodyFingerprint) -> str:
+    """Read a body to the end just to fingerprint it (for replays, which never pass it on)"""
+    while not fingerprint.complete:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        fingerprint.update(message)
+    return fingerprint.hexdigest()
+
+class IdempotencyMiddleware:
+    """Replay stored responses for repeated Idempotency-Keys"""
+
+    def __init__(self, app, store: IdempotencyStore = idempotency, routes=IDEMPOTENT_ROUTES):
+        self.app = app
+        self.store = store
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or (scope['method'], scope['path']) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers', []))
+        key = headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            await self._send_json(send, 400, {'detail': 'Idempotency-Key is too long'})
+            return
+
+        store_key = f"{scope['method']} {scope['path']} {caller_identity(scope, headers)} {key.decode('latin-1')}"
+        stats = self.store.stats
+
+        # Shared state is SQLite; its calls (and lock waits) run off the event loop
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        attached = False
+        while True:
+            record = await run_in_threadpool(self.store.get, store_key)
+            if record:
+                await self._replay_or_reject(receive, send, BodyFingerprint(headers), record)
+                return
+
+            owner = await run_in_threadpool(self.store.claim, store_key)
+            if owner:
+                break
+
+            # The original is still running (maybe in another worker): wait and replay its result
+            if time.monotonic() >= deadline:
+                stats['conflicts'] += 1
+                await self._send_json(send, 409, {'detail': 'A request with this Idempotency-Key is still in progress'})
+                return
+            if not attached:
+                attached = True
+                stats['attached'] += 1
+            await asyncio.sleep(POLL_INTERVAL)
+
+        try:
+            # It may have finished between the lookup and the claim
+            record = await run_in_threadpool(self.store.get, store_key)
+            if record:
+                await self._replay_or_reject(receive, send, BodyFingerprint(headers), record)
+                return
+
+            # Same key must mean the same request, so the body is fingerprinted as the route reads it
+            fingerprint = BodyFingerprint(headers)
+            response = {'status': None, 'headers': [], 'body': []}
+
+            async def hashing_receive():
+                message = await receive()
+                if message['type'] == 'http.request':
+                    fingerprint.update(message)
+                return message
+
+            async def capture_send(message):
+                if message['type'] == 'http.response.start':
+                    response['status'] = message['status']
+                    response['headers'] = message.get('headers', [])
+                elif message['type'] == 'http.response.body':
+                    response['body'].append(message.get('body', b''))
+                await send(message)
+
+            heartbeat = asyncio.ensure_future(self._keep_claimed(store_key, owner))
+            try:
+                await self.app(scope, hashing_receive, capture_send)
+            finally:
+                heartbeat.cancel()
+            # A response sent before the whole body arrived (e.g. an upload rejected early) has no fingerprint
+            if fingerprint.complete:
+                await run_in_threadpool(
+                    self.store.save, store_key, fingerprint.hexdigest(), response['status'],
+                    response['headers'], b''.join(response['body'])
+                )
+        finally:
+            await run_in_threadpool(self.store.release, store_key, owner)
+
+    async def _keep_claimed(self, store_key: str, owner: str):
+        """Renew the in-flight claim until cancelled, so a slow original is never run twice"""
+        while True:
+            await asyncio.sleep(IN_FLIGHT_HEARTBEAT)
+            try:
+                if not await run_in_threadpool(self.store.renew, store_key, owner):
+                    print(f"⚠️ Lost the Idempotency-Key claim on {store_key}; a retry may run it again")
+                    return
+            except Exception as e:
+                print(f"⚠️ Could not renew the Idempotency-Key claim on {store_key}: {e}")
+
+    async def _replay_or_reject(self, receive, send, fingerprint: BodyFingerprint, record: Dict):
+        """Replay a stored response if this request's body matches the original's"""
+        stats = self.store.stats
+        if await hash_body(receive, fingerprint) != record['fingerprint']:
+            stats['conflicts'] += 1
+            await self._send_json(send, 422, {'detail': 'Idempotency-Key was already used for a different request'})
+            return
+        stats['replayed'] += 1
+        await self._replay(send, record)
+
+    async def _replay(self, send, record: Dict):
+        headers: List = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in record['headers']]
+        headers.append((b'idempotent-replayed', b'true'))
+        await send({'type': 'http.response.start', 'status': record['status'], 'headers': headers})
+        await send({'type': 'http.response.body', 'body': base64.b64decode(record['body'])})
+
+    async def _send_json(self, send, status: int, payload: Dict):
+        body = json.dumps(payload).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': body})
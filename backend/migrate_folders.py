@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Learnnect Folder Migration - Move user folders from the root into hash buckets
+Safe to run while the API is serving: each move takes the same lock the API
+uses to create user folders, and the API finds folders in either place until
+the move is done. Re-running only picks up folders still in the root.
+
+Usage:
+    python migrate_folders.py --dry-run
+    python migrate_folders.py --pause 0.2
+"""
+
+import re
+import sys
+import time
+import argparse
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+USER_FOLDER_PATTERN = re.compile(r'^Learnnect_(.+)_([^_]{1,8})$')
+
+def list_root_user_folders(service, root_folder_id: str):
+    """Every user folder still directly under the root, following pagination"""
+    page_token = None
+    while True:
+        response = service.files().list(
+            q=f"'{root_folder_id}' in parents and mimeType='{FOLDER_MIME_TYPE}' and trashed=false",
+            fields='nextPageToken, files(id, name)',
+            pageSize=1000,
+            pageToken=page_token
+        ).execute(num_retries=5)
+        for folder in response.get('files', []):
+            if USER_FOLDER_PATTERN.match(folder['name']):
+                yield folder
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+def migrate(storage, root_folder_id: str, dry_run: bool = False, pause: float = 0.1, limit: int = 0) -> dict:
+    """Move root-level user folders into their buckets"""
+    stats = {'moved': 0, 'duplicates': 0, 'failed': 0}
+
+    # Snapshot first: moving folders while paging through the root would shift the pages
+    folders = list(list_root_user_folders(storage.service, root_folder_id))
+    if limit:
+        folders = folders[:limit]
+    print(f"📁 {len(folders)} user folders in the root")
+
+    for index, folder in enumerate(folders, 1):
+        user_key = USER_FOLDER_PATTERN.match(folder['name']).group(2)
+        bucket_path = '/'.join(storage.get_user_bucket_names(user_key))
+        if dry_run:
+            print(f"   {folder['name']} -> {bucket_path}")
+            continue
+
+        try:
+            folder_id = storage.relocate_user_folder(folder['id'], folder['name'], user_key)
+            if folder_id == folder['id']:
+                stats['moved'] += 1
+            else:
+                stats['duplicates'] += 1
+                print(f"👯 {folder['name']} already exists in {bucket_path}; left the root copy in place")
+        except Exception as e:
+            stats['failed'] += 1
+            print(f"⚠️ Failed to move {folder['name']}: {e}")
+
+        if index % 100 == 0:
+            print(f"   ⏳ {index}/{len(folders)} folders processed")
+        # Leave Drive quota for live traffic
+        time.sleep(pause)
+
+    return stats
+
+def main():
+    """Parse arguments and run the migration"""
+    parser = argparse.ArgumentParser(description="Move Learnnect user folders into hash bucket folders")
+    parser.add_argument('--dry-run', action='store_true', help="Only print where each folder would go")
+    parser.add_argument('--pause', type=float, default=0.1, help="Seconds to wait between moves")
+    parser.add_argument('--limit', type=int, default=0, help="Move at most this many folders")
+    args = parser.parse_args()
+
+    print("📦 Learnnect Folder Migration")
+    print("=" * 50)
+
+    from learnnect_storage_api import LearnnectStorageService, LEARNNECT_FOLDER_ID
+
+    storage = LearnnectStorageService()
+    storage.initialize_drive_service()
+    if not storage.service:
+        print("❌ Google Drive service not available. Check service account configuration.")
+        return 1
+
+    stats = migrate(storage, LEARNNECT_FOLDER_ID, args.dry_run, args.pause, args.limit)
+    if args.dry_run:
+        return 0
+
+    print()
+    print("📊 Migration Summary")
+    print("=" * 50)
+    print(f"   ✅ Moved: {stats['moved']}")
+    print(f"   👯 Duplicates left in root: {stats['duplicates']}")
+    print(f"   ⚠️  Failed: {stats['failed']}")
+    if stats['failed']:
+        print("💡 Re-run to retry the failed folders")
+    else:
+        print("💡 Once no user folders remain in the root, set USER_FOLDER_LEGACY_LOOKUP=false")
+    return 1 if stats['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
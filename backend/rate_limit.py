@@ -0,0 +1,235 @@
+"""
+Learnnect Rate Limiting - Per-user and per-IP token buckets for the storage API
+Every storage call costs Drive requests from the shared project quota, so one
+user or script looping on an endpoint slows down everyone. Each request takes a
+token from its client IP's bucket and, when the user is known, from the user's
+bucket, only if both have one (so a user over budget doesn't drain the IP
+budget others behind the same NAT share); reads and writes have separate
+budgets. Over budget gets 429 with Retry-After, and every limited response
+carries the RateLimit-* headers.
+
+Only a verified token's user gets a bucket of their own. Anyone can send a
+userId without credentials, so a claimed one is bucketed together with the
+caller's IP: spoofing someone else's ID never spends that user's budget.
+
+Buckets live in worker memory by default (each worker enforces its own share);
+RATE_LIMIT_STORE=shared keeps them in shared state so limits are exact across
+workers at the cost of a SQLite transaction per request, run off the event loop.
+"""
+
+import os
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from starlette.concurrency import run_in_threadpool
+
+from shared_state import shared_state
+from api_auth import current_principal
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE', 'memory')
+
+# Requests per minute (also the burst size); IPs are looser since users can share one behind NAT
+RATE_LIMIT_USER_READS = int(os.getenv('RATE_LIMIT_USER_READS', 120))
+RATE_LIMIT_USER_WRITES = int(os.getenv('RATE_LIMIT_USER_WRITES', 20))
+RATE_LIMIT_IP_READS = int(os.getenv('RATE_LIMIT_IP_READS', 600))
+RATE_LIMIT_IP_WRITES = int(os.getenv('RATE_LIMIT_IP_WRITES', 60))
+RATE_LIMIT_WINDOW = 60
+
+# Proxies in front of the API; the client IP is this many entries from the right of X-Forwarded-For
+RATE_LIMIT_PROXY_HOPS = int(os.getenv('RATE_LIMIT_PROXY_HOPS', 0))
+
+# Memory store bound; the least recently used bucket is dropped (it would refill anyway)
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))
+
+# Health checks must never be limited; progress streams are long-lived and free
+RATE_LIMIT_EXEMPT_PATHS = {'/api/storage/health', '/api/storage/upload-progress'}
+
+# Uploads put userId after the file in the form body, so clients can name the user here
+USER_ID_HEADER = b'x-user-id'
+MAX_USER_ID_LENGTH = 128
+
+class MemoryBuckets:
+    """Token buckets in a dict with LRU eviction: O(1) per bucket taken from"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self.buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+
+    def take_tokens(self, buckets: List[Tuple[str, float, float]], cost: float = 1.0) -> Tuple[bool, List[float]]:
+        """Same contract as shared_state.take_tokens: all buckets are charged, or none"""
+        now = time.monotonic()
+        levels = []
+        for name, rate, capacity in buckets:
+            bucket = self.buckets.get(name)
+            levels.append(capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate))
+
+        allowed = all(tokens >= cost for tokens in levels)
+        if allowed:
+            levels = [tokens - cost for tokens in levels]
+
+        for (name, _, _), tokens in zip(buckets, levels):
+            self.buckets.pop(name, None)
+            self.buckets[name] = (tokens, now)
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return allowed, levels
+
+class RateLimiter:
+    """Read/write budgets per user and per IP, checked together.
+
+    The memory store is only used on the event loop, so it needs no locking;
+    the shared store is called from the threadpool.
+    """
+
+    def __init__(self, enabled: bool = RATE_LIMIT_ENABLED, store: str = RATE_LIMIT_STORE):
+        self.enabled = enabled
+        self.store_name = store
+        self.store = shared_state if store == 'shared' else MemoryBuckets()
+        self.limits = {
+            ('user', 'read'): RATE_LIMIT_USER_READS,
+            ('user', 'write'): RATE_LIMIT_USER_WRITES,
+            ('ip', 'read'): RATE_LIMIT_IP_READS,
+            ('ip', 'write'): RATE_LIMIT_IP_WRITES
+        }
+        self.stats = {
+            'allowed': {'read': 0, 'write': 0},
+            'limited': {'user': 0, 'ip': 0}
+        }
+
+    def check(self, kind: str, client_ip: Optional[str], user_id: Optional[str]) -> Tuple[bool, Dict]:
+        """Take a token from every applicable bucket, or from none if any is empty.
+
+        Returns (allowed, state of the bucket that refused, else of the tightest one).
+        """
+        scopes = [(scope, identity) for scope, identity in (('ip', client_ip), ('user', user_id)) if identity]
+        if not scopes:
+            self.stats['allowed'][kind] += 1
+            return True, None
+
+        buckets = []
+        for scope, identity in scopes:
+            limit = self.limits[(scope, kind)]
+            buckets.append((f"ratelimit:{scope}:{kind}:{identity}", limit / RATE_LIMIT_WINDOW, limit))
+        allowed, levels = self.store.take_tokens(buckets)
+
+        states = []
+        for (scope, _), (_, rate, limit), tokens in zip(scopes, buckets, levels):
+            states.append({
+                'scope': scope,
+                'limit': limit,
+                'remaining': max(int(tokens), 0),
+                'reset': math.ceil((limit - tokens) / rate),
+                'retryAfter': 0 if allowed or tokens >= 1 else max(1, math.ceil((1 - tokens) / rate))
+            })
+
+        if not allowed:
+            # Nothing was charged; report the bucket that is out of tokens
+            state = next(state for state in states if state['retryAfter'])
+            self.stats['limited'][state['scope']] += 1
+            return False, state
+
+        self.stats['allowed'][kind] += 1
+        return True, min(states, key=lambda state: state['remaining'] / state['limit'])
+
+    def metrics(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'store': self.store_name,
+            'limitsPerMinute': {f"{scope}.{kind}": limit for (scope, kind), limit in self.limits.items()},
+            'allowed': dict(self.stats['allowed']),
+            'limited': dict(self.stats['limited']),
+            **({'bucketsTracked': len(self.store.buckets)} if isinstance(self.store, MemoryBuckets) else {})
+        }
+
+rate_limiter = RateLimiter()
+
+def client_ip(scope, headers: Dict[bytes, bytes], proxy_hops: int = RATE_LIMIT_PROXY_HOPS) -> Optional[str]:
+    """The caller's IP: the peer address, or the entry our own proxies appended to X-Forwarded-For"""
+    if proxy_hops:
+        forwarded = [part.strip() for part in headers.get(b'x-forwarded-for', b'').decode('latin-1').split(',') if part.strip()]
+        if len(forwarded) >= proxy_hops:
+            return forwarded[-proxy_hops]
+    client = scope.get('client')
+    return client[0] if client else None
+
+def request_user_id(scope, headers: Dict[bytes, bytes]) -> Optional[str]:
+    """The verified user: the one the caller's token was issued to"""
+    principal = current_principal.get()
+    if principal and principal['userId']:
+        return principal['userId'][:MAX_USER_ID_LENGTH]
+    return None
+
+def claimed_user_id(scope, headers: Dict[bytes, bytes]) -> Optional[str]:
+    """The userId the caller says it acts for (X-User-Id header, else the query string), unverified"""
+    user_id = headers.get(USER_ID_HEADER, b'').decode('latin-1')
+    if not user_id and scope.get('query_string'):
+        user_id = parse_qs(scope['query_string'].decode('latin-1')).get('userId', [''])[0]
+    return user_id[:MAX_USER_ID_LENGTH] or None
+
+def user_bucket_identity(ip: Optional[str], scope, headers: Dict[bytes, bytes]) -> Optional[str]:
+    """The verified user, else the claimed user at this IP"""
+    user_id = request_user_id(scope, headers)
+    if user_id:
+        return user_id
+    claimed = claimed_user_id(scope, headers)
+    return f"{ip or ''}:{claimed}" if claimed else None
+
+def rate_limit_headers(state: Dict) -> List[Tuple[bytes, bytes]]:
+    return [
+        (b'ratelimit-limit', str(state['limit']).encode()),
+        (b'ratelimit-remaining', str(state['remaining']).encode()),
+        (b'ratelimit-reset', str(state['reset']).encode()),
+        (b'ratelimit-policy', f"{state['limit']};w={RATE_LIMIT_WINDOW}".encode())
+    ]
+
+class RateLimitMiddleware:
+    """429 requests over their user or IP budget before they reach Drive"""
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if (not self.limiter.enabled or scope['type'] != 'http' or scope['method'] == 'OPTIONS'
+                or scope['path'] in RATE_LIMIT_EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get('headers', []))
+        kind = 'read' if scope['method'] in ('GET', 'HEAD') else 'write'
+        ip = client_ip(scope, headers)
+        user_id = user_bucket_identity(ip, scope, headers)
+        if isinstance(self.limiter.store, MemoryBuckets):
+            allowed, state = self.limiter.check(kind, ip, user_id)
+        else:
+            allowed, state = await run_in_threadpool(self.limiter.check, kind, ip, user_id)
+        if state is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not allowed:
+            body = json.dumps({'detail': 'Too many requests. Please slow down and retry shortly.'}).encode()
+            await send({
+                'type': 'http.response.start',
+                'status': 429,
+                'headers': [
+                    (b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'retry-after', str(state['retryAfter']).encode()),
+                    *rate_limit_headers(state)
+                ]
+            })
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        async def send_with_headers(message):
+            if message['type'] == 'http.response.start':
+                message = dict(message, headers=list(message.get('headers', [])) + rate_limit_headers(state))
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,191 @@
+"""
+Learnnect Request Deadlines - Per-route deadlines and client-disconnect cancellation
+Every request gets a deadline for its route. The deadline travels with the
+request in a ContextVar (into threadpool work too), so the Drive transport can
+check it before each call, cap socket timeouts to the time left, and abort the
+transfer in flight when the deadline passes or the client disconnects.
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+REQUEST_DEADLINE_DEFAULT = float(os.getenv('REQUEST_DEADLINE_DEFAULT', 30))
+
+# Seconds per route (None = no deadline)
+ROUTE_DEADLINES: Dict[str, Optional[float]] = {
+    '/api/storage/upload-resume': 120,
+    '/api/storage/upload-image': 60,
+    '/api/storage/upload-session': 20,
+    '/api/storage/upload-session/finalize': 20,
+    '/api/storage/user-resumes': 15,
+    '/api/storage/resume-thumbnail': 15,
+    '/api/storage/check-existing-image': 15,
+    '/api/storage/check-user-folder': 15,
+    '/api/storage/profile-bundle': 15,
+    '/api/storage/delete-resume': 20,
+    '/api/storage/delete-image': 20,
+    '/api/storage/health': 10,
+    '/api/storage/upload-progress': None,
+    '/api/storage/provision/bulk': 300
+}
+
+class RequestCancelled(Exception):
+    """The client went away; nobody will receive the result"""
+
+class DeadlineExceeded(RequestCancelled):
+    """The route's deadline passed before the work finished"""
+
+current_deadline: ContextVar[Optional['Deadline']] = ContextVar('current_deadline', default=None)
+
+class Deadline:
+    """Time budget and cancellation flag for one request"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.cancelled = False
+        self.timed_out = False
+        self.reason: Optional[str] = None
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def cancel(self, reason: str, timed_out: bool = False):
+        """Cancel the request and abort whatever Drive call is in flight"""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            self.timed_out = timed_out
+            self.reason = reason
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ Cancel callback failed: {e}")
+
+    def check(self):
+        """Raise if the request was cancelled or ran out of time"""
+        if not self.cancelled and self.remaining() <= 0:
+            self.cancel('deadline exceeded', timed_out=True)
+        if self.cancelled:
+            raise (DeadlineExceeded if self.timed_out else RequestCancelled)(self.reason)
+
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], None]):
+        """Run callback if the request is cancelled while the block runs"""
+        with self._lock:
+            self._callbacks.append(callback)
+            cancelled = self.cancelled
+        if cancelled:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._callbacks.remove(callback)
+
+def check_deadline():
+    """Raise if the current request was cancelled (no-op outside requests)"""
+    deadline = current_deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+def has_body(scope) -> bool:
+    """True if the request declares a body (Content-Length > 0 or chunked)"""
+    for key, value in scope.get('headers', []):
+        if key == b'transfer-encoding' or (key == b'content-length' and value.strip() != b'0'):
+            return True
+    return False
+
+class DeadlineMiddleware:
+    """Attach a deadline to each request and cancel it on timeout or disconnect.
+
+    Once the request body has been read (straight away for requests without
+    one), a watcher waits for the client's http.disconnect so work can be
+    abandoned while the response is still being prepared. A 5xx caused by the
+    deadline is answered as 504.
+    """
+
+    def __init__(self, app, deadlines: Dict[str, Optional[float]] = ROUTE_DEADLINES,
+                 default: float = REQUEST_DEADLINE_DEFAULT):
+        self.app = app
+        self.deadlines = deadlines
+        self.default = default
+
+    async def __call__(self, scope, receive, send):
+        seconds = self.deadlines.get(scope.get('path'), self.default) if scope['type'] == 'http' else None
+        if not seconds:
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(seconds)
+        token = current_deadline.set(deadline)
+        timer = asyncio.get_running_loop().call_later(seconds, deadline.cancel, 'deadline exceeded', True)
+        watcher: Optional[asyncio.Future] = None
+        body_message: Optional[Dict] = None
+        response_complete = False
+        replaced = False
+
+        async def watch_disconnect():
+            message = await receive()
+            if message['type'] == 'http.disconnect' and not response_complete:
+                print(f"🛑 Client disconnected; cancelling {scope['method']} {scope['path']}")
+                deadline.cancel('client disconnected')
+            return message
+
+        async def guarded_receive():
+            nonlocal watcher, body_message
+            if body_message is not None:
+                message, body_message = body_message, None
+                return message
+            if watcher is not None:
+                # The watcher already owns the next message
+                return await asyncio.shield(watcher)
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                deadline.cancel('client disconnected')
+            elif not message.get('more_body', False):
+                watcher = asyncio.ensure_future(watch_disconnect())
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_complete, replaced
+            if message['type'] == 'http.response.start' and deadline.timed_out and message['status'] >= 500:
+                replaced = True
+                body = json.dumps({'detail': 'Request deadline exceeded'}).encode()
+                await send({
+                    'type': 'http.response.start',
+                    'status': 504,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+                })
+                await send({'type': 'http.response.body', 'body': body})
+                return
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                response_complete = True
+            if not replaced:
+                await send(message)
+
+        # Without a body the app may never call receive, so start watching now
+        if not has_body(scope):
+            body_message = await receive()
+            if body_message['type'] == 'http.request':
+                watcher = asyncio.ensure_future(watch_disconnect())
+
+        try:
+            await self.app(scope, guarded_receive, guarded_send)
+        finally:
+            response_complete = True
+            timer.cancel()
+            if watcher is not None:
+                watcher.cancel()
+            current_deadline.reset(token)
@@ -0,0 +1,231 @@
+"""
+Learnnect Request Profiler - Opt-in per-request stack sampling
+Profiles a single request (admin header or sampling rate) by sampling the
+Python stacks of the threads working on it, annotates Drive calls as spans,
+and writes a speedscope file (https://www.speedscope.app) per request.
+When no request is being profiled the only cost is one ContextVar lookup.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from api_auth import authenticator
+
+PROFILE_HEADER = 'x-learnnect-profile'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+PROFILE_OUTPUT_DIR = os.getenv(
+    'PROFILE_OUTPUT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+)
+
+current_profile: ContextVar[Optional['RequestProfile']] = ContextVar('current_profile', default=None)
+
+class RequestProfile:
+    """Samples and Drive spans collected for one request"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.threads = {threading.get_ident()}
+        self.samples: List[tuple] = []  # (timestamp, thread_id, stack tuple)
+        self.spans: List[Dict] = []
+        self.active_spans: Dict[int, List[str]] = {}
+        self.lock = threading.Lock()
+
+    def take_sample(self, frames: Dict):
+        """Record the current stack of every thread working on this request"""
+        now = time.perf_counter()
+        with self.lock:
+            for thread_id in self.threads:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, frame.f_lineno))
+                    frame = frame.f_back
+                stack.reverse()
+                # Annotate the sample with the Drive call in flight on this thread
+                for label in self.active_spans.get(thread_id, []):
+                    stack.append((f"[drive] {label}", 'Google Drive API', 0))
+                self.samples.append((now, thread_id, tuple(stack)))
+
+class StackSampler:
+    """Background thread that samples stacks only while profiles are active"""
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.active: List[RequestProfile] = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def add(self, profile: RequestProfile):
+        with self.lock:
+            self.active.append(profile)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def remove(self, profile: RequestProfile):
+        with self.lock:
+            if profile in self.active:
+                self.active.remove(profile)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                profiles = list(self.active)
+            if not profiles:
+                # Sleep until the next profiled request
+                self.wakeup.clear()
+                self.wakeup.wait()
+                continue
+            frames = sys._current_frames()
+            for profile in profiles:
+                profile.take_sample(frames)
+            time.sleep(self.interval)
+
+sampler = StackSampler()
+
+@contextmanager
+def drive_span(label: str):
+    """Mark a Drive call; no-op unless the current request is being profiled"""
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+
+    thread_id = threading.get_ident()
+    profile.threads.add(thread_id)
+    with profile.lock:
+        profile.active_spans.setdefault(thread_id, []).append(label)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        with profile.lock:
+            profile.active_spans[thread_id].pop()
+            profile.spans.append({'label': label, 'start': start, 'end': end, 'thread': thread_id})
+
+def write_speedscope(profile: RequestProfile, output_dir: str = PROFILE_OUTPUT_DIR) -> str:
+    """Write the profile as a speedscope file; returns the file path"""
+    frames: List[Dict] = []
+    frame_index: Dict[tuple, int] = {}
+
+    def index_of(frame: tuple) -> int:
+        if frame not in frame_index:
+            frame_index[frame] = len(frames)
+            name, file, line = frame
+            frames.append({'name': name, 'file': file, 'line': line})
+        return frame_index[frame]
+
+    end = profile.end or time.perf_counter()
+    end_ms = (end - profile.start) * 1000
+    profiles = []
+
+    # One sampled profile per thread, weighted by time between samples
+    by_thread: Dict[int, List[tuple]] = {}
+    for timestamp, thread_id, stack in profile.samples:
+        by_thread.setdefault(thread_id, []).append((timestamp, stack))
+    for thread_id, samples in by_thread.items():
+        stacks, weights = [], []
+        for i, (timestamp, stack) in enumerate(samples):
+            next_timestamp = samples[i + 1][0] if i + 1 < len(samples) else end
+            stacks.append([index_of(frame) for frame in stack])
+            weights.append(round((next_timestamp - timestamp) * 1000, 3))
+        profiles.append({
+            'type': 'sampled',
+            'name': f"{profile.name} (thread {thread_id})",
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': round(end_ms, 3),
+            'samples': stacks,
+            'weights': weights
+        })
+
+    # Drive calls as an evented timeline (one per thread so spans nest properly)
+    spans_by_thread: Dict[int, List[Dict]] = {}
+    for span in profile.spans:
+        spans_by_thread.setdefault(span['thread'], []).append(span)
+    for thread_id, spans in spans_by_thread.items():
+        events = []
+        for span in sorted(spans, key=lambda s: s['start']):
+            frame = index_of((f"[drive] {span['label']}", 'Google Drive API', 0))
+            events.append({'type': 'O', 'frame': frame, 'at': round((span['start'] - profile.start) * 1000, 3)})
+            events.append({'type': 'C', 'frame': frame, 'at': round((span['end'] - profile.start) * 1000, 3)})
+        profiles.append({
+            'type': 'evented',
+            'name': f"Drive calls (thread {thread_id})",
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': round(end_ms, 3),
+            'events': events
+        })
+
+    os.makedirs(output_dir, exist_ok=True)
+    safe_name = ''.join(ch if ch.isalnum() else '_' for ch in profile.name).strip('_')
+    file_name = f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}_{safe_name}_{end_ms:.0f}ms.speedscope.json"
+    path = os.path.join(output_dir, file_name)
+    with open(path, 'w') as f:
+        json.dump({
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': profile.name,
+            'exporter': 'learnnect-request-profiler',
+            'activeProfileIndex': 0,
+            'shared': {'frames': frames},
+            'profiles': profiles
+        }, f)
+    return path
+
+class ProfilingMiddleware:
+    """Profile requests that carry the admin profile header, or a random sample"""
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, output_dir: str = PROFILE_OUTPUT_DIR):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+
+    def should_profile(self, scope) -> bool:
+        # Any current admin key, so keys rotated through AUTH_KEYS_FILE work here too
+        for key, value in scope.get('headers', []):
+            if key == PROFILE_HEADER.encode() and authenticator.is_admin_key(value):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(f"{scope['method']} {scope['path']}")
+        token = current_profile.set(profile)
+        sampler.add(profile)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sampler.remove(profile)
+            current_profile.reset(token)
+            profile.end = time.perf_counter()
+            try:
+                # Large profiles take a while to serialise; never stall the worker's other requests
+                path = await run_in_threadpool(write_speedscope, profile, self.output_dir)
+                print(f"🔬 Profile written: {path} ({len(profile.samples)} samples, {len(profile.spans)} Drive calls)")
+            except Exception as e:
+                print(f"⚠️ Failed to write profile: {e}")
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+Learnnect Resume Thumbnails - First-page previews for resumes
+After a resume is accepted its first page is rendered to a small PNG/WebP in a
+process pool (PDF with PyMuPDF; DOC/DOCX through LibreOffice, or the preview
+Word embeds in the DOCX), so rendering never holds up the event loop or the
+upload response. The image is stored next to the resume in Drive, its ID kept
+in the resume's appProperties, and served from /api/storage/resume-thumbnail
+with long-lived caching. Without PyMuPDF installed the feature switches itself
+off.
+
+Backfill resumes uploaded before thumbnails existed:
+    python resume_thumbnails.py --backfill
+    python resume_thumbnails.py --backfill --limit 100 --workers 4
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import zipfile
+import argparse
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Deque, Dict, Iterator, List, Optional
+
+from shared_state import shared_state
+from upload_gate import RESUME_CONTENT_TYPES
+from drive_accounts import user_context
+
+RESUME_THUMBNAILS_ENABLED = os.getenv('RESUME_THUMBNAILS_ENABLED', 'true').lower() == 'true'
+THUMBNAIL_WIDTH = int(os.getenv('THUMBNAIL_WIDTH', 400))
+THUMBNAIL_FORMAT = os.getenv('THUMBNAIL_FORMAT', 'png')  # 'webp' also needs Pillow
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+
+# Renderers leak a little per document; recycle each process after this many
+THUMBNAIL_TASKS_PER_CHILD = 50
+THUMBNAIL_TIMEOUT = 60
+THUMBNAIL_CONVERT_TIMEOUT = 45
+
+# Served URLs change whenever the thumbnail does, so browsers may keep them for long
+THUMBNAIL_MAX_AGE = int(os.getenv('THUMBNAIL_MAX_AGE', 7 * 24 * 60 * 60))
+THUMBNAIL_CACHE_TTL = 24 * 60 * 60
+
+THUMBNAIL_PREFIX = '.thumbnail_'
+THUMBNAIL_MIME_TYPES = {'png': 'image/png', 'webp': 'image/webp'}
+
+# Keeps thumbnails out of resume listings and usage counts (resumes are never images)
+THUMBNAIL_QUERY_EXCLUDE = ' and '.join(f"mimeType != '{mime_type}'" for mime_type in THUMBNAIL_MIME_TYPES.values())
+
+PDF_MIME_TYPE = 'application/pdf'
+DOCX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+RESUME_FOLDER_NAME = 'Profile-Resume'
+OFFICE_EXTENSIONS = {'application/msword': '.doc', DOCX_MIME_TYPE: '.docx'}
+
+# ----------------------------------------------------------------------
+# Rendering (runs in the worker processes)
+# ----------------------------------------------------------------------
+
+def encode_image(image, image_format: str) -> bytes:
+    """Pillow image -> PNG/WebP bytes"""
+    buffer = io.BytesIO()
+    if image_format == 'webp':
+        image.save(buffer, 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+    else:
+        image.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+def render_pdf_page(content: bytes, width: int, image_format: str) -> Optional[bytes]:
+    """First page of a PDF scaled to `width` pixels"""
+    import fitz  # PyMuPDF
+
+    with fitz.open(stream=content, filetype='pdf') as document:
+        if document.needs_pass or document.page_count == 0:
+            return None
+        page = document[0]
+        zoom = width / page.rect.width
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        if image_format == 'png':
+            return pixmap.tobytes('png')
+
+        from PIL import Image
+        return encode_image(Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples), image_format)
+
+def docx_embedded_preview(content: bytes, width: int, image_format: str) -> Optional[bytes]:
+    """The preview Word saves inside a DOCX, if there is a usable one (needs Pillow)"""
+    try:
+        from PIL import Image
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            name = next((n for n in archive.namelist() if n.lower() in ('docprops/thumbnail.png', 'docprops/thumbnail.jpeg')), None)
+            if not name:
+                return None
+            image = Image.open(io.BytesIO(archive.read(name))).convert('RGB')
+    except (ImportError, zipfile.BadZipFile, OSError):
+        return None
+    # Word's previews are tiny; only use one that is big enough not to look blurry
+    if image.width < width * 0.75:
+        return None
+    image.thumbnail((width, width * 2))
+    return encode_image(image, image_format)
+
+def convert_to_pdf(content: bytes, mime_type: str) -> Optional[bytes]:
+    """DOC/DOCX -> PDF with headless LibreOffice, if it is installed"""
+    soffice = shutil.which('soffice') or shutil.which('libreoffice')
+    if not soffice:
+        return None
+    with tempfile.TemporaryDirectory(prefix='learnnect-thumbnail-') as workdir:
+        source = os.path.join(workdir, 'resume' + OFFICE_EXTENSIONS[mime_type])
+        with open(source, 'wb') as f:
+            f.write(content)
+        # A profile per conversion, so concurrent conversions don't fight over one
+        subprocess.run(
+            [soffice, '--headless', f'-env:UserInstallation=file://{workdir}/profile',
+             '--convert-to', 'pdf', '--outdir', workdir, source],
+            capture_output=True, timeout=THUMBNAIL_CONVERT_TIMEOUT, check=False
+        )
+        pdf_path = os.path.join(workdir, 'resume.pdf')
+        if not os.path.exists(pdf_path):
+            return None
+        with open(pdf_path, 'rb') as f:
+            return f.read()
+
+def render_thumbnail(content: bytes, mime_type: str, width: int = THUMBNAIL_WIDTH,
+                     image_format: str = THUMBNAIL_FORMAT) -> Optional[bytes]:
+    """First-page image of a resume, or None when this type can't be rendered here"""
+    if mime_type == DOCX_MIME_TYPE:
+        preview = docx_embedded_preview(content, width, image_format)
+        if preview:
+            return preview
+    if mime_type in OFFICE_EXTENSIONS:
+        content = convert_to_pdf(content, mime_type)
+        if content is None:
+            return None
+    elif mime_type != PDF_MIME_TYPE:
+        return None
+    return render_pdf_page(content, width, image_format)
+
+# ----------------------------------------------------------------------
+# Generation and storage (API workers and the backfill)
+# ----------------------------------------------------------------------
+
+class ResumeThumbnailer:
+    """Renders in a process pool; a small thread pool does the Drive I/O around it"""
+
+    def __init__(self, storage, enabled: bool = RESUME_THUMBNAILS_ENABLED, workers: int = THUMBNAIL_WORKERS,
+                 image_format: str = THUMBNAIL_FORMAT):
+        self.storage = storage
+        self.enabled = enabled
+        self.workers = workers
+        self.image_format = image_format
+        self.mime_type = THUMBNAIL_MIME_TYPES[image_format]
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.render_times: Deque[float] = deque(maxlen=500)
+        self.stats = {'queued': 0, 'generated': 0, 'unsupported': 0, 'failed': 0, 'deleted': 0, 'last_error': None}
+
+    def _pools(self):
+        with self._lock:
+            if self._processes is None:
+                # Spawned, not forked: API workers run threads that must not be copied mid-flight
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    max_tasks_per_child=THUMBNAIL_TASKS_PER_CHILD
+                )
+                self._threads = ThreadPoolExecutor(max_workers=self.workers * 2, thread_name_prefix='resume-thumbnail')
+            return self._processes, self._threads
+
+    def stop(self):
+        """Drop queued work and let the pools wind down"""
+        with self._lock:
+            processes, threads = self._processes, self._threads
+            self._processes = self._threads = None
+        if threads:
+            threads.shutdown(wait=False, cancel_futures=True)
+        if processes:
+            processes.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, user_id: Optional[str], resume_id: str, folder_id: str, mime_type: str, content: Optional[bytes] = None):
+        """Queue a thumbnail for a new resume; returns straight away"""
+        if not self.enabled or mime_type not in RESUME_CONTENT_TYPES:
+            return
+        self.stats['queued'] += 1
+        _, threads = self._pools()
+        threads.submit(self._generate_quietly, user_id, resume_id, folder_id, mime_type, content)
+
+    def _generate_quietly(self, *args):
+        try:
+            self.generate(*args)
+        except Exception as e:
+            # A missing preview must never surface as an upload error
+            self.stats['failed'] += 1
+            self.stats['last_error'] = str(e)
+            print(f"⚠️ Resume thumbnail failed: {e}")
+
+    def generate(self, user_id: Optional[str], resume_id: str, folder_id: str, mime_type: str,
+                 content: Optional[bytes] = None) -> Optional[str]:
+        """Render, store and record a resume's thumbnail; returns the thumbnail file ID"""
+        if not self.enabled:
+            return None
+        with user_context(user_id):
+            service = self.storage.service
+            if content is None:
+                content = service.files().get_media(fileId=resume_id).execute()
+
+            processes, _ = self._pools()
+            start = time.perf_counter()
+            try:
+                image = processes.submit(
+                    render_thumbnail, content, mime_type, THUMBNAIL_WIDTH, self.image_format
+                ).result(timeout=THUMBNAIL_TIMEOUT)
+            except ImportError as e:
+                self.enabled = False
+                print(f"⚠️ Resume thumbnails disabled: {e} (pip install pymupdf)")
+                return None
+            except FutureTimeoutError:
+                raise RuntimeError(f"rendering took over {THUMBNAIL_TIMEOUT}s")
+            self.render_times.append(time.perf_counter() - start)
+
+            if image is None:
+                self.stats['unsupported'] += 1
+                return None
+
+            from googleapiclient.http import MediaIoBaseUpload
+            thumbnail = service.files().create(
+                body={
+                    'name': f"{THUMBNAIL_PREFIX}{resume_id}.{self.image_format}",
+                    'parents': [folder_id],
+                    'appProperties': {'thumbnailOf': resume_id}
+                },
+                media_body=MediaIoBaseUpload(io.BytesIO(image), mimetype=self.mime_type, resumable=False),
+                fields='id'
+            ).execute()
+            thumbnail_id = thumbnail['id']
+
+            try:
+                service.files().update(
+                    fileId=resume_id,
+                    body={'appProperties': {'thumbnailId': thumbnail_id, 'thumbnailType': self.mime_type}},
+                    fields='id'
+                ).execute()
+            except Exception:
+                # The resume was deleted while we rendered: don't leave the thumbnail behind
+                service.files().delete(fileId=thumbnail_id).execute()
+                raise
+
+            shared_state.set('thumbnails', resume_id, {
+                'thumbnailId': thumbnail_id,
+                'mimeType': self.mime_type,
+                'parents': [folder_id]
+            }, ttl=THUMBNAIL_CACHE_TTL)
+            if user_id:
+                self.storage.bump_listing_version(user_id)
+            self.stats['generated'] += 1
+            print(f"🖼️ Resume thumbnail created: {resume_id} ({len(image)} bytes)")
+            return thumbnail_id
+
+    def lookup(self, resume_id: str) -> Optional[Dict]:
+        """{'thumbnailId', 'mimeType', 'parents'} for a resume, or None if it has no thumbnail"""
+        record = shared_state.get('thumbnails', resume_id)
+        if record is None:
+            try:
+                resume = self.storage.service.files().get(fileId=resume_id, fields='parents, appProperties, trashed').execute()
+            except Exception:
+                return None
+            properties = resume.get('appProperties') or {}
+            if resume.get('trashed') or not properties.get('thumbnailId'):
+                return None
+            record = {
+                'thumbnailId': properties['thumbnailId'],
+                'mimeType': properties.get('thumbnailType', 'image/png'),
+                'parents': resume.get('parents') or []
+            }
+            shared_state.set('thumbnails', resume_id, record, ttl=THUMBNAIL_CACHE_TTL)
+        return record
+
+    def remember(self, resume: Dict, folder_id: str):
+        """Cache the thumbnail recorded on a listed resume"""
+        properties = resume.get('appProperties') or {}
+        if properties.get('thumbnailId'):
+            shared_state.set('thumbnails', resume['id'], {
+                'thumbnailId': properties['thumbnailId'],
+                'mimeType': properties.get('thumbnailType', 'image/png'),
+                'parents': [folder_id]
+            }, ttl=THUMBNAIL_CACHE_TTL)
+
+    def download(self, thumbnail_id: str) -> bytes:
+        return self.storage.service.files().get_media(fileId=thumbnail_id).execute()
+
+    def delete_for(self, user_id: Optional[str], resume_id: str):
+        """Delete a removed resume's thumbnail in the background"""
+        record = shared_state.get('thumbnails', resume_id)
+        shared_state.delete('thumbnails', resume_id)
+        _, threads = self._pools()
+        threads.submit(self._delete_quietly, user_id, resume_id, record)
+
+    def _delete_quietly(self, user_id: Optional[str], resume_id: str, record: Optional[Dict]):
+        try:
+            with user_context(user_id):
+                service = self.storage.service
+                if record:
+                    thumbnail_ids = [record['thumbnailId']]
+                else:
+                    results = service.files().list(
+                        q=f"appProperties has {{ key='thumbnailOf' and value='{resume_id}' }} and trashed=false",
+                        fields='files(id)'
+                    ).execute()
+                    thumbnail_ids = [file['id'] for file in results.get('files', [])]
+                for thumbnail_id in thumbnail_ids:
+                    service.files().delete(fileId=thumbnail_id).execute()
+                    self.stats['deleted'] += 1
+        except Exception as e:
+            # Left for the backfill's orphan cleanup
+            print(f"⚠️ Could not delete thumbnail of {resume_id}: {e}")
+
+    def metrics(self) -> Dict:
+        times = sorted(self.render_times)
+
+        def percentile(fraction: float):
+            return round(times[min(int(len(times) * fraction), len(times) - 1)] * 1000, 1) if times else 0
+
+        return {
+            'enabled': self.enabled,
+            'format': self.image_format,
+            'workers': self.workers,
+            'queued': self.stats['queued'],
+            'generated': self.stats['generated'],
+            'unsupported': self.stats['unsupported'],
+            'failed': self.stats['failed'],
+            'deleted': self.stats['deleted'],
+            'renderMs': {'p50': percentile(0.5), 'p95': percentile(0.95)},
+            'lastError': self.stats['last_error']
+        }
+
+# ----------------------------------------------------------------------
+# Backfill
+# ----------------------------------------------------------------------
+
+def list_all(service, query: str, fields: str) -> Iterator[Dict]:
+    """Every file matching a query, following pagination"""
+    page_token = None
+    while True:
+        response = service.files().list(
+            q=query, fields=f'nextPageToken, files({fields})', pageSize=1000, pageToken=page_token
+        ).execute(num_retries=5)
+        yield from response.get('files', [])
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+def backfill(thumbnailer: ResumeThumbnailer, workers: int = 4, limit: int = 0, dry_run: bool = False) -> Dict:
+    """Thumbnail every resume without one, and delete thumbnails whose resume is gone"""
+    service = thumbnailer.storage.service
+    stats = {'folders': 0, 'missing': 0, 'generated': 0, 'unsupported': 0, 'failed': 0, 'orphans': 0}
+
+    pending: List[tuple] = []
+    for folder in list_all(service, f"name = '{RESUME_FOLDER_NAME}' and mimeType = '{FOLDER_MIME_TYPE}' and trashed=false", 'id'):
+        stats['folders'] += 1
+        files = list(list_all(service, f"'{folder['id']}' in parents and trashed=false", 'id, name, mimeType, appProperties'))
+        resume_ids = {file['id'] for file in files if file['mimeType'] in RESUME_CONTENT_TYPES}
+        for file in files:
+            properties = file.get('appProperties') or {}
+            if file['mimeType'] in RESUME_CONTENT_TYPES and not properties.get('thumbnailId'):
+                pending.append((file['id'], folder['id'], file['mimeType'], file['name']))
+            elif properties.get('thumbnailOf') and properties['thumbnailOf'] not in resume_ids:
+                stats['orphans'] += 1
+                if not dry_run:
+                    service.files().delete(fileId=file['id']).execute()
+
+    if limit:
+        pending = pending[:limit]
+    stats['missing'] = len(pending)
+    print(f"📄 {len(pending)} resumes without a thumbnail in {stats['folders']} folders, {stats['orphans']} orphaned thumbnails")
+    if dry_run:
+        for _, _, _, name in pending:
+            print(f"   {name}")
+        return stats
+
+    def run(item) -> Optional[str]:
+        resume_id, folder_id, mime_type, _ = item
+        # No user ID here: the Drive changes sync refreshes the owners' cached listings
+        return thumbnailer.generate(None, resume_id, folder_id, mime_type)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run, item): item for item in pending}
+        for index, (future, item) in enumerate(futures.items(), 1):
+            try:
+                if future.result():
+                    stats['generated'] += 1
+                else:
+                    stats['unsupported'] += 1
+            except Exception as e:
+                stats['failed'] += 1
+                print(f"⚠️ Failed to thumbnail {item[3]}: {e}")
+            if index % 100 == 0:
+                print(f"   ⏳ {index}/{len(pending)} resumes processed")
+    return stats
+
+def main():
+    """Parse arguments and backfill thumbnails"""
+    parser = argparse.ArgumentParser(description="Generate thumbnails for existing Learnnect resumes")
+    parser.add_argument('--backfill', action='store_true', help="Thumbnail resumes that have none")
+    parser.add_argument('--workers', type=int, default=4, help="Resumes processed concurrently")
+    parser.add_argument('--limit', type=int, default=0, help="Process at most this many resumes")
+    parser.add_argument('--dry-run', action='store_true', help="Only list what would be done")
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.print_help()
+        return 2
+
+    print("🖼️ Learnnect Resume Thumbnail Backfill")
+    print("=" * 50)
+
+    from learnnect_storage_api import LearnnectStorageService
+
+    storage = LearnnectStorageService()
+    storage.initialize_drive_service()
+    if not storage.service:
+        print("❌ Google Drive service not available. Check service account configuration.")
+        return 1
+
+    thumbnailer = ResumeThumbnailer(storage, enabled=True, workers=args.workers)
+    try:
+        stats = backfill(thumbnailer, args.workers, args.limit, args.dry_run)
+    finally:
+        thumbnailer.stop()
+    if args.dry_run:
+        return 0
+
+    print()
+    print("📊 Backfill Summary")
+    print("=" * 50)
+    print(f"   ✅ Generated: {stats['generated']}")
+    print(f"   ⏭️  Not renderable here: {stats['unsupported']}")
+    print(f"   🗑️  Orphaned thumbnails deleted: {stats['orphans']}")
+    print(f"   ⚠️  Failed: {stats['failed']}")
+    if stats['unsupported']:
+        print("💡 DOC/DOCX resumes need LibreOffice (soffice) on the PATH")
+    if stats['failed']:
+        print("💡 Re-run to retry the failed resumes")
+    return 1 if stats['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -96,14 +96,22 @@ def test_folder_access():
         print(f"   📁 Folder name: {folder['name']}")
         print(f"   🆔 Folder ID: {folder_id}")
         
-        # Test if we can list files in the folder
-        files = service.files().list(
-            q=f"'{folder_id}' in parents and trashed=false",
-            fields='files(id, name)'
-        ).execute()
-        
-        file_count = len(files.get('files', []))
-        print(f"   📄 Files in folder: {file_count}")
+        # Test if we can list files in the folder (follow every page)
+        file_count = 0
+        page_token = None
+        while True:
+            files = service.files().list(
+                q=f"'{folder_id}' in parents and trashed=false",
+                fields='nextPageToken, files(id)',
+                pageSize=1000,
+                pageToken=page_token
+            ).execute()
+            file_count += len(files.get('files', []))
+            page_token = files.get('nextPageToken')
+            if not page_token:
+                break
+        print(f"   📄 Items in folder: {file_count}")
+        print("   📊 For per-user usage run: python storage_audit.py --output audit.csv")
         
         return True
         
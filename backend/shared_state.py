@@ -0,0 +1,314 @@
+"""
+Learnnect Shared State - Cross-worker state for the storage API
+SQLite-backed key/value store, token buckets and single-flight locks shared
+by every worker process on the same host
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+# SQLite file shared by all workers (WAL mode allows concurrent readers + one writer)
+SHARED_STATE_PATH = os.getenv(
+    'LEARNNECT_STATE_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'learnnect_state.db')
+)
+
+# Token buckets untouched for this long are purged
+BUCKET_IDLE_TTL = 24 * 60 * 60
+
+class SharedState:
+    def __init__(self, path: str = SHARED_STATE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._ensure_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection, reopening it after a fork"""
+        if self._pid != os.getpid():
+            # Connections must never be shared across a fork
+            self._local = threading.local()
+            self._pid = os.getpid()
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _ensure_schema(self):
+        """Create tables if they don't exist yet"""
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS kv ('
+            ' namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,'
+            ' expires_at REAL, PRIMARY KEY (namespace, key))'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            ' name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS locks ('
+            ' name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def reset_after_fork(self):
+        """Drop inherited connections (called from the gunicorn post_fork hook)"""
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    # ------------------------------------------------------------------
+    # Key/value with optional TTL
+    # ------------------------------------------------------------------
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """Get a JSON value, ignoring expired entries"""
+        row = self._connect().execute(
+            'SELECT value, expires_at FROM kv WHERE namespace=? AND key=?',
+            (namespace, key)
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return default
+        return json.loads(value)
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a JSON value, optionally expiring after ttl seconds"""
+        expires_at = time.time() + ttl if ttl else None
+        self._connect().execute(
+            'INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+            (namespace, key, json.dumps(value), expires_at)
+        )
+
+    def delete(self, namespace: str, key: str):
+        """Remove a value"""
+        self._connect().execute('DELETE FROM kv WHERE namespace=? AND key=?', (namespace, key))
+
+    def incr(self, namespace: str, key: str, amount: int = 1) -> int:
+        """Atomically increment an integer counter and return the new value"""
+        conn = self._connect()
+        with self._transaction(conn):
+            row = conn.execute(
+                'SELECT value FROM kv WHERE namespace=? AND key=?', (namespace, key)
+            ).fetchone()
+            value = (json.loads(row[0]) if row else 0) + amount
+            conn.execute(
+                'INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, NULL)',
+                (namespace, key, json.dumps(value))
+            )
+        return value
+
+    def add_counters(self, namespace: str, key: str, deltas: Dict[str, int], fields: Optional[Dict] = None) -> Dict:
+        """Atomically add deltas to counters stored in a JSON object.
+
+        Nested counters use dotted names ('resume.bytes'); `fields` are plain
+        values set alongside. Returns the updated object.
+        """
+        conn = self._connect()
+        with self._transaction(conn):
+            row = conn.execute(
+                'SELECT value FROM kv WHERE namespace=? AND key=?', (namespace, key)
+            ).fetchone()
+            value = json.loads(row[0]) if row else {}
+            for name, delta in deltas.items():
+                target = value
+                *path, leaf = name.split('.')
+                for part in path:
+                    target = target.setdefault(part, {})
+                target[leaf] = target.get(leaf, 0) + delta
+            value.update(fields or {})
+            conn.execute(
+                'INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, NULL)',
+                (namespace, key, json.dumps(value))
+            )
+        return value
+
+    def compare_and_set(self, namespace: str, key: str, expected: Any, value: Any) -> bool:
+        """Store a JSON value only if the current one still equals `expected` (None: absent)"""
+        conn = self._connect()
+        with self._transaction(conn):
+            row = conn.execute(
+                'SELECT value FROM kv WHERE namespace=? AND key=?', (namespace, key)
+            ).fetchone()
+            if (json.loads(row[0]) if row else None) != expected:
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, NULL)',
+                (namespace, key, json.dumps(value))
+            )
+        return True
+
+    def items(self, namespace: str) -> List[Tuple[str, Any]]:
+        """All live (key, value) pairs in a namespace"""
+        rows = self._connect().execute(
+            'SELECT key, value FROM kv WHERE namespace=? AND (expires_at IS NULL OR expires_at >= ?)',
+            (namespace, time.time())
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def export_rows(self, namespaces: List[str]) -> List[Tuple[str, str, str, Optional[float]]]:
+        """Live (namespace, key, raw JSON value, expires_at) rows, for snapshots"""
+        placeholders = ','.join('?' * len(namespaces))
+        return self._connect().execute(
+            f'SELECT namespace, key, value, expires_at FROM kv WHERE namespace IN ({placeholders})'
+            ' AND (expires_at IS NULL OR expires_at >= ?)',
+            (*namespaces, time.time())
+        ).fetchall()
+
+    def import_rows(self, rows: List[Tuple[str, str, str, Optional[float]]]) -> List[Tuple[str, str, str, Optional[float]]]:
+        """Insert snapshot rows that are still live, never overwriting current values; returns those inserted"""
+        now = time.time()
+        inserted = []
+        conn = self._connect()
+        with self._transaction(conn):
+            for row in rows:
+                if row[3] is not None and row[3] < now:
+                    continue
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)', row
+                )
+                if cursor.rowcount == 1:
+                    inserted.append(row)
+        return inserted
+
+    def remove_rows(self, rows: List[Tuple[str, str, str, Optional[float]]]):
+        """Undo an import: delete the rows that still hold the imported values"""
+        conn = self._connect()
+        with self._transaction(conn):
+            conn.executemany(
+                'DELETE FROM kv WHERE namespace=? AND key=? AND value=?',
+                [(namespace, key, value) for namespace, key, value, _ in rows]
+            )
+
+    def purge_expired(self):
+        """Delete expired values, stale locks and idle buckets"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?', (now,))
+        conn.execute('DELETE FROM locks WHERE expires_at < ?', (now,))
+        # An idle bucket has long since refilled, so dropping it changes nothing
+        conn.execute('DELETE FROM buckets WHERE updated_at < ?', (now - BUCKET_IDLE_TTL,))
+
+    # ------------------------------------------------------------------
+    # Token buckets (used for rate limiting)
+    # ------------------------------------------------------------------
+
+    def take_token(self, name: str, rate: float, capacity: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """Try to take tokens from a bucket refilled at `rate` per second.
+
+        Returns (allowed, tokens_remaining).
+        """
+        now = time.time()
+        conn = self._connect()
+        with self._transaction(conn):
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM buckets WHERE name=?', (name,)
+            ).fetchone()
+            if row is None:
+                tokens = capacity
+            else:
+                tokens = min(capacity, row[0] + (now - row[1]) * rate)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+                (name, tokens, now)
+            )
+        return allowed, tokens
+
+    def take_tokens(self, buckets: List[Tuple[str, float, float]], cost: float = 1.0) -> Tuple[bool, List[float]]:
+        """Take tokens from several buckets only if every one has enough (all or nothing).
+
+        buckets are (name, rate, capacity); returns (allowed, tokens_remaining per bucket).
+        """
+        now = time.time()
+        conn = self._connect()
+        with self._transaction(conn):
+            levels = []
+            for name, rate, capacity in buckets:
+                row = conn.execute(
+                    'SELECT tokens, updated_at FROM buckets WHERE name=?', (name,)
+                ).fetchone()
+                levels.append(capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate))
+
+            allowed = all(tokens >= cost for tokens in levels)
+            if allowed:
+                levels = [tokens - cost for tokens in levels]
+
+            conn.executemany(
+                'INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+                [(name, tokens, now) for (name, _, _), tokens in zip(buckets, levels)]
+            )
+        return allowed, levels
+
+    # ------------------------------------------------------------------
+    # Single-flight locks
+    # ------------------------------------------------------------------
+
+    def try_acquire(self, name: str, ttl: float = 30.0) -> Optional[str]:
+        """Try to take a named lock; returns an owner token or None"""
+        owner = f"{os.getpid()}:{threading.get_ident()}:{time.time()}"
+        now = time.time()
+        conn = self._connect()
+        with self._transaction(conn):
+            conn.execute('DELETE FROM locks WHERE name=? AND expires_at < ?', (name, now))
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO locks (name, owner, expires_at) VALUES (?, ?, ?)',
+                (name, owner, now + ttl)
+            )
+        return owner if cursor.rowcount == 1 else None
+
+    def renew(self, name: str, owner: str, ttl: float) -> bool:
+        """Extend a lock we still own; False if it was lost"""
+        cursor = self._connect().execute(
+            'UPDATE locks SET expires_at=? WHERE name=? AND owner=?', (time.time() + ttl, name, owner)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, name: str, owner: str):
+        """Release a lock if we still own it"""
+        self._connect().execute('DELETE FROM locks WHERE name=? AND owner=?', (name, owner))
+
+    @contextmanager
+    def single_flight(self, name: str, ttl: float = 30.0, wait: float = 30.0):
+        """Hold a cross-worker lock so only one worker does the guarded work.
+
+        Waits up to `wait` seconds; if the lock can't be taken the block runs
+        anyway so a dead lock owner can never wedge requests.
+        """
+        deadline = time.time() + wait
+        owner = self.try_acquire(name, ttl)
+        while owner is None and time.time() < deadline:
+            time.sleep(0.05)
+            owner = self.try_acquire(name, ttl)
+        try:
+            yield owner is not None
+        finally:
+            if owner:
+                self.release(name, owner)
+
+    @contextmanager
+    def _transaction(self, conn: sqlite3.Connection):
+        """Run statements inside an immediate (write-locked) transaction"""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+shared_state = SharedState()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Learnnect Storage Audit - Per-user storage usage report for the whole folder tree
+Walks every Learnnect_<prefix>_<id> folder under LEARNNECT_DRIVE_FOLDER_ID (through
+the hash bucket folders) with bounded parallelism and writes per-user bytes, file
+counts, orphaned/duplicate folders and files over retention to CSV or Parquet.
+
+Resumable: finished folders are appended to a checkpoint file, so re-running the
+same command continues where it stopped.
+
+Usage:
+    python storage_audit.py --output audit.csv
+    python storage_audit.py --output audit.parquet --workers 16 --retention-days 365
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+USER_FOLDER_PATTERN = re.compile(r'^Learnnect_(.+)_([^_]{1,8})$')
+
+# Hash bucket folders above the user folders (matches USER_FOLDER_BUCKET_LEVELS in the API)
+BUCKET_FOLDER_PATTERN = re.compile(r'^[0-9a-f]{2}$')
+BUCKET_LEVELS = 2
+
+# Subfolder -> report column prefix (matches SUBFOLDER_NAMES in the API)
+CATEGORIES = {
+    'Profile-Resume': 'resume',
+    'Profile-Picture': 'profile',
+    'Profile-Banner': 'banner'
+}
+
+# Rendered resume thumbnails sit in Profile-Resume but aren't user files (matches THUMBNAIL_MIME_TYPES in resume_thumbnails)
+THUMBNAIL_MIME_TYPES = {'image/png', 'image/webp'}
+
+# Images beyond the newest N per type are over retention (cleanup_old_files keep_count)
+IMAGE_KEEP_COUNT = 3
+
+REPORT_COLUMNS = [
+    'folder_id', 'folder_name', 'email_prefix', 'user_key', 'status', 'duplicate_of',
+    'total_bytes', 'file_count',
+    'resume_bytes', 'resume_count', 'profile_bytes', 'profile_count', 'banner_bytes', 'banner_count',
+    'other_bytes', 'other_count', 'over_retention_count', 'over_retention_bytes', 'created_time'
+]
+
+_local = threading.local()
+
+def get_service(credentials):
+    """One Drive client per thread (httplib2 connections are not thread-safe)"""
+    if getattr(_local, 'service', None) is None:
+        from drive_http import build_drive_service
+        _local.service = build_drive_service(credentials)
+    return _local.service
+
+def list_children(service, folder_id: str) -> Iterator[Dict]:
+    """Yield every non-trashed child of a folder, following pagination"""
+    page_token = None
+    while True:
+        response = service.files().list(
+            q=f"'{folder_id}' in parents and trashed=false",
+            fields='nextPageToken, files(id, name, mimeType, size, createdTime)',
+            pageSize=1000,
+            pageToken=page_token
+        ).execute(num_retries=5)
+        yield from response.get('files', [])
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+def list_user_folders(credentials, root_folder_id: str, workers: int) -> Tuple[List[Dict], List[Dict]]:
+    """User folders and stray files, descending through the bucket folders.
+
+    Returns (folders, stray_files). Each bucket level is listed in parallel;
+    user folders still in the root (not yet migrated) are included too.
+    """
+    folders, stray_files = [], []
+    parents = [root_folder_id]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for depth in range(BUCKET_LEVELS + 1):
+            listings = executor.map(lambda folder_id: list(list_children(get_service(credentials), folder_id)), parents)
+            parents = []
+            for item in (item for listing in listings for item in listing):
+                if item['mimeType'] != FOLDER_MIME_TYPE:
+                    stray_files.append(item)
+                elif depth < BUCKET_LEVELS and BUCKET_FOLDER_PATTERN.match(item['name']):
+                    parents.append(item['id'])
+                else:
+                    folders.append(item)
+            if not parents:
+                break
+    return folders, stray_files
+
+def audit_user_folder(credentials, folder: Dict, retention_cutoff: Optional[str]) -> Dict:
+    """Compute usage for one user folder"""
+    service = get_service(credentials)
+    match = USER_FOLDER_PATTERN.match(folder['name'])
+    row = {column: 0 for column in REPORT_COLUMNS}
+    row.update({
+        'folder_id': folder['id'],
+        'folder_name': folder['name'],
+        'email_prefix': match.group(1) if match else '',
+        'user_key': match.group(2) if match else '',
+        'status': 'ok',
+        'duplicate_of': '',
+        'created_time': folder.get('createdTime', '')
+    })
+
+    for child in list_children(service, folder['id']):
+        if child['mimeType'] == FOLDER_MIME_TYPE and child['name'] in CATEGORIES:
+            category = CATEGORIES[child['name']]
+            files = [
+                f for f in list_children(service, child['id'])
+                if f['mimeType'] != FOLDER_MIME_TYPE and not (category == 'resume' and f['mimeType'] in THUMBNAIL_MIME_TYPES)
+            ]
+            files.sort(key=lambda f: f.get('createdTime', ''), reverse=True)
+            for index, file in enumerate(files):
+                size = int(file.get('size', 0))
+                row[f'{category}_bytes'] += size
+                row[f'{category}_count'] += 1
+                expired = retention_cutoff and file.get('createdTime', '') < retention_cutoff
+                if (category != 'resume' and index >= IMAGE_KEEP_COUNT) or expired:
+                    row['over_retention_count'] += 1
+                    row['over_retention_bytes'] += size
+        elif child['mimeType'] != FOLDER_MIME_TYPE:
+            # Files outside the standard subfolders
+            row['other_bytes'] += int(child.get('size', 0))
+            row['other_count'] += 1
+
+    for category in list(CATEGORIES.values()) + ['other']:
+        row['total_bytes'] += row[f'{category}_bytes']
+        row['file_count'] += row[f'{category}_count']
+
+    if row['file_count'] == 0:
+        row['status'] = 'empty'
+    return row
+
+def load_checkpoint(path: str) -> Dict[str, Dict]:
+    """Rows already audited in a previous run, keyed by folder ID"""
+    done = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    row = json.loads(line)
+                    done[row['folder_id']] = row
+    return done
+
+def write_report(rows: List[Dict], output: str):
+    """Write rows as CSV, or Parquet when the output ends in .parquet"""
+    if output.endswith('.parquet'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("❌ Parquet output requires pyarrow (pip install pyarrow), or use a .csv output")
+        table = pa.Table.from_pylist([{column: row.get(column) for column in REPORT_COLUMNS} for row in rows])
+        pq.write_table(table, output)
+    else:
+        with open(output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+
+def run_audit(credentials, root_folder_id: str, output: str, checkpoint: str,
+              workers: int = 8, retention_days: Optional[int] = None) -> List[Dict]:
+    """Audit all user folders, resuming from the checkpoint file"""
+    retention_cutoff = None
+    if retention_days:
+        retention_cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime('%Y-%m-%dT%H:%M:%S')
+
+    print(f"🔍 Listing user folders under {root_folder_id}...")
+    folders, stray_files = list_user_folders(credentials, root_folder_id, workers)
+    print(f"   📁 {len(folders)} folders, 📄 {len(stray_files)} stray files")
+
+    done = load_checkpoint(checkpoint)
+    pending = [folder for folder in folders if folder['id'] not in done]
+    if done:
+        print(f"♻️  Resuming: {len(done)} folders already audited, {len(pending)} to go")
+
+    checkpoint_lock = threading.Lock()
+    completed = 0
+    failed = 0
+
+    with open(checkpoint, 'a') as checkpoint_file, ThreadPoolExecutor(max_workers=workers) as executor:
+        queue = iter(pending)
+        in_flight = {}
+
+        def submit_next() -> bool:
+            folder = next(queue, None)
+            if folder is None:
+                return False
+            in_flight[executor.submit(audit_user_folder, credentials, folder, retention_cutoff)] = folder
+            return True
+
+        # Keep at most 2x workers tasks queued so memory stays flat for huge trees
+        for _ in range(workers * 2):
+            if not submit_next():
+                break
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                folder = in_flight.pop(future)
+                try:
+                    row = future.result()
+                    with checkpoint_lock:
+                        checkpoint_file.write(json.dumps(row) + '\n')
+                        checkpoint_file.flush()
+                    done[row['folder_id']] = row
+                    completed += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"⚠️ Failed to audit {folder['name']}: {e}")
+                submit_next()
+
+            if completed and completed % 500 == 0:
+                print(f"   ⏳ {completed}/{len(pending)} folders audited")
+
+    rows = [done[folder['id']] for folder in folders if folder['id'] in done]
+
+    # Flag orphaned (misnamed) and duplicate folders; the oldest of a name is canonical
+    by_name: Dict[str, List[Dict]] = {}
+    for row in rows:
+        if not USER_FOLDER_PATTERN.match(row['folder_name']):
+            row['status'] = 'orphaned'
+        by_name.setdefault(row['folder_name'], []).append(row)
+    for same_name in by_name.values():
+        if len(same_name) > 1:
+            same_name.sort(key=lambda r: r.get('created_time', ''))
+            for duplicate in same_name[1:]:
+                duplicate['status'] = 'duplicate'
+                duplicate['duplicate_of'] = same_name[0]['folder_id']
+
+    for file in stray_files:
+        row = {column: 0 for column in REPORT_COLUMNS}
+        row.update({
+            'folder_id': file['id'], 'folder_name': file['name'], 'email_prefix': '', 'user_key': '',
+            'status': 'orphaned', 'duplicate_of': '', 'created_time': file.get('createdTime', ''),
+            'total_bytes': int(file.get('size', 0)), 'file_count': 1,
+            'other_bytes': int(file.get('size', 0)), 'other_count': 1
+        })
+        rows.append(row)
+
+    write_report(rows, output)
+
+    total_bytes = sum(row['total_bytes'] for row in rows)
+    print()
+    print("📊 Audit Summary")
+    print("=" * 50)
+    print(f"   👥 User folders: {sum(1 for row in rows if row['status'] in ('ok', 'empty'))}")
+    print(f"   📄 Files: {sum(row['file_count'] for row in rows)} ({total_bytes / (1024 * 1024):.1f} MB)")
+    print(f"   🕳️  Empty folders: {sum(1 for row in rows if row['status'] == 'empty')}")
+    print(f"   👯 Duplicate folders: {sum(1 for row in rows if row['status'] == 'duplicate')}")
+    print(f"   🚧 Orphaned items: {sum(1 for row in rows if row['status'] == 'orphaned')}")
+    print(f"   🗑️  Files over retention: {sum(row['over_retention_count'] for row in rows)}")
+    if failed:
+        print(f"   ⚠️  {failed} folders failed; re-run to retry them")
+    print(f"💾 Report written to: {output}")
+    return rows
+
+def main():
+    """Parse arguments and run the audit"""
+    parser = argparse.ArgumentParser(description="Audit Learnnect Drive storage usage per user")
+    parser.add_argument('--output', default='storage_audit.csv', help="Report path (.csv or .parquet)")
+    parser.add_argument('--checkpoint', default=None, help="Checkpoint file (default: <output>.checkpoint.jsonl)")
+    parser.add_argument('--workers', type=int, default=8, help="Concurrent folder listings")
+    parser.add_argument('--retention-days', type=int, default=None, help="Also flag files older than this")
+    parser.add_argument('--restart', action='store_true', help="Ignore any existing checkpoint")
+    args = parser.parse_args()
+
+    print("📊 Learnnect Storage Audit")
+    print("=" * 50)
+
+    from learnnect_storage_api import LearnnectStorageService, LEARNNECT_FOLDER_ID
+
+    storage = LearnnectStorageService()
+    storage.initialize_drive_service()
+    if not storage.service:
+        print("❌ Google Drive service not available. Check service account configuration.")
+        return 1
+
+    checkpoint = args.checkpoint or f"{args.output}.checkpoint.jsonl"
+    if args.restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    run_audit(storage.credentials, LEARNNECT_FOLDER_ID, args.output, checkpoint, args.workers, args.retention_days)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Learnnect Storage Usage - Per-user storage counters
+Bytes and file counts per category are kept incrementally on every upload and
+delete, so usage reads and quota checks are O(1). A background reconciler
+periodically recounts from Drive to correct drift (e.g. files changed in the
+Drive UI).
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Optional
+
+from shared_state import shared_state
+
+USAGE_CATEGORIES = ['resume', 'profile', 'banner']
+
+# Per-user quota across all categories (0 disables enforcement)
+USER_STORAGE_QUOTA_BYTES = int(os.getenv('USER_STORAGE_QUOTA_BYTES', 50 * 1024 * 1024))
+
+USAGE_RECONCILE_INTERVAL = int(os.getenv('USAGE_RECONCILE_INTERVAL', 300))
+USAGE_RECONCILE_MAX_AGE = int(os.getenv('USAGE_RECONCILE_MAX_AGE', 24 * 60 * 60))
+USAGE_RECONCILE_BATCH = int(os.getenv('USAGE_RECONCILE_BATCH', 50))
+
+def record_usage(user_id: str, category: str, bytes_delta: int, files_delta: int, user_email: Optional[str] = None):
+    """Adjust a user's counters after an upload (+) or delete (-)"""
+    fields = {'userEmail': user_email} if user_email else None
+    # version changes on every adjustment, so a recount can tell it raced one
+    shared_state.add_counters('usage', user_id, {
+        f'{category}.bytes': bytes_delta,
+        f'{category}.files': files_delta,
+        'version': 1
+    }, fields)
+
+def get_usage(user_id: str) -> Dict:
+    """Current counters for a user, with totals and quota"""
+    record = shared_state.get('usage', user_id) or {}
+    usage = {}
+    total_bytes = total_files = 0
+    for category in USAGE_CATEGORIES:
+        counters = record.get(category, {})
+        # Counters can't go below zero even if a delete raced a reconciliation
+        category_bytes = max(counters.get('bytes', 0), 0)
+        category_files = max(counters.get('files', 0), 0)
+        usage[category] = {'bytes': category_bytes, 'files': category_files}
+        total_bytes += category_bytes
+        total_files += category_files
+
+    usage['totalBytes'] = total_bytes
+    usage['totalFiles'] = total_files
+    usage['quotaBytes'] = USER_STORAGE_QUOTA_BYTES or None
+    usage['remainingBytes'] = max(USER_STORAGE_QUOTA_BYTES - total_bytes, 0) if USER_STORAGE_QUOTA_BYTES else None
+    usage['reconciledAt'] = record.get('reconciledAt')
+    return usage
+
+def check_quota(user_id: str, incoming_bytes: int, replaced_bytes: int = 0) -> bool:
+    """True if the upload fits within the user's quota"""
+    if not USER_STORAGE_QUOTA_BYTES:
+        return True
+    return get_usage(user_id)['totalBytes'] - replaced_bytes + incoming_bytes <= USER_STORAGE_QUOTA_BYTES
+
+def track_user(user_id: str, user_email: str):
+    """Make sure a user is known to the reconciler (e.g. accounts created before counters existed)"""
+    if shared_state.get('usage', user_id) is None:
+        shared_state.add_counters('usage', user_id, {}, {'userEmail': user_email, 'reconciledAt': None})
+
+class UsageReconciler:
+    """Background recount of usage counters from Drive, a few users per cycle"""
+
+    def __init__(self, storage, interval: int = USAGE_RECONCILE_INTERVAL):
+        self.storage = storage
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'reconciled': 0, 'corrected': 0, 'raced': 0, 'errors': 0}
+
+    def start(self):
+        """Start reconciling in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='usage-reconciler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            owner = shared_state.try_acquire('usage-reconcile', ttl=self.interval * 2)
+            if not owner:
+                continue  # Another worker is reconciling
+            try:
+                self.reconcile_batch()
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"⚠️ Usage reconciliation failed: {e}")
+            finally:
+                shared_state.release('usage-reconcile', owner)
+
+    def reconcile_batch(self, limit: int = USAGE_RECONCILE_BATCH) -> int:
+        """Recount the users whose counters are oldest; returns users reconciled"""
+        cutoff = time.time() - USAGE_RECONCILE_MAX_AGE
+        stale = [
+            (record.get('reconciledAt') or 0, user_id, record)
+            for user_id, record in shared_state.items('usage')
+            if (record.get('reconciledAt') or 0) < cutoff and record.get('userEmail')
+        ]
+        stale.sort(key=lambda entry: entry[0])
+
+        for _, user_id, record in stale[:limit]:
+            self.reconcile_user(user_id, record['userEmail'])
+        return min(len(stale), limit)
+
+    def reconcile_user(self, user_id: str, user_email: str) -> Optional[Dict]:
+        """Recount one user's usage from Drive and overwrite the counters.
+
+        The counters are only replaced if nothing adjusted them during the
+        recount (compare-and-set on the whole record); otherwise the recount
+        may miss or double an upload, so the user is left for the next cycle.
+        """
+        previous = shared_state.get('usage', user_id)
+        counts = self.storage.count_user_usage(user_id, user_email)
+        record = dict(counts, userEmail=user_email, reconciledAt=time.time(),
+                      version=(previous or {}).get('version', 0))
+        if not shared_state.compare_and_set('usage', user_id, previous, record):
+            self.stats['raced'] += 1
+            return None
+
+        self.stats['reconciled'] += 1
+        if any((previous or {}).get(category) != counts[category] for category in USAGE_CATEGORIES):
+            self.stats['corrected'] += 1
+        return record
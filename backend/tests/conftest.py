@@ -0,0 +1,118 @@
+"""
+Learnnect backend tests - shared setup
+Modules read their settings when imported, so the environment is pointed at a
+throwaway state database and spool before any of them is.
+"""
+
+import os
+import sys
+import uuid
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DIR = tempfile.mkdtemp(prefix='learnnect-tests-')
+
+SERVICE_KEY = 'test-service-key'
+ADMIN_KEY = 'test-admin-key'
+JWT_SECRET = 'test-jwt-secret'
+
+os.environ.update(
+    LEARNNECT_STATE_DB=os.path.join(TEST_DIR, 'state.db'),
+    UPLOAD_SPOOL_DIR=os.path.join(TEST_DIR, 'upload_spool'),
+    CACHE_SNAPSHOT_PATH=os.path.join(TEST_DIR, 'cache_snapshot.json.gz'),
+    API_SECRET_KEY=SERVICE_KEY,
+    ADMIN_API_KEY=ADMIN_KEY,
+    JWT_SECRET_KEY=JWT_SECRET,
+    AUTH_REQUIRED='false',
+    RATE_LIMIT_ENABLED='false',
+    # Background workers that would race the tests are started by the tests that need them
+    DRIVE_SYNC_ENABLED='false',
+    CACHE_SNAPSHOT_ENABLED='false',
+    RESUME_THUMBNAILS_ENABLED='false',
+    UPLOAD_WRITE_BEHIND='false'
+)
+for name in ('AUTH_KEYS_FILE', 'API_SECRET_KEY_PREVIOUS', 'ADMIN_API_KEY_PREVIOUS', 'JWT_SECRET_KEY_PREVIOUS'):
+    os.environ.pop(name, None)
+os.environ.pop('DRIVE_RECORD_DIR', None)
+sys.path.insert(0, BACKEND_DIR)
+
+def pytest_addoption(parser):
+    parser.addoption('--run-slow', action='store_true', help="Also run slow tests (the soak smoke run)")
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: takes a minute or more; only runs with --run-slow')
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--run-slow'):
+        return
+    skip_slow = pytest.mark.skip(reason="slow; run with --run-slow")
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip_slow)
+
+@pytest.fixture(autouse=True)
+def clean_shared_state():
+    """Every test starts with empty shared state"""
+    from shared_state import shared_state
+    conn = shared_state._connect()
+    for table in ('kv', 'buckets', 'locks'):
+        conn.execute(f'DELETE FROM {table}')
+    yield shared_state
+
+@pytest.fixture(scope='session')
+def drive_url():
+    """Base URL of drive_soak's in-memory Drive stand-in (its own process)"""
+    import learnnect_storage_api as api
+    from drive_soak import start_drive_stand_in
+
+    process, url = start_drive_stand_in(api.LEARNNECT_FOLDER_ID, latency_ms=1)
+    try:
+        yield url
+    finally:
+        process.terminate()
+        process.join(timeout=5)
+
+@pytest.fixture(scope='session')
+def client(drive_url):
+    """TestClient for the storage API, with Drive served by the stand-in, calling as a backend service"""
+    from fastapi.testclient import TestClient
+    from google.oauth2.credentials import Credentials
+    import learnnect_storage_api as api
+    from drive_accounts import PooledHttp, ServiceAccountPool
+    from drive_http import build_drive_service
+    from drive_soak import stand_in_account
+
+    def connect_to_stand_in():
+        credentials = Credentials(token='test', expiry=datetime.utcnow() + timedelta(days=365))
+        api.storage_service.pool = ServiceAccountPool([stand_in_account('test@learnnect.test', credentials, drive_url)])
+        api.storage_service.credentials = credentials
+        api.storage_service.service = build_drive_service(http=PooledHttp(api.storage_service.pool, hedger=api.hedger))
+
+    api.storage_service.initialize_drive_service = connect_to_stand_in
+    with TestClient(api.app, raise_server_exceptions=False, headers={'X-API-Key': SERVICE_KEY}) as test_client:
+        yield test_client
+
+@pytest.fixture
+def anonymous_client(client):
+    """The same API without credentials (no lifespan of its own, so the session's workers keep running)"""
+    from fastapi.testclient import TestClient
+    return TestClient(client.app, raise_server_exceptions=False)
+
+@pytest.fixture
+def storage_api(client):
+    """The API module, once its startup has run against the stand-in"""
+    import learnnect_storage_api
+    return learnnect_storage_api
+
+@pytest.fixture
+def user():
+    """A user no other test has touched"""
+    user_id = uuid.uuid4().hex
+    return {'userId': user_id, 'userEmail': f"user.{user_id[:6]}@example.com"}
+
+def pdf_upload(name: str = 'resume.pdf', size: int = 2048):
+    """files= entry for a small PDF resume"""
+    return {'file': (name, b'%PDF-1.4\n' + os.urandom(size), 'application/pdf')}
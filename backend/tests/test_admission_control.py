@@ -0,0 +1,107 @@
+"""Admission control: uploads queue FIFO within their budget and are shed with 503 (or 413) instead of piling up"""
+
+import asyncio
+
+import pytest
+
+from admission_control import AdmissionController, AdmissionMiddleware, Shed, admission
+from conftest import pdf_upload
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_queued_uploads_are_admitted_in_order():
+    async def scenario():
+        controller = AdmissionController(max_uploads=1, queue_size=2, queue_timeout=1)
+        await controller.acquire('upload', 10)
+        admitted = []
+
+        async def upload(name):
+            await controller.acquire('upload', 10)
+            admitted.append(name)
+
+        waiting = [asyncio.ensure_future(upload(name)) for name in ('first', 'second')]
+        await asyncio.sleep(0.01)
+        with pytest.raises(Shed, match='queue full'):
+            await controller.acquire('upload', 10)
+
+        controller.release('upload', 10)
+        await asyncio.sleep(0.01)
+        assert admitted == ['first']
+        controller.release('upload', 10)
+        await asyncio.gather(*waiting)
+        assert admitted == ['first', 'second']
+        return controller.metrics()['upload']
+
+    metrics = run(scenario())
+    assert (metrics['queued'], metrics['shedQueueFull']) == (2, 1)
+
+def test_wait_that_runs_out_is_shed_with_retry_after():
+    async def scenario():
+        controller = AdmissionController(max_uploads=1, queue_timeout=0.05)
+        await controller.acquire('upload', 10)
+        with pytest.raises(Shed) as shed:
+            await controller.acquire('upload', 10)
+        assert not controller.waiters['upload']
+        return shed.value
+
+    shed = run(scenario())
+    assert (shed.reason, shed.status_code) == ('queue timeout', 503)
+    assert shed.retry_after >= 1
+
+def test_uploads_wait_for_bytes_but_reads_never_queue_behind_them():
+    async def scenario():
+        controller = AdmissionController(max_uploads=8, max_upload_bytes=100, queue_timeout=0.05)
+        await controller.acquire('upload', 80)
+        with pytest.raises(Shed):
+            await controller.acquire('upload', 30)
+        await controller.acquire('read')
+        await controller.acquire('upload', 20)
+        return controller.bytes_in_flight
+
+    assert run(scenario()) == 100
+
+def test_upload_larger_than_the_budget_is_refused_without_queueing():
+    async def scenario():
+        controller = AdmissionController(max_upload_bytes=100, queue_timeout=5)
+        with pytest.raises(Shed) as shed:
+            await controller.acquire('upload', 101)
+        assert not controller.waiters['upload'] and controller.in_flight['upload'] == 0
+        await controller.acquire('upload', 100)  # Nothing left behind to block the next upload
+        return shed.value
+
+    shed = run(scenario())
+    assert (shed.status_code, shed.retry_after) == (413, None)
+
+def test_middleware_answers_503_with_retry_after():
+    controller = AdmissionController(max_uploads=1, queue_size=0)
+    sent = []
+
+    async def app(scope, receive, send):
+        raise AssertionError('shed request reached the route')
+
+    async def send(message):
+        sent.append(message)
+
+    async def scenario():
+        await controller.acquire('upload', 10)
+        scope = {'type': 'http', 'method': 'POST', 'path': '/api/storage/upload-resume',
+                 'headers': [(b'content-length', b'10')]}
+        await AdmissionMiddleware(app, controller)(scope, None, send)
+
+    run(scenario())
+    assert sent[0]['status'] == 503
+    assert int(dict(sent[0]['headers'])[b'retry-after']) >= 1
+
+def test_huge_declared_upload_gets_413_before_taking_a_slot(client, user):
+    admitted = admission.stats['upload']['admitted']
+    response = client.post('/api/storage/upload-resume', content=b'', headers={
+        'content-type': 'multipart/form-data; boundary=x', 'content-length': str(10 ** 12)
+    })
+    assert response.status_code == 413
+    assert response.json()['detail'] == 'File too large. Maximum size is 10MB.'  # From the gate, ahead of admission
+    assert admission.stats['upload']['admitted'] == admitted
+    assert admission.in_flight['upload'] == 0 and not admission.waiters['upload']
+
+    small = client.post('/api/storage/upload-resume', data={**user, 'fileName': 'cv.pdf'}, files=pdf_upload('cv.pdf'))
+    assert small.status_code == 200, small.text
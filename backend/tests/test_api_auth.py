@@ -0,0 +1,196 @@
+"""API auth: signed requests are bound to their request and used once, tokens to their user, and anonymous callers to the frontend's routes"""
+
+import json
+import time
+import base64
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from api_auth import (
+    AUTH_SIGNATURE_TOLERANCE, EMPTY_BODY_SHA256, AuthError, AuthMiddleware, Authenticator, current_principal,
+    make_jwt, sign_request
+)
+from conftest import ADMIN_KEY, JWT_SECRET, SERVICE_KEY, pdf_upload
+
+PATH = '/api/storage/delete-resume'
+
+@pytest.fixture
+def auth(monkeypatch):
+    monkeypatch.setenv('API_SECRET_KEY', SERVICE_KEY)
+    monkeypatch.delenv('API_SECRET_KEY_PREVIOUS', raising=False)
+    return Authenticator(keys_file=None, required=True)
+
+def verify(auth, headers, method='DELETE', path=PATH, query=''):
+    auth.verify_signature(method, path, query, headers['X-Learnnect-Timestamp'].encode(),
+                          headers['X-Learnnect-Signature'].encode(), headers['X-Learnnect-Content-SHA256'],
+                          headers['X-Learnnect-Nonce'])
+
+def bearer(user_id, **claims):
+    return {'Authorization': f"Bearer {make_jwt(JWT_SECRET, {'sub': user_id, 'exp': int(time.time()) + 600, **claims})}"}
+
+def test_signed_request_verifies(auth):
+    verify(auth, sign_request(SERVICE_KEY, 'DELETE', PATH, 'userId=u1', b'{"fileId": "f1"}'), query='userId=u1')
+
+def test_request_without_a_body_signs_the_empty_digest(auth):
+    headers = sign_request(SERVICE_KEY, 'GET', PATH)
+    assert headers['X-Learnnect-Content-SHA256'] == EMPTY_BODY_SHA256
+    verify(auth, headers, method='GET')
+
+@pytest.mark.parametrize('change', [
+    {'method': 'POST'},
+    {'path': '/api/storage/delete-image'},
+    {'query': 'userId=someone-else'}
+])
+def test_signature_covers_the_request_line(auth, change):
+    headers = sign_request(SERVICE_KEY, 'DELETE', PATH, 'userId=u1')
+    with pytest.raises(AuthError, match='Invalid signature'):
+        verify(auth, headers, **{'query': 'userId=u1', **change})
+
+def test_signature_covers_the_declared_digest(auth):
+    headers = sign_request(SERVICE_KEY, 'DELETE', PATH, body=b'{"fileId": "f1"}')
+    headers['X-Learnnect-Content-SHA256'] = EMPTY_BODY_SHA256
+    with pytest.raises(AuthError, match='Invalid signature'):
+        verify(auth, headers)
+
+def test_malformed_digest_is_rejected(auth):
+    headers = sign_request(SERVICE_KEY, 'DELETE', PATH)
+    headers['X-Learnnect-Content-SHA256'] = 'not-a-digest'
+    with pytest.raises(AuthError, match='Invalid content digest'):
+        verify(auth, headers)
+
+def test_expired_signature_is_rejected(auth):
+    headers = sign_request(SERVICE_KEY, 'DELETE', PATH, timestamp=int(time.time()) - AUTH_SIGNATURE_TOLERANCE - 10)
+    with pytest.raises(AuthError, match='Signature expired'):
+        verify(auth, headers)
+
+def test_other_keys_do_not_verify(auth):
+    with pytest.raises(AuthError, match='Invalid signature'):
+        verify(auth, sign_request('some-other-key', 'DELETE', PATH))
+
+@pytest.fixture
+def delete_api(auth):
+    """A route behind AuthMiddleware that records the bodies it acted on"""
+    deleted = []
+
+    async def delete(request):
+        body = await request.json()
+        deleted.append(body['fileId'])
+        return JSONResponse({'success': True, 'principal': current_principal.get()['type']})
+
+    app = Starlette(routes=[Route(PATH, delete, methods=['DELETE'])])
+    return TestClient(AuthMiddleware(app, auth=auth)), deleted
+
+def test_body_matching_the_signature_reaches_the_route(delete_api):
+    client, deleted = delete_api
+    body = b'{"fileId": "f1"}'
+    response = client.request('DELETE', PATH, content=body, headers=sign_request(SERVICE_KEY, 'DELETE', PATH, body=body))
+    assert response.status_code == 200
+    assert response.json()['principal'] == 'service'
+    assert deleted == ['f1']
+
+def test_body_swapped_after_signing_is_refused(delete_api):
+    client, deleted = delete_api
+    headers = sign_request(SERVICE_KEY, 'DELETE', PATH, body=b'{"fileId": "f1"}')
+    response = client.request('DELETE', PATH, content=b'{"fileId": "f2"}', headers=headers)
+    assert response.status_code == 401
+    assert response.json() == {'detail': 'Body does not match the signature'}
+    assert deleted == []
+
+def test_unsigned_request_is_refused_when_auth_is_required(delete_api):
+    client, deleted = delete_api
+    response = client.request('DELETE', PATH, content=b'{"fileId": "f1"}')
+    assert response.status_code == 401
+    assert deleted == []
+
+def test_replayed_signature_is_refused(delete_api):
+    client, deleted = delete_api
+    body = b'{"fileId": "f1"}'
+    headers = sign_request(SERVICE_KEY, 'DELETE', PATH, body=body)
+    assert client.request('DELETE', PATH, content=body, headers=headers).status_code == 200
+
+    response = client.request('DELETE', PATH, content=body, headers=headers)
+    assert response.status_code == 401
+    assert response.json() == {'detail': 'Signature already used'}
+    assert deleted == ['f1']
+
+def test_identical_requests_in_the_same_second_differ_by_nonce(delete_api):
+    client, deleted = delete_api
+    body = b'{"fileId": "f1"}'
+    now = int(time.time())
+    for _ in range(2):
+        headers = sign_request(SERVICE_KEY, 'DELETE', PATH, body=body, timestamp=now)
+        assert client.request('DELETE', PATH, content=body, headers=headers).status_code == 200
+    assert deleted == ['f1', 'f1']
+
+def test_signature_without_a_nonce_still_verifies(auth):
+    verify(auth, sign_request(SERVICE_KEY, 'DELETE', PATH, nonce=''))
+
+@pytest.mark.parametrize('header', [b'[]', b'"HS256"', b'null'])
+def test_token_whose_header_is_not_an_object_is_malformed(auth, header):
+    segment = base64.urlsafe_b64encode(header).rstrip(b'=').decode()
+    token = '.'.join([segment] + make_jwt(JWT_SECRET, {'sub': 'u1'}).split('.')[1:])
+    with pytest.raises(AuthError, match='Malformed token'):
+        auth.authenticate({'method': 'GET', 'path': PATH}, {b'authorization': f"Bearer {token}".encode()})
+
+@pytest.mark.parametrize('path', [
+    '/api/storage/usage', '/api/storage/profile-bundle', '/api/storage/resume-thumbnail', '/api/storage/upload-progress'
+])
+def test_anonymous_callers_are_limited_to_the_frontends_routes(anonymous_client, user, path):
+    response = anonymous_client.get(path, params={**user, 'fileId': 'f1', 'uploadId': 'upload-0001'})
+    assert response.status_code == 401
+
+def test_anonymous_caller_still_reaches_a_frontend_route(anonymous_client, user):
+    assert anonymous_client.get('/api/storage/check-user-folder', params=user).status_code == 200
+
+@pytest.mark.parametrize('path', [
+    '/api/storage/user-resumes', '/api/storage/usage', '/api/storage/profile-bundle', '/api/storage/resume-thumbnail',
+    '/api/storage/check-existing-image', '/api/storage/check-user-folder'
+])
+def test_user_token_reads_only_its_own_files(anonymous_client, user, path):
+    params = {**user, 'fileId': 'f1', 'imageType': 'profile'}
+    response = anonymous_client.get(path, params=params, headers=bearer('someone-else'))
+    assert response.status_code == 403
+
+    response = anonymous_client.get(path, params=params, headers=bearer(user['userId']))
+    assert response.status_code in (200, 404)  # 404: the thumbnail doesn't exist
+
+@pytest.mark.parametrize('path', ['/api/storage/accounts', '/api/storage/upload-spool', '/api/storage/admission'])
+def test_operational_metrics_are_admin_only(client, path):
+    assert client.get(path).status_code == 403  # The client's service key is not an admin key
+
+def test_admin_reads_operational_metrics(client):
+    for path in ('/api/storage/upload-spool', '/api/storage/admission'):
+        assert client.get(path, headers={'X-API-Key': ADMIN_KEY}).status_code == 200
+
+def progress_stream(anonymous_client, user):
+    issued = anonymous_client.post('/api/storage/upload-progress/token', json={'userId': user['userId']},
+                                   headers=bearer(user['userId']))
+    assert issued.status_code == 200, issued.text
+    return issued.json()
+
+def test_progress_stream_needs_the_token_issued_for_that_upload(anonymous_client, user):
+    issued = progress_stream(anonymous_client, user)
+    upload = anonymous_client.post('/api/storage/upload-resume', data={**user, 'fileName': 'cv.pdf'},
+                                   files=pdf_upload('cv.pdf'), headers={'X-Upload-Id': issued['uploadId']})
+    assert upload.status_code == 200, upload.text
+
+    response = anonymous_client.get(issued['progressURL'])
+    assert response.status_code == 200
+    [done] = [json.loads(line[len('data: '):]) for line in response.text.splitlines() if line.startswith('data: ')]
+    assert (done['stage'], done['fileId']) == ('done', upload.json()['fileId'])
+
+    # Without the token, or with another upload's, the stream stays closed
+    assert anonymous_client.get('/api/storage/upload-progress', params={'uploadId': issued['uploadId']}).status_code == 401
+    other = progress_stream(anonymous_client, user)
+    token = other['progressURL'].split('token=')[1]
+    response = anonymous_client.get('/api/storage/upload-progress', params={'uploadId': issued['uploadId'], 'token': token})
+    assert response.status_code == 403
+
+def test_progress_token_is_not_a_user_token(anonymous_client, user):
+    token = progress_stream(anonymous_client, user)['progressURL'].split('token=')[1]
+    response = anonymous_client.get('/api/storage/user-resumes', params=user, headers={'Authorization': f"Bearer {token}"})
+    assert response.status_code == 401
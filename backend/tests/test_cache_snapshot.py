@@ -0,0 +1,51 @@
+"""Snapshot restore: only empty caches are filled, and a failed catch-up undoes just that"""
+
+import pytest
+
+from cache_snapshot import CacheSnapshotter
+
+@pytest.fixture
+def snapshotter(clean_shared_state, tmp_path):
+    """A saved snapshot of two cache entries and a sync cursor, with those entries since dropped"""
+    state = clean_shared_state
+    snapshotter = CacheSnapshotter('root-folder', path=str(tmp_path / 'snapshot.json.gz'), interval=0, enabled=True)
+    state.set('folders', 'user-1', 'folder-1')
+    state.set('listing_versions', 'user-1', 5)
+    state.set('drive_sync', 'cursor', 'cursor-at-snapshot')
+    assert snapshotter.save()
+
+    state.delete('folders', 'user-1')
+    state.delete('listing_versions', 'user-1')
+    state.set('drive_sync', 'cursor', 'cursor-live')
+    state.set('listing_versions', 'user-2', 7)
+    return snapshotter
+
+def test_restore_fills_only_missing_entries(snapshotter, clean_shared_state):
+    state = clean_shared_state
+    assert snapshotter.restore(catch_up=lambda: 0) == 2
+    assert state.get('folders', 'user-1') == 'folder-1'
+    assert state.get('listing_versions', 'user-1') == 5
+    assert state.get('drive_sync', 'cursor') == 'cursor-live'
+
+def test_restore_runs_once_per_snapshot(snapshotter):
+    assert snapshotter.restore(catch_up=lambda: 0) == 2
+    assert snapshotter.restore(catch_up=lambda: 0) == 0
+
+def test_failed_catch_up_drops_only_what_the_restore_added(snapshotter, clean_shared_state):
+    state = clean_shared_state
+
+    def catch_up():
+        state.set('listing_versions', 'user-1', 6)  # Live traffic moved a restored entry on meanwhile
+        raise RuntimeError('changes feed unavailable')
+
+    assert snapshotter.restore(catch_up=catch_up) == 0
+    assert state.get('folders', 'user-1') is None
+    assert state.get('listing_versions', 'user-1') == 6
+    assert state.get('listing_versions', 'user-2') == 7
+    assert state.get('drive_sync', 'cursor') == 'cursor-live'
+
+def test_restore_without_a_changes_feed_keeps_the_live_cursor(snapshotter, clean_shared_state):
+    state = clean_shared_state
+    state.delete('drive_sync', 'cursor')
+    assert snapshotter.restore() == 2
+    assert state.get('drive_sync', 'cursor') is None
@@ -0,0 +1,72 @@
+"""Service account pool: stable user placement and failover away from throttled accounts"""
+
+import io
+
+import httplib2
+import pytest
+
+from drive_accounts import DriveAccount, PooledHttp, ServiceAccountPool, user_context
+
+class ScriptedAccount(DriveAccount):
+    """An account whose transport answers with a fixed status and records what it was sent"""
+
+    def __init__(self, name, status=200, content=b'{}'):
+        super().__init__(name, credentials=None)
+        self.status = status
+        self.content = content
+        self.bodies = []
+
+    @property
+    def http(self):
+        return self
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        self.bodies.append(body.read() if hasattr(body, 'read') else body)
+        return httplib2.Response({'status': self.status}), self.content
+
+THROTTLED = b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}'
+
+def home_accounts(pool, users):
+    return {user: pool.account_for(user).name for user in users}
+
+def test_adding_an_account_moves_only_its_share_of_users():
+    users = [f'user-{index}' for index in range(2000)]
+    before = home_accounts(ServiceAccountPool([ScriptedAccount(f'sa-{index}') for index in range(3)]), users)
+    after = home_accounts(ServiceAccountPool([ScriptedAccount(f'sa-{index}') for index in range(4)]), users)
+
+    moved = [user for user in users if before[user] != after[user]]
+    assert all(after[user] == 'sa-3' for user in moved)
+    assert 0.15 < len(moved) / len(users) < 0.35
+
+@pytest.mark.parametrize('status, content', [(429, b''), (403, THROTTLED)])
+def test_throttled_request_fails_over_and_the_account_is_skipped(status, content):
+    pool = ServiceAccountPool([ScriptedAccount('sa-0'), ScriptedAccount('sa-1')])
+    home, other = pool.candidates('user-1')
+    home.status, home.content = status, content
+    http = PooledHttp(pool)
+
+    with user_context('user-1'):
+        response, _ = http.request('https://www.googleapis.com/drive/v3/files', 'POST', body=io.BytesIO(b'metadata'))
+        assert response.status == 200
+        assert other.bodies == [b'metadata']  # The body was rewound for the retry
+        assert home.stats['failovers_out'] == 1
+
+        http.request('https://www.googleapis.com/drive/v3/files')
+        assert len(home.bodies) == 1  # Cooling down, so not tried again
+        assert pool.account_for('user-1') is other
+
+def test_permission_errors_are_not_failed_over():
+    pool = ServiceAccountPool([ScriptedAccount('sa-0', 403, b'{"error": {"errors": [{"reason": "forbidden"}]}}'),
+                               ScriptedAccount('sa-1', 403, b'{"error": {"errors": [{"reason": "forbidden"}]}}')])
+    with user_context('user-1'):
+        response, _ = PooledHttp(pool).request('https://www.googleapis.com/drive/v3/files')
+    assert response.status == 403
+    assert sum(len(account.bodies) for account in pool.accounts) == 1
+
+def test_last_account_answers_when_every_account_is_throttled():
+    pool = ServiceAccountPool([ScriptedAccount('sa-0', 429), ScriptedAccount('sa-1', 429)])
+    with user_context('user-1'):
+        response, _ = PooledHttp(pool).request('https://www.googleapis.com/drive/v3/files')
+    assert response.status == 429
+    assert [len(account.bodies) for account in pool.accounts] == [1, 1]
+    assert pool.candidates('user-1')  # Still something to try once all are cooling down
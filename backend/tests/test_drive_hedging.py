@@ -0,0 +1,58 @@
+"""Drive hedging: slow reads get one hedge past their p90, within the hedge budget, and writes are never hedged"""
+
+import time
+import threading
+
+from drive_hedging import HEDGE_MIN_SAMPLES, HEDGE_RECOMPUTE_EVERY, Hedger
+
+READ = 'https://www.googleapis.com/drive/v3/files?q=x'
+WRITE = 'https://www.googleapis.com/drive/v3/files'
+
+def warmed(seconds=0.01, budget=1.0, samples=HEDGE_MIN_SAMPLES):
+    hedger = Hedger(enabled=True, budget=budget, workers=4)
+    for _ in range(samples):
+        hedger._observe('GET files', seconds)
+    return hedger
+
+def test_no_hedging_until_enough_samples():
+    hedger = warmed(samples=HEDGE_MIN_SAMPLES - 1)
+    assert hedger.delay_for('GET files') is None
+    hedger._observe('GET files', 0.01)
+    assert hedger.delay_for('GET files') == 0.05  # Floored at HEDGE_MIN_DELAY
+
+def test_delay_is_recomputed_every_few_samples_not_per_read():
+    hedger = warmed(seconds=0.1)
+    for _ in range(HEDGE_RECOMPUTE_EVERY - 1):
+        hedger._observe('GET files', 10.0)
+    assert hedger.delay_for('GET files') == 0.1
+
+    for _ in range(HEDGE_MIN_SAMPLES):
+        hedger._observe('GET files', 10.0)
+    assert hedger.delay_for('GET files') == 10.0
+
+def test_slow_read_is_answered_by_its_hedge():
+    hedger = warmed()
+    first = threading.Event()
+
+    def send():
+        if not first.is_set():
+            first.set()
+            time.sleep(1)
+            return 'slow'
+        return 'hedge'
+
+    started = time.perf_counter()
+    assert hedger.request('GET', READ, send) == 'hedge'
+    assert time.perf_counter() - started < 0.5
+    assert (hedger.stats['hedged'], hedger.stats['hedge_wins']) == (1, 1)
+
+def test_hedges_are_capped_by_the_budget():
+    hedger = warmed(budget=0.0)
+    assert hedger.request('GET', READ, lambda: time.sleep(0.1) or 'primary') == 'primary'
+    assert (hedger.stats['hedged'], hedger.stats['budget_denied']) == (0, 1)
+
+def test_writes_are_never_hedged():
+    hedger = warmed()
+    calls = []
+    hedger.request('POST', WRITE, lambda: calls.append(1) or time.sleep(0.1))
+    assert calls == [1] and hedger.stats['reads'] == 0
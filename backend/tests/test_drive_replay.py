@@ -0,0 +1,71 @@
+"""Drive recording and replay: cassettes capture each request's Drive calls, and replay flags extra calls"""
+
+import os
+import sys
+import gzip
+import json
+import subprocess
+
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import BACKEND_DIR, pdf_upload
+from drive_recorder import RecordingMiddleware
+from drive_replay import busy_ms, check_budgets
+
+def replay(*cassettes):
+    """Replay without waiting; CI timing is too noisy for the latency budget, so only Drive calls are judged here"""
+    return subprocess.run(
+        [sys.executable, os.path.join(BACKEND_DIR, 'drive_replay.py'), *map(str, cassettes),
+         '--latency-scale', '0', '--latency-tolerance', '100'],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=120
+    )
+
+def read_cassette(path):
+    with gzip.open(path, 'rt') as cassette:
+        return [json.loads(line) for line in cassette]
+
+def write_cassette(path, entries):
+    with gzip.open(path, 'wt') as cassette:
+        cassette.writelines(json.dumps(entry) + '\n' for entry in entries)
+
+@pytest.fixture
+def cassette(storage_api, user, tmp_path):
+    """Record a first upload and a listing, as staging would"""
+    recorder = RecordingMiddleware(storage_api.app, directory=str(tmp_path / 'cassettes'))
+    recording_client = TestClient(recorder)  # No lifespan: shutdown would stop the session app's workers
+    upload = recording_client.post('/api/storage/upload-resume', data={**user, 'fileName': 'cv.pdf'}, files=pdf_upload('cv.pdf'))
+    assert upload.status_code == 200, upload.text
+    assert recording_client.get('/api/storage/user-resumes', params=user).status_code == 200
+    return recorder.writer.path
+
+def test_cassette_holds_each_request_and_its_drive_calls(cassette):
+    upload, listing = read_cassette(cassette)
+    assert (upload['method'], upload['path'], upload['status']) == ('POST', '/api/storage/upload-resume', 200)
+    assert any(call['label'] == 'POST upload files' for call in upload['calls'])
+    assert listing['calls'] and all(call['method'] == 'GET' for call in listing['calls'])
+    assert all('authorization' not in entry['headers'] for entry in (upload, listing))
+
+def test_replay_of_an_unchanged_api_is_within_budget(cassette):
+    result = replay(cassette)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'All requests within budget' in result.stdout
+
+def test_replay_flags_a_request_that_makes_more_drive_calls(cassette, tmp_path):
+    entries = read_cassette(cassette)
+    entries[1]['calls'] = entries[1]['calls'][1:]  # As if the listing used to need one call less
+    regressed = tmp_path / 'regressed.jsonl.gz'
+    write_cassette(regressed, entries)
+
+    result = replay(regressed)
+    assert result.returncode == 1
+    assert 'GET /api/storage/user-resumes: 1 Drive calls (recorded 0)' in result.stdout
+
+def test_busy_time_counts_parallel_calls_once():
+    assert busy_ms([{'at': 0, 'ms': 100}, {'at': 50, 'ms': 100}, {'at': 300, 'ms': 10}]) == 160
+
+def test_budget_violations():
+    results = [{'route': 'GET /r', 'skipped': False, 'status': 200, 'recordedStatus': 200,
+                'calls': 3, 'recordedCalls': 3, 'unrecorded': [], 'ms': 400, 'expectedMs': 100}]
+    _, violations = check_budgets(results, {'GET /r': {'maxCalls': 2}}, extra_calls=0, latency_tolerance=1.25)
+    assert violations == ['GET /r: 3 Drive calls per request (budget 2)', 'GET /r: p95 400ms (budget 175ms)']
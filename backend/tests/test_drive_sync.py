@@ -0,0 +1,104 @@
+"""Drive changes sync: cached folders and files follow changes made outside the API"""
+
+import pytest
+
+from drive_sync import DriveChangesSync, FOLDER_MIME_TYPE
+
+class Request:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+class ChangesFeed:
+    """Drive's changes collection, served from a list of pages"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.tokens = []
+
+    def changes(self):
+        return self
+
+    def getStartPageToken(self):
+        return Request({'startPageToken': 'cursor-0'})
+
+    def list(self, pageToken, **kwargs):
+        self.tokens.append(pageToken)
+        return Request(self.pages[pageToken])
+
+class Storage:
+    """The storage service's cache methods (the sync only needs those and `service`)"""
+
+    def __init__(self, service=None):
+        import learnnect_storage_api as api
+        self.api = api.storage_service
+        self.service = service
+
+    def __getattr__(self, name):
+        return getattr(self.api, name)
+
+@pytest.fixture
+def sync(clean_shared_state):
+    storage = Storage()
+    storage.cache_folder('root', 'Learnnect_ada_user0001', 'user-folder', owner='user-0001')
+    storage.cache_folder('user-folder', 'Profile-Resume', 'resume-folder')
+    return DriveChangesSync(storage, 'root', interval=30)
+
+def listing_version(user_id):
+    import learnnect_storage_api as api
+    return api.storage_service.get_listing_version(user_id)
+
+def test_trashed_folder_is_forgotten_and_its_owner_invalidated(sync, clean_shared_state):
+    version = listing_version('user-0001')
+    assert sync.apply_change({'fileId': 'resume-folder', 'file': {
+        'id': 'resume-folder', 'name': 'Profile-Resume', 'mimeType': FOLDER_MIME_TYPE, 'parents': ['user-folder'], 'trashed': True
+    }})
+    assert clean_shared_state.get('folders', 'user-folder/Profile-Resume') is None
+    assert listing_version('user-0001') == version + 1
+
+def test_renamed_folder_is_cached_under_its_new_name(sync, clean_shared_state):
+    sync.apply_change({'fileId': 'resume-folder', 'file': {
+        'id': 'resume-folder', 'name': 'Resumes', 'mimeType': FOLDER_MIME_TYPE, 'parents': ['user-folder']
+    }})
+    assert clean_shared_state.get('folders', 'user-folder/Profile-Resume') is None
+    assert clean_shared_state.get('folders', 'user-folder/Resumes') == 'resume-folder'
+
+def test_file_added_outside_the_api_is_remembered(sync, clean_shared_state):
+    version = listing_version('user-0001')
+    sync.apply_change({'fileId': 'file-1', 'file': {
+        'id': 'file-1', 'name': 'cv.pdf', 'mimeType': 'application/pdf', 'parents': ['resume-folder'], 'size': '10'
+    }})
+    assert clean_shared_state.get('files', 'file-1')['parents'] == ['resume-folder']
+    assert listing_version('user-0001') == version + 1
+
+def test_changes_outside_our_tree_are_ignored(sync, clean_shared_state):
+    assert not sync.apply_change({'fileId': 'elsewhere', 'file': {
+        'id': 'elsewhere', 'name': 'notes.txt', 'mimeType': 'text/plain', 'parents': ['someone-elses-folder']
+    }})
+    assert clean_shared_state.get('files', 'elsewhere') is None
+
+def test_poll_pages_from_the_stored_cursor(sync, clean_shared_state):
+    feed = ChangesFeed({
+        'cursor-0': {'nextPageToken': 'cursor-1', 'changes': [{'fileId': 'file-1', 'file': {
+            'id': 'file-1', 'name': 'a.pdf', 'mimeType': 'application/pdf', 'parents': ['resume-folder']}}]},
+        'cursor-1': {'newStartPageToken': 'cursor-2', 'changes': [{'fileId': 'file-1', 'removed': True}]}
+    })
+    sync.storage.service = feed
+
+    assert sync.poll_once() == 0  # First poll only records where the feed is now
+    assert clean_shared_state.get('drive_sync', 'page_token') == 'cursor-0'
+    assert sync.poll_once() == 2
+    assert feed.tokens == ['cursor-0', 'cursor-1']
+    assert clean_shared_state.get('drive_sync', 'page_token') == 'cursor-2'
+    assert clean_shared_state.get('files', 'file-1') is None
+
+def test_only_one_worker_polls_at_a_time(sync, clean_shared_state):
+    feed = ChangesFeed({})
+    sync.storage.service = feed
+    clean_shared_state.set('drive_sync', 'page_token', 'cursor-0')
+    owner = clean_shared_state.try_acquire('drive-changes-sync', ttl=60)
+    assert sync.poll_once() == 0
+    assert feed.tokens == []
+    clean_shared_state.release('drive-changes-sync', owner)
@@ -0,0 +1,124 @@
+"""Idempotency-Key replay rules: what is stored, what is replayed and what is refused"""
+
+import time
+import asyncio
+import threading
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import idempotency
+from idempotency import BodyFingerprint, IdempotencyMiddleware, IdempotencyStore, is_final
+
+@pytest.fixture
+def upload_api():
+    """A route behind the middleware that counts its calls and answers with the next queued status"""
+    calls, statuses = [], []
+
+    async def upload(request):
+        calls.append(await request.body())
+        if request.headers.get('x-slow'):
+            await asyncio.sleep(float(request.headers['x-slow']))
+        return JSONResponse({'call': len(calls)}, status_code=statuses.pop(0) if statuses else 200)
+
+    app = Starlette(routes=[Route('/upload', upload, methods=['POST'])])
+    middleware = IdempotencyMiddleware(app, store=IdempotencyStore(), routes={('POST', '/upload')})
+
+    async def from_ip(scope, receive, send):
+        """Let each test request pick its client address"""
+        ip = dict(scope['headers']).get(b'x-test-ip', b'203.0.113.1').decode()
+        await middleware(dict(scope, client=(ip, 40000)), receive, send)
+
+    return TestClient(from_ip), calls, statuses
+
+def post(client, key, content=b'resume', user='user-1', ip='203.0.113.1', **headers):
+    return client.post('/upload', files={'file': ('resume.pdf', content, 'application/pdf')},
+                       headers={'Idempotency-Key': key, 'X-User-Id': user, 'X-Test-Ip': ip, **headers})
+
+@pytest.mark.parametrize('status, final', [
+    (200, True), (201, True), (400, True), (404, True), (422, True),
+    (408, False), (409, False), (425, False), (429, False), (499, False), (500, False), (503, False), (None, False)
+])
+def test_only_outcomes_a_retry_would_repeat_are_final(status, final):
+    assert is_final(status) is final
+
+def test_fingerprint_ignores_the_multipart_boundary():
+    def fingerprint(boundary, chunk_size):
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"\r\n\r\n%PDF-1.4 data\r\n'
+                f'--{boundary}--\r\n').encode()
+        hashed = BodyFingerprint({b'content-type': f'multipart/form-data; boundary={boundary}'.encode()})
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        for index, chunk in enumerate(chunks):
+            hashed.update({'type': 'http.request', 'body': chunk, 'more_body': index < len(chunks) - 1})
+        assert hashed.complete
+        return hashed.hexdigest()
+
+    # Boundaries split across chunks must be stripped just the same
+    digests = {fingerprint(boundary, size) for boundary in ('aaaa1111', 'bbbb2222') for size in (3, 7, 1000)}
+    assert len(digests) == 1
+
+def test_retry_replays_the_stored_response(upload_api):
+    client, calls, _ = upload_api
+    first = post(client, 'key-1')
+    retry = post(client, 'key-1')  # The client picks a new multipart boundary
+    assert retry.status_code == first.status_code == 200
+    assert retry.json() == first.json() == {'call': 1}
+    assert retry.headers['idempotent-replayed'] == 'true'
+    assert len(calls) == 1
+
+def test_key_reused_with_a_different_body_is_refused(upload_api):
+    client, calls, _ = upload_api
+    post(client, 'key-1', content=b'first resume')
+    response = post(client, 'key-1', content=b'second resume')
+    assert response.status_code == 422
+    assert len(calls) == 1
+
+def test_keys_are_scoped_to_the_caller(upload_api):
+    client, calls, _ = upload_api
+    post(client, 'key-1', user='user-1')
+    response = post(client, 'key-1', user='user-2')
+    assert response.json() == {'call': 2}
+    assert 'idempotent-replayed' not in response.headers
+
+def test_unauthenticated_keys_are_scoped_to_the_client_ip(upload_api):
+    client, calls, _ = upload_api
+    post(client, 'key-1', user='user-1', ip='203.0.113.1')
+
+    # Someone else claiming to be user-1 with the same key must not get user-1's response
+    response = post(client, 'key-1', user='user-1', ip='198.51.100.7')
+    assert response.json() == {'call': 2}
+    assert 'idempotent-replayed' not in response.headers
+
+def test_slow_original_keeps_its_claim(upload_api, monkeypatch):
+    monkeypatch.setattr(idempotency, 'IN_FLIGHT_TTL', 0.3)
+    monkeypatch.setattr(idempotency, 'IN_FLIGHT_HEARTBEAT', 0.05)
+    client, calls, _ = upload_api
+    original = threading.Thread(target=post, args=(client, 'key-1'), kwargs={'X-Slow': '1'})
+    original.start()
+    time.sleep(0.6)  # Twice the claim TTL
+
+    retry = post(client, 'key-1')
+    original.join()
+    assert retry.headers['idempotent-replayed'] == 'true'
+    assert len(calls) == 1
+
+@pytest.mark.parametrize('status', [409, 429, 500])
+def test_transient_outcomes_are_not_stored(upload_api, status):
+    client, calls, statuses = upload_api
+    statuses.append(status)
+    assert post(client, 'key-1').status_code == status
+    retry = post(client, 'key-1')
+    assert retry.status_code == 200
+    assert len(calls) == 2
+
+def test_client_errors_are_replayed(upload_api):
+    client, calls, statuses = upload_api
+    statuses.append(400)
+    post(client, 'key-1')
+    retry = post(client, 'key-1')
+    assert retry.status_code == 400
+    assert retry.headers['idempotent-replayed'] == 'true'
+    assert len(calls) == 1
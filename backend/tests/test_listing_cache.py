@@ -0,0 +1,50 @@
+"""Listing responses: ETags and 304s, invalidated by uploads, never caching a Drive failure"""
+
+from conftest import pdf_upload
+
+def upload_resume(client, user, name='resume.pdf'):
+    response = client.post('/api/storage/upload-resume', data={**user, 'fileName': name}, files=pdf_upload(name))
+    assert response.status_code == 200, response.text
+    return response.json()['fileId']
+
+def list_resumes(client, user, etag=None):
+    return client.get('/api/storage/user-resumes', params=user, headers={'If-None-Match': etag} if etag else {})
+
+def test_matching_etag_gets_304_without_touching_drive(client, storage_api, user, monkeypatch):
+    upload_resume(client, user)
+    first = list_resumes(client, user)
+    assert first.status_code == 200
+    assert first.headers['etag']
+
+    def drive_down(*args):
+        raise AssertionError('listing should come from the cache')
+
+    monkeypatch.setattr(storage_api.storage_service, 'list_user_resumes', drive_down)
+    revalidated = list_resumes(client, user, first.headers['etag'])
+    assert revalidated.status_code == 304
+    assert revalidated.headers['etag'] == first.headers['etag']
+    assert list_resumes(client, user).json() == first.json()
+
+def test_upload_changes_the_listing_and_its_etag(client, user):
+    first_id = upload_resume(client, user, 'first.pdf')
+    first = list_resumes(client, user)
+
+    second_id = upload_resume(client, user, 'second.pdf')
+    second = list_resumes(client, user, first.headers['etag'])
+    assert second.status_code == 200
+    assert second.headers['etag'] != first.headers['etag']
+    assert {file['id'] for file in second.json()['files']} == {first_id, second_id}
+
+def test_drive_failure_is_not_cached(client, storage_api, user, monkeypatch):
+    upload_resume(client, user)
+
+    def drive_down(*args):
+        raise RuntimeError('Drive unavailable')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(storage_api.storage_service, 'list_user_resumes', drive_down)
+        failed = list_resumes(client, user)
+        assert failed.json() == {'success': True, 'files': []}
+        assert 'etag' not in failed.headers
+
+    assert len(list_resumes(client, user).json()['files']) == 1
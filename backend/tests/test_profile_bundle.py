@@ -0,0 +1,65 @@
+"""Profile bundle: folder status, resumes and the latest avatar and banner from one Drive listing"""
+
+import os
+from contextlib import contextmanager
+
+import drive_http
+from conftest import pdf_upload
+
+def upload_image(client, user, image_type):
+    png = b'\x89PNG\r\n\x1a\n' + os.urandom(256)
+    file_name = f"{image_type}_{os.urandom(4).hex()}.png"  # Named the way the frontend names them
+    response = client.post('/api/storage/upload-image', data={**user, 'fileName': file_name, 'imageType': image_type},
+                           files={'file': (file_name, png, 'image/png')})
+    assert response.status_code == 200, response.text
+    return response.json()['fileId']
+
+def bundle(client, user):
+    response = client.get('/api/storage/profile-bundle', params=user)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_user_without_a_folder_gets_an_empty_bundle(client, user):
+    assert bundle(client, user) == {
+        'success': True, 'hasFolder': False, 'folderName': f"Learnnect_{user['userEmail'].split('@')[0].replace('.', '_')}_{user['userId'][-8:]}",
+        'resumes': [], 'profile': None, 'banner': None
+    }
+
+def test_bundle_has_resumes_and_the_latest_images(client, user):
+    resume = client.post('/api/storage/upload-resume', data={**user, 'fileName': 'cv.pdf'}, files=pdf_upload('cv.pdf'))
+    upload_image(client, user, 'profile')
+    profile_id = upload_image(client, user, 'profile')
+    banner_id = upload_image(client, user, 'banner')
+
+    result = bundle(client, user)
+    assert result['hasFolder']
+    assert [entry['id'] for entry in result['resumes']] == [resume.json()['fileId']]
+    assert result['profile']['id'] == profile_id
+    assert result['banner']['id'] == banner_id
+
+def test_bundle_is_one_drive_listing_once_folders_are_known(client, storage_api, user, monkeypatch):
+    upload_image(client, user, 'banner')
+    bundle(client, user)
+    calls = []
+
+    @contextmanager
+    def counting_span(label):
+        calls.append(label)
+        yield
+
+    monkeypatch.setattr(drive_http, 'drive_span', counting_span)
+    storage_api.storage_service.bump_listing_version(user['userId'])  # Miss the response cache
+    bundle(client, user)
+    assert calls == ['GET files']
+
+def test_drive_failure_is_a_503_and_not_cached(client, storage_api, user, monkeypatch):
+    upload_image(client, user, 'profile')
+
+    def drive_down(*args):
+        raise RuntimeError('Drive unavailable')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(storage_api.storage_service, 'get_profile_bundle', drive_down)
+        assert client.get('/api/storage/profile-bundle', params=user).status_code == 503
+
+    assert bundle(client, user)['profile']
@@ -0,0 +1,74 @@
+"""Provisioning: folder skeletons from pre-generated IDs in two batches, creating only what is missing"""
+
+import uuid
+from contextlib import contextmanager
+
+import pytest
+
+import drive_http
+from conftest import ADMIN_KEY
+
+SUBFOLDERS = ['Profile-Resume', 'Profile-Picture', 'Profile-Banner']
+
+def new_users(count):
+    return [{'userId': uuid.uuid4().hex, 'userEmail': f"signup.{index}@example.com"} for index in range(count)]
+
+@pytest.fixture
+def drive_calls(monkeypatch):
+    calls = []
+
+    @contextmanager
+    def counting_span(label):
+        calls.append(label)
+        yield
+
+    monkeypatch.setattr(drive_http, 'drive_span', counting_span)
+    return calls
+
+def subfolder_names(storage, folder_id):
+    listing = storage.service.files().list(q=f"'{folder_id}' in parents and trashed=false", fields='files(name)').execute()
+    return sorted(file['name'] for file in listing['files'])
+
+def test_skeletons_are_created_with_one_id_call_and_two_batches(storage_api, drive_calls):
+    storage = storage_api.storage_service
+    users = new_users(3)
+    results = storage.provision_users(users)
+
+    assert all(result['success'] for result in results)
+    # Lookups (and new hash bucket folders) first, then the IDs and the two batches
+    generate_ids = drive_calls.index('GET files/{id}')
+    assert drive_calls[generate_ids:] == ['GET files/{id}', 'POST batch', 'POST batch']
+    assert set(drive_calls[:generate_ids]) <= {'GET files', 'POST files'}
+    for user, result in zip(users, results):
+        assert storage.find_user_folder(user['userId'], user['userEmail']) == result['folderId']
+        assert subfolder_names(storage, result['folderId']) == sorted(SUBFOLDERS)
+
+def test_reprovisioning_creates_nothing(storage_api, drive_calls):
+    storage = storage_api.storage_service
+    users = new_users(2)
+    storage.provision_users(users)
+    drive_calls.clear()
+
+    results = storage.provision_users(users)
+    assert all(result['success'] and not result['created'] for result in results)
+    assert drive_calls == []  # Every folder is known from the cache
+
+def test_only_missing_subfolders_are_created(storage_api, clean_shared_state):
+    storage = storage_api.storage_service
+    [user] = new_users(1)
+    folder_id = storage.provision_users([user])[0]['folderId']
+    banner_id = storage.find_folder(folder_id, 'Profile-Banner')
+    storage.service.files().delete(fileId=banner_id).execute()
+    storage.forget_folder(banner_id)
+
+    [result] = storage.provision_users([user])
+    assert result['created'] == ['Profile-Banner']
+    assert subfolder_names(storage, folder_id) == sorted(SUBFOLDERS)
+
+def test_bulk_provisioning_is_admin_only(client):
+    users = new_users(2)
+    assert client.post('/api/storage/provision/bulk', json={'users': users}).status_code == 403
+
+    response = client.post('/api/storage/provision/bulk', json={'users': users}, headers={'X-Admin-Key': ADMIN_KEY})
+    assert response.status_code == 200, response.text
+    assert response.json()['provisioned'] == 2
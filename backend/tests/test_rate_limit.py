@@ -0,0 +1,71 @@
+"""Rate limiting: per-IP and per-user token buckets, charged all-or-nothing, with a claimed userId kept to its IP"""
+
+import asyncio
+
+from api_auth import current_principal
+from rate_limit import MemoryBuckets, RateLimiter, RateLimitMiddleware
+
+def limiter(user_writes=2, ip_writes=100):
+    limiter = RateLimiter(enabled=True, store='memory')
+    limiter.limits.update({('user', 'write'): user_writes, ('ip', 'write'): ip_writes})
+    return limiter
+
+def post(middleware, ip, user_id=None, principal=None):
+    """Status and headers of one POST from this IP naming this user"""
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def send(message):
+        sent.append(message)
+
+    async def scenario():
+        current_principal.set(principal or {'type': 'anonymous', 'userId': None})
+        scope = {'type': 'http', 'method': 'POST', 'path': '/api/storage/upload-resume', 'client': (ip, 50000),
+                 'headers': [(b'x-user-id', user_id.encode())] if user_id else [], 'query_string': b''}
+        await RateLimitMiddleware(app, middleware)(scope, None, send)
+
+    asyncio.run(scenario())
+    return sent[0]['status'], dict(sent[0]['headers'])
+
+def test_spoofed_user_id_does_not_spend_that_users_budget():
+    middleware = limiter()
+    for _ in range(2):
+        assert post(middleware, '203.0.113.9', 'victim')[0] == 200
+    assert post(middleware, '203.0.113.9', 'victim')[0] == 429
+
+    # The real user, elsewhere, still has their whole budget
+    assert post(middleware, '198.51.100.7', 'victim')[0] == 200
+
+def test_verified_user_has_one_bucket_across_ips():
+    middleware = limiter()
+    token = {'type': 'user', 'userId': 'user-1'}
+    assert post(middleware, '203.0.113.9', principal=token)[0] == 200
+    assert post(middleware, '198.51.100.7', principal=token)[0] == 200
+    assert post(middleware, '192.0.2.1', principal=token)[0] == 429
+
+def test_over_budget_gets_429_with_retry_after_and_ratelimit_headers():
+    middleware = limiter(user_writes=1)
+    status, headers = post(middleware, '203.0.113.9', 'user-1')
+    assert status == 200 and headers[b'ratelimit-remaining'] == b'0'
+
+    status, headers = post(middleware, '203.0.113.9', 'user-1')
+    assert status == 429
+    assert int(headers[b'retry-after']) >= 1
+    assert headers[b'ratelimit-policy'] == b'1;w=60'
+    assert middleware.stats['limited'] == {'user': 1, 'ip': 0}
+
+def test_refused_request_charges_no_bucket():
+    buckets = MemoryBuckets()
+    assert buckets.take_tokens([('ip', 1.0, 5), ('user', 1.0, 1)])[0]
+    allowed, levels = buckets.take_tokens([('ip', 1.0, 5), ('user', 1.0, 1)])
+    assert not allowed
+    assert 3.9 < levels[0] < 4.1  # The IP bucket kept the token the user bucket refused
+
+def test_least_recently_used_bucket_is_dropped():
+    buckets = MemoryBuckets(max_keys=2)
+    for name in ('a', 'b', 'a', 'c'):
+        buckets.take_tokens([(name, 1.0, 5)])
+    assert list(buckets.buckets) == ['a', 'c']
@@ -0,0 +1,87 @@
+"""Deadlines: slow requests answer 504, and Drive work stops on timeout or client disconnect"""
+
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from starlette.concurrency import run_in_threadpool
+
+import request_deadline
+from drive_http import InstrumentedHttp
+from request_deadline import Deadline, DeadlineExceeded, DeadlineMiddleware, RequestCancelled, check_deadline, current_deadline
+
+class SlowDrive(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(5)
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def slow_drive_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowDrive)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/drive/v3/files"
+    server.shutdown()
+
+def test_drive_call_in_flight_is_aborted_at_the_deadline(slow_drive_url):
+    deadline = Deadline(0.2)
+    timer = threading.Timer(0.2, deadline.cancel, ('deadline exceeded', True))
+    timer.start()
+    token = current_deadline.set(deadline)
+    start = time.monotonic()
+    try:
+        with pytest.raises(DeadlineExceeded):
+            InstrumentedHttp(timeout=30).request(slow_drive_url)
+    finally:
+        current_deadline.reset(token)
+        timer.cancel()
+    assert time.monotonic() - start < 2
+
+def test_slow_route_answers_504(client, storage_api, user, monkeypatch):
+    monkeypatch.setitem(request_deadline.ROUTE_DEADLINES, '/api/storage/user-resumes', 0.2)
+
+    def slow_drive(*args):
+        time.sleep(0.4)
+        check_deadline()  # What the Drive transport does before each call
+
+    monkeypatch.setattr(storage_api.storage_service, 'find_user_folder', slow_drive)
+    response = client.get('/api/storage/user-resumes', params=user)
+    assert response.status_code == 504
+    assert response.json() == {'detail': 'Request deadline exceeded'}
+
+def test_client_disconnect_cancels_the_work():
+    outcome = []
+
+    def drive_work():
+        with current_deadline.get().on_cancel(lambda: outcome.append('aborted')):
+            for _ in range(100):
+                time.sleep(0.02)
+                try:
+                    check_deadline()
+                except RequestCancelled as e:
+                    outcome.append(type(e))
+                    return
+
+    async def app(scope, receive, send):
+        await run_in_threadpool(drive_work)
+
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.sleep(0.1)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        pass
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/api/storage/user-resumes', 'headers': []}
+    asyncio.run(DeadlineMiddleware(app)(scope, receive, send))
+    assert outcome == ['aborted', RequestCancelled]
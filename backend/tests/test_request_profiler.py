@@ -0,0 +1,63 @@
+"""Request profiling: only admin-requested (or sampled) requests are profiled, and the dump never blocks the loop"""
+
+import json
+import time
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import request_profiler
+from conftest import ADMIN_KEY, SERVICE_KEY
+from request_profiler import ProfilingMiddleware, drive_span
+
+def list_resumes_in_drive():
+    with drive_span('files.list'):
+        time.sleep(0.05)
+
+@pytest.fixture
+def profiled(tmp_path):
+    async def resumes(request):
+        await run_in_threadpool(list_resumes_in_drive)
+        return JSONResponse({'success': True})
+
+    app = Starlette(routes=[Route('/api/storage/user-resumes', resumes)])
+    return TestClient(ProfilingMiddleware(app, sample_rate=0, output_dir=str(tmp_path))), tmp_path
+
+def test_admin_header_writes_a_speedscope_profile(profiled):
+    client, output_dir = profiled
+    assert client.get('/api/storage/user-resumes', headers={'X-Learnnect-Profile': ADMIN_KEY}).status_code == 200
+
+    [path] = output_dir.iterdir()
+    profile = json.loads(path.read_text())
+    assert profile['name'] == 'GET /api/storage/user-resumes'
+    frames = [frame['name'] for frame in profile['shared']['frames']]
+    assert '[drive] files.list' in frames
+    assert any(entry['type'] == 'evented' and entry['events'] for entry in profile['profiles'])
+
+@pytest.mark.parametrize('headers', [{}, {'X-Learnnect-Profile': SERVICE_KEY}, {'X-Learnnect-Profile': 'guess'}])
+def test_other_requests_are_not_profiled(profiled, headers):
+    client, output_dir = profiled
+    assert client.get('/api/storage/user-resumes', headers=headers).status_code == 200
+    assert list(output_dir.iterdir()) == []
+
+def test_profile_is_written_off_the_event_loop(profiled, monkeypatch):
+    client, _ = profiled
+    write = request_profiler.write_speedscope
+    on_loop = []
+
+    def recording_write(profile, output_dir):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return write(profile, output_dir)
+
+    monkeypatch.setattr(request_profiler, 'write_speedscope', recording_write)
+    client.get('/api/storage/user-resumes', headers={'X-Learnnect-Profile': ADMIN_KEY})
+    assert on_loop == [False]
@@ -0,0 +1,58 @@
+"""Resume thumbnails: rendered next to the resume and served, but never counted or listed as the user's files"""
+
+import pytest
+
+import storage_audit
+from resume_thumbnails import ResumeThumbnailer
+
+pymupdf = pytest.importorskip('pymupdf')  # Optional: without it thumbnails switch themselves off
+
+def one_page_pdf() -> bytes:
+    document = pymupdf.open()
+    document.new_page().insert_text((72, 72), 'Ada Lovelace - Analyst')
+    return document.tobytes()
+
+@pytest.fixture
+def thumbnailed_resume(client, storage_api, user, monkeypatch):
+    """A resume uploaded through the API with its thumbnail rendered (in this test, not in the background)"""
+    storage = storage_api.storage_service
+    content = one_page_pdf()
+    upload = client.post('/api/storage/upload-resume', data={**user, 'fileName': 'cv.pdf'},
+                         files={'file': ('cv.pdf', content, 'application/pdf')})
+    assert upload.status_code == 200, upload.text
+    resume_id = upload.json()['fileId']
+
+    user_folder_id = storage.find_user_folder(user['userId'], user['userEmail'])
+    folder_id = storage.find_folder(user_folder_id, 'Profile-Resume')
+    thumbnailer = ResumeThumbnailer(storage, enabled=True, workers=1)
+    monkeypatch.setattr(storage_api, 'thumbnailer', thumbnailer)
+    try:
+        thumbnail_id = thumbnailer.generate(user['userId'], resume_id, folder_id, 'application/pdf', content)
+    finally:
+        thumbnailer.stop()
+    assert thumbnail_id
+    return {'id': resume_id, 'size': len(content), 'thumbnailId': thumbnail_id, 'userFolderId': user_folder_id}
+
+def test_thumbnail_is_served_but_only_the_resume_is_listed(client, user, thumbnailed_resume):
+    [resume] = client.get('/api/storage/user-resumes', params=user).json()['files']
+    assert resume['id'] == thumbnailed_resume['id']
+
+    thumbnail = client.get(resume['thumbnailURL'])
+    assert thumbnail.status_code == 200
+    assert thumbnail.headers['content-type'] == 'image/png' and thumbnail.content.startswith(b'\x89PNG')
+
+def test_profile_bundle_has_no_thumbnail_entries(client, user, thumbnailed_resume):
+    bundle = client.get('/api/storage/profile-bundle', params=user).json()
+    assert [entry['id'] for entry in bundle['resumes']] == [thumbnailed_resume['id']]
+    assert bundle['profile'] is None  # A PNG in Profile-Resume is not an avatar either
+
+def test_usage_recount_ignores_thumbnails(storage_api, user, thumbnailed_resume):
+    counts = storage_api.storage_service.count_user_usage(user['userId'], user['userEmail'])
+    assert counts['resume'] == {'bytes': thumbnailed_resume['size'], 'files': 1}
+
+def test_audit_ignores_thumbnails(storage_api, user, thumbnailed_resume, monkeypatch):
+    monkeypatch.setattr(storage_audit, 'get_service', lambda credentials: storage_api.storage_service.service)
+    folder = {'id': thumbnailed_resume['userFolderId'], 'name': storage_api.storage_service.get_user_folder_name(user['userId'], user['userEmail'])}
+    row = storage_audit.audit_user_folder(None, folder, None)
+    assert (row['resume_count'], row['resume_bytes']) == (1, thumbnailed_resume['size'])
+    assert row['file_count'] == 1
@@ -0,0 +1,76 @@
+"""Shared state: values, counters and locks that every worker process sees the same way"""
+
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+def add_from_another_process(path, times):
+    from shared_state import SharedState
+    state = SharedState(path)
+    for _ in range(times):
+        state.incr('counters', 'shared')
+
+def test_values_expire(clean_shared_state):
+    state = clean_shared_state
+    state.set('folders', 'short', 'folder-1', ttl=0.05)
+    state.set('folders', 'long', 'folder-2')
+    assert state.get('folders', 'short') == 'folder-1'
+    time.sleep(0.1)
+    assert state.get('folders', 'short', 'gone') == 'gone'
+    assert dict(state.items('folders')) == {'long': 'folder-2'}
+
+def test_counters_are_atomic_across_processes(clean_shared_state):
+    state = clean_shared_state
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=add_from_another_process, args=(state.path, 50)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: state.incr('counters', 'shared'), range(50)))
+    for worker in workers:
+        worker.join(timeout=60)
+    assert state.get('counters', 'shared') == 200
+
+def test_lock_has_one_owner_until_released_or_expired(clean_shared_state):
+    state = clean_shared_state
+    owner = state.try_acquire('folder:root/Learnnect_a', ttl=30)
+    assert owner
+    assert state.try_acquire('folder:root/Learnnect_a', ttl=30) is None
+    assert not state.renew('folder:root/Learnnect_a', 'someone-else', 30)
+    assert state.renew('folder:root/Learnnect_a', owner, 30)
+
+    state.release('folder:root/Learnnect_a', owner)
+    short = state.try_acquire('folder:root/Learnnect_a', ttl=0.05)
+    assert short
+    time.sleep(0.1)
+    assert state.try_acquire('folder:root/Learnnect_a', ttl=30)
+
+def test_single_flight_runs_one_holder_at_a_time(clean_shared_state):
+    state = clean_shared_state
+    active, overlaps = [], []
+
+    def guarded():
+        with state.single_flight('folder:root/new', ttl=5, wait=5) as held:
+            assert held
+            active.append(1)
+            overlaps.append(len(active))
+            time.sleep(0.02)
+            active.pop()
+
+    threads = [threading.Thread(target=guarded) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == [1] * 5
+
+def test_concurrent_first_uploads_create_one_user_folder(storage_api, user):
+    service = storage_api.storage_service
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        folder_ids = set(executor.map(lambda _: service.create_user_folder(user['userId'], user['userEmail']), range(4)))
+    assert len(folder_ids) == 1
+
+    folder_name = service.get_user_folder_name(user['userId'], user['userEmail'])
+    found = service.service.files().list(q=f"name='{folder_name}' and trashed=false", fields='files(id)').execute()
+    assert [file['id'] for file in found['files']] == list(folder_ids)
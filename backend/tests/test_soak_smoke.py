@@ -0,0 +1,26 @@
+"""Short Drive soak (drive_soak.py --smoke): every endpoint serves the soak's traffic mix without errors"""
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+@pytest.mark.slow
+def test_soak_smoke(tmp_path):
+    report_path = tmp_path / 'soak_report.json'
+    # Its own process: the soak sets up its environment and tracing before importing the API
+    result = subprocess.run(
+        [sys.executable, os.path.join(BACKEND_DIR, 'drive_soak.py'), '--smoke', '--report', str(report_path)],
+        cwd=tmp_path, capture_output=True, text=True, timeout=600
+    )
+    assert result.returncode == 0, result.stdout[-4000:] + result.stderr[-4000:]
+
+    report = json.loads(report_path.read_text())
+    assert report['flags'] == []
+    for endpoint, summary in report['endpoints'].items():
+        assert summary['requests'] > 0, endpoint
+        assert summary['errors'] == 0, endpoint
@@ -0,0 +1,85 @@
+"""Storage audit: per-user usage through the bucket folders, duplicates and orphans, resuming from the checkpoint"""
+
+import csv
+
+import pytest
+from googleapiclient.http import MediaInMemoryUpload
+
+import storage_audit
+from storage_audit import FOLDER_MIME_TYPE, run_audit
+
+def create(service, name, parent, content=None, mime_type=FOLDER_MIME_TYPE):
+    media = MediaInMemoryUpload(content, mimetype=mime_type) if content is not None else None
+    return service.files().create(body={'name': name, 'mimeType': mime_type, 'parents': [parent]},
+                                  media_body=media, fields='id').execute()['id']
+
+@pytest.fixture
+def drive(storage_api, monkeypatch):
+    """The stand-in's Drive client, shared by the audit's worker threads"""
+    service = storage_api.storage_service.service
+    monkeypatch.setattr(storage_audit, 'get_service', lambda credentials: service)
+    return service
+
+@pytest.fixture
+def tree(drive):
+    """A fresh audit root: one bucketed user with a duplicate left in the root, a misnamed folder and a stray file"""
+    root = create(drive, 'audit-root', 'root')
+    user_folder = create(drive, 'Learnnect_ada_user0001', create(drive, 'cd', create(drive, 'ab', root)))
+    resumes = create(drive, 'Profile-Resume', user_folder)
+    create(drive, 'cv.pdf', resumes, b'%PDF' + b'0' * 96, 'application/pdf')
+    create(drive, 'cv.pdf.thumbnail.png', resumes, b'0' * 500, 'image/png')
+    pictures = create(drive, 'Profile-Picture', user_folder)
+    for index in range(4):
+        create(drive, f'avatar-{index}.png', pictures, b'0' * 10, 'image/png')
+
+    duplicate = create(drive, 'Learnnect_ada_user0001', root)
+    misnamed = create(drive, 'Old uploads', root)
+    create(drive, 'notes.txt', root, b'0' * 7, 'text/plain')
+    return {'root': root, 'user': user_folder, 'duplicate': duplicate, 'misnamed': misnamed}
+
+def audit(tree, tmp_path, **kwargs):
+    rows = run_audit(None, tree['root'], str(tmp_path / 'audit.csv'), str(tmp_path / 'audit.checkpoint.jsonl'),
+                     workers=4, **kwargs)
+    return {row['folder_id']: row for row in rows}
+
+def test_usage_is_counted_through_the_bucket_folders(tree, tmp_path):
+    rows = audit(tree, tmp_path)
+    user = rows[tree['user']]
+    assert user['status'] == 'ok'
+    assert (user['resume_count'], user['resume_bytes']) == (1, 100)  # The thumbnail isn't the user's file
+    assert (user['profile_count'], user['profile_bytes']) == (4, 40)
+    assert (user['over_retention_count'], user['over_retention_bytes']) == (1, 10)  # Only the newest 3 images are kept
+    assert (user['file_count'], user['total_bytes']) == (5, 140)
+
+    with open(tmp_path / 'audit.csv') as f:
+        assert len(list(csv.DictReader(f))) == 4
+
+def test_duplicates_and_orphans_are_flagged(tree, tmp_path):
+    rows = audit(tree, tmp_path)
+    assert rows[tree['duplicate']]['status'] == 'duplicate'
+    assert rows[tree['duplicate']]['duplicate_of'] == tree['user']
+    assert rows[tree['misnamed']]['status'] == 'orphaned'
+    [stray] = [row for row in rows.values() if row['folder_name'] == 'notes.txt']
+    assert (stray['status'], stray['other_bytes']) == ('orphaned', 7)
+
+def test_rerun_continues_from_the_checkpoint(tree, tmp_path, monkeypatch):
+    audit_user_folder = storage_audit.audit_user_folder
+
+    def user_folder_fails(credentials, folder, retention_cutoff):
+        if folder['id'] == tree['user']:
+            raise RuntimeError('Drive unavailable')
+        return audit_user_folder(credentials, folder, retention_cutoff)
+
+    monkeypatch.setattr(storage_audit, 'audit_user_folder', user_folder_fails)
+    assert tree['user'] not in audit(tree, tmp_path)
+
+    audited = []
+
+    def recording(credentials, folder, retention_cutoff):
+        audited.append(folder['id'])
+        return audit_user_folder(credentials, folder, retention_cutoff)
+
+    monkeypatch.setattr(storage_audit, 'audit_user_folder', recording)
+    rows = audit(tree, tmp_path)
+    assert audited == [tree['user']]
+    assert rows[tree['user']]['file_count'] == 5
@@ -0,0 +1,52 @@
+"""Usage counters: kept on upload and delete, enforced as a quota, and recounted from Drive without losing races"""
+
+import storage_usage
+from conftest import pdf_upload
+from storage_usage import UsageReconciler, get_usage, record_usage
+
+def upload_resume(client, user, size=2048):
+    return client.post('/api/storage/upload-resume', data={**user, 'fileName': 'resume.pdf'}, files=pdf_upload(size=size))
+
+def usage(client, user):
+    return client.get('/api/storage/usage', params={'userId': user['userId']}).json()['usage']
+
+def test_upload_and_delete_adjust_the_counters(client, user):
+    file_id = upload_resume(client, user).json()['fileId']
+    assert usage(client, user)['resume'] == {'bytes': 2048 + 9, 'files': 1}
+
+    response = client.request('DELETE', '/api/storage/delete-resume', json={'fileId': file_id, 'userId': user['userId']})
+    assert response.status_code == 200, response.text
+    assert usage(client, user)['resume'] == {'bytes': 0, 'files': 0}
+
+def test_upload_over_quota_is_refused_before_drive(client, user, monkeypatch):
+    monkeypatch.setattr(storage_usage, 'USER_STORAGE_QUOTA_BYTES', 3000)
+    assert upload_resume(client, user).status_code == 200
+
+    response = upload_resume(client, user)
+    assert response.status_code == 413
+    assert usage(client, user)['totalFiles'] == 1
+    assert usage(client, user)['remainingBytes'] == 3000 - 2057
+
+def test_reconcile_corrects_drift_from_drive(client, storage_api, user):
+    upload_resume(client, user)
+    record_usage(user['userId'], 'resume', 10_000, 3)  # e.g. a file deleted in the Drive UI
+
+    reconciler = UsageReconciler(storage_api.storage_service)
+    assert reconciler.reconcile_user(user['userId'], user['userEmail'])
+    assert get_usage(user['userId'])['resume'] == {'bytes': 2057, 'files': 1}
+    assert get_usage(user['userId'])['reconciledAt']
+    assert reconciler.stats['corrected'] == 1
+
+def test_recount_that_raced_an_upload_is_dropped(client, storage_api, user):
+    upload_resume(client, user)
+
+    class UploadDuringRecount:
+        def count_user_usage(self, user_id, user_email):
+            counts = storage_api.storage_service.count_user_usage(user_id, user_email)
+            record_usage(user_id, 'resume', 500, 1)  # Lands after Drive was listed
+            return counts
+
+    reconciler = UsageReconciler(UploadDuringRecount())
+    assert reconciler.reconcile_user(user['userId'], user['userEmail']) is None
+    assert reconciler.stats['raced'] == 1
+    assert get_usage(user['userId'])['resume'] == {'bytes': 2557, 'files': 2}
@@ -0,0 +1,67 @@
+"""Token refresher: tokens are renewed ahead of expiry by one worker and adopted by the others"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from token_refresher import TokenRefresher, expiry_timestamp
+
+class MintingCredentials:
+    """Service account credentials whose refresh mints a numbered one-hour token"""
+
+    minted = 0
+
+    def __init__(self, expires_in=0, fail=False):
+        self.token = 'stale'
+        self.expiry = datetime.utcnow() + timedelta(seconds=expires_in)
+        self.fail = fail
+
+    def refresh(self, request):
+        if self.fail:
+            raise RuntimeError('invalid_grant')
+        MintingCredentials.minted += 1
+        self.token = f"token-{MintingCredentials.minted}"
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+def worker(expires_in=0, fail=False):
+    """One worker process's view of the same service account"""
+    account = SimpleNamespace(name='sa@learnnect.test', credentials=MintingCredentials(expires_in, fail))
+    return TokenRefresher(lambda: [account], margin=600), account.credentials
+
+def test_token_near_expiry_is_renewed_and_shared(clean_shared_state):
+    refresher, credentials = worker(expires_in=60)
+    refresher.sync_once()
+    assert credentials.token.startswith('token-')
+    assert clean_shared_state.get('access_tokens', 'sa@learnnect.test')['token'] == credentials.token
+    assert refresher.metrics()['refreshes'] == 1
+
+def test_fresh_token_is_left_alone(clean_shared_state):
+    refresher, credentials = worker(expires_in=3000)
+    refresher.sync_once()
+    assert credentials.token == 'stale'
+    assert refresher.stats['refreshes'] == 0
+
+def test_other_workers_adopt_the_shared_token_instead_of_minting(clean_shared_state):
+    first, first_credentials = worker()
+    first.sync_once()
+    minted = MintingCredentials.minted
+
+    second, second_credentials = worker()
+    second.sync_once()
+    assert MintingCredentials.minted == minted
+    assert second_credentials.token == first_credentials.token
+    assert abs(expiry_timestamp(second_credentials) - expiry_timestamp(first_credentials)) < 1
+    assert second.stats['adopted'] == 1
+
+def test_worker_waits_while_another_is_minting(clean_shared_state):
+    owner = clean_shared_state.try_acquire('token-refresh:sa@learnnect.test', ttl=60)
+    refresher, credentials = worker()
+    refresher.sync_once()
+    assert credentials.token == 'stale'
+    clean_shared_state.release('token-refresh:sa@learnnect.test', owner)
+
+def test_failed_refresh_is_recorded_and_not_shared(clean_shared_state):
+    refresher, credentials = worker(fail=True)
+    refresher.sync_once()
+    assert refresher.metrics()['lastError'] == 'invalid_grant'
+    assert clean_shared_state.get('access_tokens', 'sa@learnnect.test') is None
+    assert clean_shared_state.try_acquire('token-refresh:sa@learnnect.test', ttl=60)  # Lock released
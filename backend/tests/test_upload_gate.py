@@ -0,0 +1,97 @@
+"""Upload gate: oversized or wrong-type uploads are refused before the body is spooled"""
+
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from conftest import pdf_upload
+from upload_gate import UPLOAD_RULES, MULTIPART_OVERHEAD, RESUME_MAX_BYTES, MultipartSniffer, UploadGateMiddleware
+
+RESUME_PATH = '/api/storage/upload-resume'
+
+@pytest.fixture
+def gated():
+    """A route behind the gate that reads its whole body"""
+    received = []
+
+    async def upload(request):
+        received.append(len(await request.body()))
+        return JSONResponse({'success': True})
+
+    app = Starlette(routes=[Route(RESUME_PATH, upload, methods=['POST'])])
+    return TestClient(UploadGateMiddleware(app)), received
+
+def multipart(content: bytes, content_type: str = 'application/pdf', boundary: str = 'gate-test') -> bytes:
+    return (f'--{boundary}\r\nContent-Disposition: form-data; name="userId"\r\n\r\nuser-1\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="resume.pdf"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n').encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+
+def test_declared_oversize_is_refused_without_reading_the_body():
+    async def app(scope, receive, send):
+        raise AssertionError('oversized upload reached the route')
+
+    async def receive():
+        raise AssertionError('oversized body was read')
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': RESUME_PATH, 'headers': [
+        (b'content-type', b'multipart/form-data; boundary=x'),
+        (b'content-length', str(RESUME_MAX_BYTES + MULTIPART_OVERHEAD + 1).encode())
+    ]}
+    asyncio.run(UploadGateMiddleware(app)(scope, receive, send))
+    assert sent[0]['status'] == 413
+
+def test_body_over_the_limit_is_cut_off_while_streaming(gated):
+    client, received = gated
+
+    def chunks():
+        yield multipart(b'%PDF-1.4\n')
+        for _ in range(12):
+            yield b'0' * 1024 * 1024
+
+    response = client.post(RESUME_PATH, content=chunks(), headers={'content-type': 'multipart/form-data; boundary=gate-test'})
+    assert response.status_code == 413
+    assert received == []
+
+@pytest.mark.parametrize('content, content_type', [
+    (b'\x89PNG\r\n\x1a\n' + b'0' * 64, 'application/pdf'),  # Image renamed to .pdf
+    (b'%PDF-1.4\n' + b'0' * 64, 'image/png')                  # Declared type not allowed
+])
+def test_wrong_type_is_refused(gated, content, content_type):
+    client, received = gated
+    response = client.post(RESUME_PATH, content=multipart(content, content_type),
+                           headers={'content-type': 'multipart/form-data; boundary=gate-test'})
+    assert response.status_code == 400
+    assert received == []
+
+def test_rejection_is_answered_when_middleware_reads_the_body():
+    async def fingerprinting_middleware(scope, receive, send):
+        # Reads the whole body before any route runs, like an idempotency replay
+        while (await receive()).get('more_body'):
+            pass
+        raise AssertionError('bad body was read to the end')
+
+    client = TestClient(UploadGateMiddleware(fingerprinting_middleware), raise_server_exceptions=False)
+    response = client.post(RESUME_PATH, content=multipart(b'\x89PNG\r\n\x1a\n' + b'0' * 64),
+                           headers={'content-type': 'multipart/form-data; boundary=gate-test'})
+    assert response.status_code == 400
+
+def test_sniffer_finds_the_file_across_chunk_boundaries():
+    rule = UPLOAD_RULES[RESUME_PATH]
+    body = multipart(b'\x89PNG\r\n\x1a\n' + b'0' * 64)
+    sniffer = MultipartSniffer('multipart/form-data; boundary=gate-test', rule)
+    errors = [sniffer.feed(body[index:index + 1]) for index in range(len(body))]
+    assert [error for error in errors if error] == [rule['invalid_type']]
+
+def test_valid_resume_passes_through_to_drive(client, user):
+    response = client.post(RESUME_PATH, data={**user, 'fileName': 'resume.pdf'}, files=pdf_upload())
+    assert response.status_code == 200, response.text
+    assert response.json()['success']
@@ -0,0 +1,61 @@
+"""Upload progress: stages are published per upload ID and streamed over SSE until a terminal event"""
+
+import json
+import uuid
+import asyncio
+import threading
+
+import pytest
+
+from conftest import pdf_upload
+from upload_progress import ProgressBus, current_upload, report_progress, upload_progress
+
+def events(body):
+    return [json.loads(line[len('data: '):]) for line in body.splitlines() if line.startswith('data: ')]
+
+def test_tagged_upload_streams_its_stages_up_to_done(client, user):
+    upload_id = uuid.uuid4().hex
+    upload = client.post('/api/storage/upload-resume', data={**user, 'fileName': 'cv.pdf'}, files=pdf_upload('cv.pdf'),
+                         headers={'X-Upload-Id': upload_id})
+    assert upload.status_code == 200, upload.text
+
+    # A late subscriber starts from the latest event, which ends the stream at once
+    response = client.get('/api/storage/upload-progress', params={'uploadId': upload_id})
+    assert response.headers['content-type'].startswith('text/event-stream')
+    [done] = events(response.text)
+    assert (done['uploadId'], done['stage'], done['fileId']) == (upload_id, 'done', upload.json()['fileId'])
+
+def test_malformed_upload_id_is_rejected(client):
+    assert client.get('/api/storage/upload-progress', params={'uploadId': 'x/../y'}).status_code == 400
+
+def test_subscriber_sees_events_from_worker_threads_in_order():
+    bus = ProgressBus()
+    upload_id = uuid.uuid4().hex
+
+    async def follow():
+        frames = bus.stream(upload_id)
+        received = [await frames.__anext__()]  # retry: hint, subscribed from here on
+
+        def upload():
+            for stage, fields in (('received', {'bytesTotal': 10}), ('uploading', {'bytesSent': 5}), ('done', {'fileId': 'f1'})):
+                bus.publish(upload_id, stage, fields)
+
+        threading.Thread(target=upload).start()
+        async for frame in frames:
+            received.append(frame)
+        return ''.join(received)
+
+    body = asyncio.run(asyncio.wait_for(follow(), 10))
+    assert [event['stage'] for event in events(body)] == ['received', 'uploading', 'done']
+    assert bus.metrics()['subscribers'] == 0  # Unsubscribed once the upload finished
+
+def test_failing_upload_publishes_a_terminal_event(clean_shared_state):
+    upload_id = uuid.uuid4().hex
+    with pytest.raises(RuntimeError):
+        with upload_progress(upload_id):
+            report_progress('received', bytesTotal=10)
+            raise RuntimeError('Drive unavailable')
+
+    assert current_upload.get() is None
+    event = clean_shared_state.get('upload_progress', upload_id)
+    assert (event['stage'], event['error']) == ('failed', 'Drive unavailable')
@@ -0,0 +1,87 @@
+"""Direct-to-Drive uploads: the backend opens the session, the browser sends the bytes, finalize verifies them"""
+
+import os
+import time
+
+import pytest
+import requests
+
+from api_auth import make_jwt
+from conftest import JWT_SECRET
+
+@pytest.fixture
+def direct_uploads(storage_api, drive_url, monkeypatch):
+    """Resumable sessions opened against the stand-in instead of Google"""
+    monkeypatch.setattr(storage_api, 'DRIVE_UPLOAD_URL', f"{drive_url}/upload/drive/v3/files?uploadType=resumable")
+
+def open_session(client, user, **fields):
+    return client.post('/api/storage/upload-session', json={
+        **user, 'fileName': 'resume.pdf', 'kind': 'resume', 'mimeType': 'application/pdf', 'size': 2048, **fields
+    })
+
+def send_bytes(session, content: bytes) -> str:
+    """What the browser does with the session URL"""
+    response = requests.put(session['uploadURL'], data=content, timeout=10)
+    assert response.status_code == 200, response.text
+    return response.json()['id']
+
+def finalize(client, session, file_id, **headers):
+    return client.post('/api/storage/upload-session/finalize', json={'sessionId': session['sessionId'], 'fileId': file_id},
+                       headers=headers)
+
+def bearer(user_id):
+    return f"Bearer {make_jwt(JWT_SECRET, {'sub': user_id, 'exp': int(time.time()) + 600})}"
+
+def test_direct_upload_is_finalized_and_listed(client, user, direct_uploads):
+    session = open_session(client, user).json()
+    assert session['success']
+    file_id = send_bytes(session, b'%PDF-1.4\n' + os.urandom(2039))
+
+    response = finalize(client, session, file_id)
+    assert response.status_code == 200, response.text
+    assert response.json()['fileId'] == file_id
+    listed = client.get('/api/storage/user-resumes', params=user).json()['files']
+    assert [file['id'] for file in listed] == [file_id]
+    assert client.get('/api/storage/usage', params={'userId': user['userId']}).json()['usage']['resume']['files'] == 1
+
+    # A session finalizes once
+    assert finalize(client, session, file_id).status_code == 404
+
+def test_bytes_that_are_not_the_declared_type_are_deleted(client, storage_api, user, direct_uploads):
+    session = open_session(client, user).json()
+    file_id = send_bytes(session, b'\x89PNG\r\n\x1a\n' + os.urandom(2040))
+
+    response = finalize(client, session, file_id)
+    assert response.status_code == 400
+    with pytest.raises(Exception, match='404'):
+        storage_api.storage_service.service.files().get(fileId=file_id).execute()
+
+def test_finalize_never_touches_a_file_outside_the_session(client, storage_api, user, direct_uploads):
+    session = open_session(client, user).json()
+    other = open_session(client, user, fileName='other.pdf').json()
+    other_id = send_bytes(other, b'%PDF-1.4\n' + os.urandom(100))
+
+    assert finalize(client, session, other_id).status_code == 400
+    assert storage_api.storage_service.service.files().get(fileId=other_id).execute()['id'] == other_id
+
+@pytest.mark.parametrize('request_fields', [
+    {'mimeType': 'image/png'},
+    {'size': 50 * 1024 * 1024},
+    {'kind': 'profile', 'mimeType': 'image/png', 'fileName': 'avatar.png'},
+    {'kind': 'documents'}
+])
+def test_bad_session_requests_are_refused_before_drive(client, user, request_fields):
+    response = open_session(client, user, **request_fields)
+    assert response.status_code == 400
+
+def test_only_the_sessions_user_can_finalize_it(client, anonymous_client, user, direct_uploads):
+    session = open_session(client, user).json()
+    file_id = send_bytes(session, b'%PDF-1.4\n' + os.urandom(2039))
+
+    response = finalize(anonymous_client, session, file_id, Authorization=bearer('someone-else'))
+    assert response.status_code == 403
+    assert response.json()['detail'] == 'Token does not match userId'
+
+    response = finalize(anonymous_client, session, file_id, Authorization=bearer(user['userId']))
+    assert response.status_code == 200, response.text
+    assert response.json()['fileId'] == file_id
@@ -0,0 +1,121 @@
+"""Write-behind spool: staged uploads are pushed once, retried with backoff, and slow pushes keep their claim"""
+
+import io
+import sys
+import time
+import threading
+
+import pytest
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+import upload_spool
+from conftest import pdf_upload
+from upload_spool import UploadSpool
+
+def staged_file(content=b'%PDF-1.4\n' + b'0' * 100):
+    return UploadFile(file=io.BytesIO(content), filename='cv.pdf', headers=Headers({'content-type': 'application/pdf'}))
+
+@pytest.fixture
+def quiet_api_spool():
+    """Pause the API's own spool workers so they can't claim this test's jobs"""
+    api = sys.modules.get('learnnect_storage_api')
+    running = api and any(thread.is_alive() for thread in api.upload_spool._threads)
+    if running:
+        api.upload_spool.stop()
+    yield
+    if running:
+        api.upload_spool.start()
+
+@pytest.fixture
+def spool(tmp_path, quiet_api_spool):
+    pushes = []
+
+    def push(job, upload):
+        pushes.append(upload.file.read())
+        return spool.outcome
+
+    spool = UploadSpool(push, directory=str(tmp_path), workers=1)
+    spool.outcome = {'success': True, 'fileId': 'drive-file'}
+    spool.pushes = pushes
+    return spool
+
+def test_write_behind_upload_is_pushed_and_reported(client, storage_api, user, monkeypatch):
+    monkeypatch.setattr(storage_api, 'UPLOAD_WRITE_BEHIND', True)
+    response = client.post('/api/storage/upload-resume', data={**user, 'fileName': 'cv.pdf'}, files=pdf_upload('cv.pdf'))
+    assert response.json()['pending']
+
+    deadline = time.time() + 10
+    while (status := client.get(response.json()['statusURL'], params={'userId': user['userId']}).json())['state'] != 'done':
+        assert time.time() < deadline, status
+        time.sleep(0.1)
+    assert status['attempts'] == 1
+    listed = client.get('/api/storage/user-resumes', params=user).json()['files']
+    assert [file['id'] for file in listed] == [status['fileId']]
+
+def test_staged_upload_is_durable_and_pushed_once(spool, tmp_path):
+    job = spool.stage('resume', 'user-1', 'ada@example.com', staged_file(), 'cv.pdf')
+    assert (tmp_path / job['id']).read_bytes().startswith(b'%PDF')
+    assert spool.pending_bytes('user-1') == job['size']
+    staged = (tmp_path / job['id']).read_bytes()
+
+    claimed, _ = spool._claim()
+    spool._push(claimed)
+    assert spool.pushes == [staged]
+    assert spool.get_job(job['id'])['state'] == 'done'
+    assert not (tmp_path / job['id']).exists()
+    assert spool.pending_bytes('user-1') == 0
+
+def test_failed_push_backs_off_then_gives_up(spool, clean_shared_state, monkeypatch):
+    monkeypatch.setattr(upload_spool, 'UPLOAD_SPOOL_MAX_ATTEMPTS', 2)
+    spool.outcome = {'success': False, 'error': 'Drive unavailable'}
+    job = spool.stage('resume', 'user-1', 'ada@example.com', staged_file(), 'cv.pdf')
+
+    claimed, owner = spool._claim()
+    spool._push(claimed)
+    clean_shared_state.release(f"upload-job:{job['id']}", owner)
+    retrying = spool.get_job(job['id'])
+    assert (retrying['state'], retrying['lastError']) == ('pending', 'Drive unavailable')
+    assert retrying['nextAttemptAt'] > time.time()
+    assert spool._claim() is None  # Not due yet
+
+    retrying['nextAttemptAt'] = 0
+    clean_shared_state.set('upload_jobs', job['id'], retrying)
+    claimed, _ = spool._claim()
+    spool._push(claimed)
+    assert spool.get_job(job['id'])['state'] == 'failed'
+    assert len(spool.pushes) == 2
+
+def test_job_claimed_by_another_worker_waits_for_its_claim_to_expire(spool, clean_shared_state):
+    job = spool.stage('resume', 'user-1', 'ada@example.com', staged_file(), 'cv.pdf')
+    assert clean_shared_state.try_acquire(f"upload-job:{job['id']}", ttl=0.2)
+    assert spool._claim() is None
+
+    time.sleep(0.3)  # The other worker died mid-push
+    claimed, _ = spool._claim()
+    assert claimed['id'] == job['id']
+
+def test_heartbeat_keeps_a_slow_push_claimed(spool, monkeypatch):
+    monkeypatch.setattr(upload_spool, 'UPLOAD_SPOOL_CLAIM_TTL', 0.3)
+    monkeypatch.setattr(upload_spool, 'UPLOAD_SPOOL_HEARTBEAT', 0.05)
+    pushing = threading.Event()
+
+    def slow_push(job, upload):
+        pushing.set()
+        time.sleep(1)  # Several claim TTLs
+        spool.pushes.append(job['id'])
+        return {'success': True}
+
+    spool.push = slow_push
+    job = spool.stage('resume', 'user-1', 'ada@example.com', staged_file(), 'cv.pdf')
+    other_worker = UploadSpool(slow_push, directory=spool.directory)
+    spool.start()
+    try:
+        assert pushing.wait(5)
+        deadline = time.time() + 0.9
+        while time.time() < deadline:
+            assert other_worker._claim() is None
+            time.sleep(0.05)
+    finally:
+        spool.stop()
+    assert spool.pushes == [job['id']]
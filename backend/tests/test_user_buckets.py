@@ -0,0 +1,56 @@
+"""Bucket folders: new user folders go under <root>/xx/yy, and folders left in the root are moved on access or by the migration"""
+
+import pytest
+
+from conftest import pdf_upload
+from learnnect_storage_api import LEARNNECT_FOLDER_ID
+from migrate_folders import migrate
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+@pytest.fixture
+def storage(storage_api):
+    return storage_api.storage_service
+
+def parent_names(storage, file_id, levels):
+    """Names of a file's ancestors, nearest last"""
+    names = []
+    for _ in range(levels):
+        file_id = storage.service.files().get(fileId=file_id, fields='parents').execute()['parents'][0]
+        names.insert(0, storage.service.files().get(fileId=file_id, fields='name').execute()['name'])
+    return names
+
+def create_in_root(storage, name):
+    """A user folder as it was created before bucketing"""
+    return storage.service.files().create(body={
+        'name': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [LEARNNECT_FOLDER_ID]
+    }, fields='id').execute()['id']
+
+def test_bucket_depends_only_on_the_key_in_the_folder_name(storage):
+    assert storage.get_user_bucket_names('aaaa1234abcd') == storage.get_user_bucket_names('bbbb1234abcd')
+    assert all(len(name) == 2 for name in storage.get_user_bucket_names('aaaa1234abcd'))
+
+def test_new_user_folder_is_created_in_its_bucket(client, storage, user):
+    response = client.post('/api/storage/upload-resume', data={**user, 'fileName': 'cv.pdf'}, files=pdf_upload('cv.pdf'))
+    assert response.status_code == 200, response.text
+
+    folder_id = storage.find_user_folder(user['userId'], user['userEmail'])
+    assert parent_names(storage, folder_id, 3)[1:] == storage.get_user_bucket_names(user['userId'])
+
+def test_root_folder_is_moved_into_its_bucket_on_first_access(client, storage, user):
+    legacy_id = create_in_root(storage, storage.get_user_folder_name(user['userId'], user['userEmail']))
+
+    assert storage.find_user_folder(user['userId'], user['userEmail']) == legacy_id
+    assert parent_names(storage, legacy_id, 2) == storage.get_user_bucket_names(user['userId'])
+
+def test_migration_moves_root_folders_and_leaves_duplicates(client, storage, user):
+    folder_name = storage.get_user_folder_name(user['userId'], user['userEmail'])
+    bucketed_id = storage.create_user_folder(user['userId'], user['userEmail'])
+    duplicate_id = create_in_root(storage, folder_name)
+    other_id = create_in_root(storage, 'Learnnect_grace_0badcafe')
+
+    stats = migrate(storage, LEARNNECT_FOLDER_ID, pause=0)
+    assert stats['moved'] >= 1 and stats['duplicates'] >= 1 and stats['failed'] == 0
+    assert parent_names(storage, other_id, 2) == storage.get_user_bucket_names('0badcafe')
+    assert storage.service.files().get(fileId=duplicate_id, fields='parents').execute()['parents'] == [LEARNNECT_FOLDER_ID]
+    assert storage.find_user_folder(user['userId'], user['userEmail']) == bucketed_id
@@ -0,0 +1,137 @@
+"""
+Learnnect Token Refresher - Proactive OAuth token renewal shared across workers
+A background thread renews each service account's access token well before it
+expires and publishes it in shared state, so the other worker processes adopt
+it instead of signing their own JWT. Requests find a valid token already on the
+credentials and never wait on token minting (google-auth's lazy refresh stays
+as the fallback if the refresher is down).
+"""
+
+import os
+import time
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from google.auth.transport.requests import Request as TokenRequest
+
+from shared_state import shared_state
+
+# Renew when the shared token has less than this left (tokens last an hour)
+TOKEN_REFRESH_MARGIN = int(os.getenv('TOKEN_REFRESH_MARGIN', 600))
+TOKEN_REFRESH_INTERVAL = int(os.getenv('TOKEN_REFRESH_INTERVAL', 60))
+
+def expiry_timestamp(credentials) -> float:
+    """google-auth keeps expiry as a naive UTC datetime"""
+    if not credentials.expiry:
+        return 0.0
+    return credentials.expiry.replace(tzinfo=timezone.utc).timestamp()
+
+class TokenRefresher:
+    """Keeps every pooled account's token fresh, minting in one worker only"""
+
+    def __init__(self, get_accounts: Callable[[], List], interval: int = TOKEN_REFRESH_INTERVAL,
+                 margin: int = TOKEN_REFRESH_MARGIN):
+        self.get_accounts = get_accounts
+        self.interval = interval
+        self.margin = margin
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {
+            'refreshes': 0,
+            'failures': 0,
+            'adopted': 0,
+            'total_refresh_ms': 0.0,
+            'last_refresh_ms': None,
+            'last_error': None
+        }
+
+    def start(self):
+        """Make sure tokens are valid now, then keep them fresh in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self.sync_once()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='token-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sync_once()
+            except Exception as e:
+                print(f"⚠️ Token refresh cycle failed: {e}")
+
+    def sync_once(self):
+        """Adopt newer shared tokens and renew the ones close to expiry"""
+        for account in self.get_accounts():
+            self.sync_account(account)
+
+    def sync_account(self, account):
+        credentials = account.credentials
+        shared = shared_state.get('access_tokens', account.name)
+        if shared and shared['expiry'] > expiry_timestamp(credentials):
+            self._adopt(credentials, shared)
+
+        if expiry_timestamp(credentials) - time.time() > self.margin:
+            return
+
+        owner = shared_state.try_acquire(f"token-refresh:{account.name}", ttl=60)
+        if not owner:
+            return  # Another worker is minting; adopt its token next cycle
+        try:
+            # It may have been renewed while we were checking
+            shared = shared_state.get('access_tokens', account.name)
+            if shared and shared['expiry'] - time.time() > self.margin:
+                self._adopt(credentials, shared)
+                return
+            self._refresh(account)
+        finally:
+            shared_state.release(f"token-refresh:{account.name}", owner)
+
+    def _adopt(self, credentials, shared: Dict):
+        credentials.token = shared['token']
+        credentials.expiry = datetime.utcfromtimestamp(shared['expiry'])
+        self.stats['adopted'] += 1
+
+    def _refresh(self, account):
+        start = time.perf_counter()
+        try:
+            account.credentials.refresh(TokenRequest())
+        except Exception as e:
+            self.stats['failures'] += 1
+            self.stats['last_error'] = str(e)
+            print(f"⚠️ Token refresh failed for {account.name}: {e}")
+            return
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats['refreshes'] += 1
+        self.stats['total_refresh_ms'] += elapsed_ms
+        self.stats['last_refresh_ms'] = round(elapsed_ms, 1)
+        expiry = expiry_timestamp(account.credentials)
+        shared_state.set('access_tokens', account.name, {
+            'token': account.credentials.token,
+            'expiry': expiry
+        }, ttl=max(expiry - time.time(), 1))
+        print(f"🔑 Refreshed token for {account.name} in {elapsed_ms:.0f}ms")
+
+    def metrics(self) -> Dict:
+        refreshes = self.stats['refreshes']
+        return {
+            'refreshes': refreshes,
+            'failures': self.stats['failures'],
+            'adopted': self.stats['adopted'],
+            'avgRefreshMs': round(self.stats['total_refresh_ms'] / refreshes, 1) if refreshes else None,
+            'lastRefreshMs': self.stats['last_refresh_ms'],
+            'lastError': self.stats['last_error'],
+            'expiresIn': {
+                account.name: max(round(expiry_timestamp(account.credentials) - time.time()), 0)
+                for account in self.get_accounts()
+            }
+        }
@@ -0,0 +1,182 @@
+"""
+Learnnect Upload Gate - Early rejection of oversized or wrong-type uploads
+ASGI middleware that checks Content-Length up front, enforces per-route byte
+limits while the multipart body streams in, and sniffs the file's magic bytes
+on the first chunk, so bad uploads are cut off before they are spooled
+"""
+
+import re
+import json
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+
+MB = 1024 * 1024
+
+# Allowance for multipart boundaries and the small form fields sent with the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Bytes of multipart preamble to buffer while looking for the file part
+SNIFF_WINDOW = 64 * 1024
+
+PDF_SIGNATURES = [b'%PDF-']
+DOCX_SIGNATURES = [b'PK\x03\x04']  # DOCX is a ZIP container
+DOC_SIGNATURES = [b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1']  # Legacy OLE2 .doc
+JPEG_SIGNATURES = [b'\xff\xd8\xff']
+PNG_SIGNATURES = [b'\x89PNG\r\n\x1a\n']
+
+RESUME_CONTENT_TYPES = [
+    'application/pdf',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+]
+IMAGE_CONTENT_TYPES = ['image/jpeg', 'image/jpg', 'image/png', 'image/webp']
+
+RESUME_MAX_BYTES = 10 * MB
+IMAGE_MAX_BYTES = 5 * MB
+
+# Per-route upload rules
+UPLOAD_RULES: Dict[str, Dict] = {
+    '/api/storage/upload-resume': {
+        'max_bytes': RESUME_MAX_BYTES,
+        'content_types': RESUME_CONTENT_TYPES,
+        'signatures': PDF_SIGNATURES + DOCX_SIGNATURES + DOC_SIGNATURES,
+        'too_large': "File too large. Maximum size is 10MB.",
+        'invalid_type': "Invalid file type. Only PDF, DOC, DOCX allowed."
+    },
+    '/api/storage/upload-image': {
+        'max_bytes': IMAGE_MAX_BYTES,
+        'content_types': IMAGE_CONTENT_TYPES,
+        'signatures': JPEG_SIGNATURES + PNG_SIGNATURES,
+        'webp': True,
+        'too_large': "File too large. Maximum size is 5MB.",
+        'invalid_type': "Invalid file type. Only JPEG, PNG, and WebP images allowed."
+    }
+}
+
+def matches_signature(head: bytes, rule: Dict) -> bool:
+    """Check the first bytes of a file against the rule's magic numbers"""
+    if any(head.startswith(signature) for signature in rule['signatures']):
+        return True
+    # WebP: "RIFF" <4-byte size> "WEBP"
+    return bool(rule.get('webp')) and head[:4] == b'RIFF' and head[8:12] == b'WEBP'
+
+class MultipartSniffer:
+    """Incrementally finds the first file part in a multipart body and checks it"""
+
+    def __init__(self, content_type: str, rule: Dict):
+        match = re.search(r'boundary="?([^";]+)"?', content_type)
+        self.boundary = b'--' + match.group(1).encode() if match else None
+        self.rule = rule
+        self.buffer = b''
+        self.done = self.boundary is None
+
+    def feed(self, chunk: bytes) -> Optional[str]:
+        """Feed body bytes; returns an error message if the upload must be rejected"""
+        if self.done:
+            return None
+        self.buffer += chunk
+
+        search_from = 0
+        while True:
+            start = self.buffer.find(self.boundary, search_from)
+            if start < 0:
+                break
+            headers_end = self.buffer.find(b'\r\n\r\n', start)
+            if headers_end < 0:
+                break
+
+            headers = self.buffer[start:headers_end].decode('latin-1').lower()
+            if 'filename=' not in headers:
+                search_from = headers_end
+                continue
+
+            head = self.buffer[headers_end + 4:headers_end + 4 + 16]
+            if len(head) < 12 and len(self.buffer) < SNIFF_WINDOW:
+                return None  # Wait for more of the file
+
+            self.done = True
+            self.buffer = b''
+
+            declared = re.search(r'content-type:\s*([^\s;]+)', headers)
+            if declared and declared.group(1) not in self.rule['content_types']:
+                return self.rule['invalid_type']
+            if not matches_signature(head, self.rule):
+                return self.rule['invalid_type']
+            return None
+
+        if len(self.buffer) >= SNIFF_WINDOW:
+            # No file part near the start; leave validation to the route
+            self.done = True
+            self.buffer = b''
+        return None
+
+class UploadGateMiddleware:
+    """Reject bad uploads while the request body is still streaming"""
+
+    def __init__(self, app, rules: Dict[str, Dict] = UPLOAD_RULES):
+        self.app = app
+        self.rules = rules
+
+    async def __call__(self, scope, receive, send):
+        rule = self.rules.get(scope.get('path')) if scope['type'] == 'http' else None
+        if rule is None or scope.get('method') != 'POST':
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        body_limit = rule['max_bytes'] + MULTIPART_OVERHEAD
+
+        # Reject declared-too-large bodies without reading a byte
+        content_length = headers.get('content-length')
+        if content_length and content_length.isdigit() and int(content_length) > body_limit:
+            await self._reject(send, 413, rule['too_large'])
+            return
+
+        sniffer = MultipartSniffer(headers.get('content-type', ''), rule)
+        received = 0
+        rejection: Optional[HTTPException] = None
+        started = False
+
+        async def gated_receive():
+            nonlocal received, rejection
+            message = await receive()
+            if message['type'] == 'http.request':
+                chunk = message.get('body', b'')
+                received += len(chunk)
+                if received > body_limit:
+                    rejection = HTTPException(status_code=413, detail=rule['too_large'])
+                    raise rejection
+                error = sniffer.feed(chunk)
+                if error:
+                    rejection = HTTPException(status_code=400, detail=error)
+                    raise rejection
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if message['type'] == 'http.response.start':
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, gated_receive, tracked_send)
+        except HTTPException as e:
+            # Routes turn the rejection into a response themselves; middleware that reads
+            # the body before the route (e.g. idempotency replays) lets it escape to here
+            if e is not rejection or started:
+                raise
+            await self._reject(send, e.status_code, e.detail)
+
+    async def _reject(self, send, status_code: int, detail: str):
+        body = json.dumps({'detail': detail}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'connection', b'close')
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
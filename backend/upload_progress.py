@@ -0,0 +1,238 @@
+"""
+Learnnect Upload Progress - Stage and byte progress for uploads, streamed over SSE
+A client asks /api/storage/upload-progress/token for an upload ID, tags the
+upload with it as X-Upload-Id and opens the returned progressURL (which carries
+a short-lived token, since EventSource can't send headers) to follow it:
+received, folder resolved, uploading n/N chunks, permissions set, done. Events go through an
+in-process pub/sub (one small buffer per subscriber, woken on the event loop),
+and the latest event is mirrored to shared state so subscribers connected to
+another worker, or to a write-behind push, still see it. One poller thread per
+worker reads shared state once per watched upload, however many clients
+follow it, and keeps those reads off the event loop.
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Dict, Optional, Set
+
+from starlette.concurrency import run_in_threadpool
+
+from shared_state import shared_state
+
+UPLOAD_PROGRESS_HEADER = 'x-upload-id'
+UPLOAD_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+# Chunk size for watched uploads (Drive wants multiples of 256 KiB)
+UPLOAD_PROGRESS_CHUNK_SIZE = int(os.getenv('UPLOAD_PROGRESS_CHUNK_SIZE', 2 * 1024 * 1024))
+
+UPLOAD_PROGRESS_TTL = 60 * 60
+UPLOAD_PROGRESS_MAX_STREAM = float(os.getenv('UPLOAD_PROGRESS_MAX_STREAM', 15 * 60))
+HEARTBEAT_INTERVAL = 15
+
+# How often uploads with no local publisher are checked in shared state
+SHARED_POLL_INTERVAL = 1.0
+
+# Byte progress is mirrored to shared state at most this often (stage changes always are)
+SHARED_WRITE_INTERVAL = 1.0
+
+SUBSCRIBER_BUFFER = 32
+TERMINAL_STAGES = {'done', 'failed'}
+
+current_upload: ContextVar[Optional[str]] = ContextVar('current_upload', default=None)
+
+def upload_progress_id(request) -> Optional[str]:
+    """The client's X-Upload-Id, if it's a usable ID"""
+    upload_id = request.headers.get(UPLOAD_PROGRESS_HEADER)
+    return upload_id if upload_id and UPLOAD_ID_PATTERN.match(upload_id) else None
+
+@contextmanager
+def upload_progress(upload_id: Optional[str]):
+    """Publish progress reported inside the block under this upload ID"""
+    token = current_upload.set(upload_id)
+    try:
+        yield
+    except Exception as e:
+        # Subscribers would otherwise wait for a terminal event that never comes
+        report_progress('failed', error=str(e) or type(e).__name__)
+        raise
+    finally:
+        current_upload.reset(token)
+
+def report_progress(stage: str, **fields):
+    """Publish a progress event for the current upload (no-op when nobody tagged it)"""
+    upload_id = current_upload.get()
+    if upload_id:
+        progress_bus.publish(upload_id, stage, fields)
+
+def report_result(result: Dict):
+    """Publish the terminal event for a service result"""
+    if result.get('success'):
+        report_progress('done', fileId=result.get('fileId'), downloadURL=result.get('downloadURL'))
+    else:
+        report_progress('failed', error=result.get('error'))
+
+class Subscription:
+    """One SSE client's buffer of undelivered events"""
+
+    def __init__(self):
+        self.events: Deque[Dict] = deque(maxlen=SUBSCRIBER_BUFFER)
+        self.ready = asyncio.Event()
+        self.local = False
+
+class ProgressBus:
+    """In-process pub/sub keyed by upload ID.
+
+    Publishers are threadpool, spool and poller threads; delivery is handed
+    to the event loop, so subscribers only ever touch their buffer on the loop.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._last_written: Dict[str, tuple] = {}
+        self._last_polled: Dict[str, float] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._poller: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats = {'published': 0, 'delivered': 0, 'polls': 0}
+
+    def publish(self, upload_id: str, stage: str, fields: Dict):
+        event = {'uploadId': upload_id, 'stage': stage, **fields, 'at': time.time()}
+        self.stats['published'] += 1
+        self._mirror(upload_id, event)
+
+        with self._lock:
+            has_subscribers = bool(self._subscribers.get(upload_id))
+            loop = self._loop
+        if has_subscribers and loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._deliver, upload_id, event, True)
+            except RuntimeError:
+                pass  # Loop already closed (shutdown)
+
+    def _mirror(self, upload_id: str, event: Dict):
+        """Keep the latest event in shared state for other workers"""
+        with self._lock:
+            last_stage, last_at = self._last_written.get(upload_id, (None, 0.0))
+            if event['stage'] == last_stage and event['at'] - last_at < SHARED_WRITE_INTERVAL:
+                return
+            if event['stage'] in TERMINAL_STAGES:
+                self._last_written.pop(upload_id, None)
+            else:
+                self._last_written[upload_id] = (event['stage'], event['at'])
+        shared_state.set('upload_progress', upload_id, event, ttl=UPLOAD_PROGRESS_TTL)
+
+    def _deliver(self, upload_id: str, event: Dict, local: bool):
+        with self._lock:
+            subscribers = list(self._subscribers.get(upload_id, ()))
+        for subscription in subscribers:
+            subscription.local = subscription.local or local
+            subscription.events.append(event)
+            subscription.ready.set()
+        self.stats['delivered'] += len(subscribers)
+
+    def subscribe(self, upload_id: str) -> Subscription:
+        subscription = Subscription()
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._subscribers.setdefault(upload_id, set()).add(subscription)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='upload-progress-poller', daemon=True)
+                self._poller.start()
+        return subscription
+
+    def unsubscribe(self, upload_id: str, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(upload_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[upload_id]
+                    self._last_polled.pop(upload_id, None)
+
+    def _poll(self):
+        """Mirror shared-state progress to subscribers whose upload runs elsewhere (exits when idle)"""
+        while True:
+            time.sleep(SHARED_POLL_INTERVAL)
+            with self._lock:
+                if not self._subscribers:
+                    self._poller = None
+                    return
+                remote = [
+                    upload_id for upload_id, subscribers in self._subscribers.items()
+                    if any(not subscription.local for subscription in subscribers)
+                ]
+                loop = self._loop
+
+            for upload_id in remote:
+                try:
+                    event = shared_state.get('upload_progress', upload_id)
+                except Exception as e:
+                    print(f"⚠️ Could not read upload progress for {upload_id}: {e}")
+                    continue
+                self.stats['polls'] += 1
+                with self._lock:
+                    if not event or event['at'] <= self._last_polled.get(upload_id, 0.0):
+                        continue
+                    self._last_polled[upload_id] = event['at']
+                try:
+                    loop.call_soon_threadsafe(self._deliver, upload_id, event, False)
+                except RuntimeError:
+                    pass  # Loop already closed (shutdown)
+
+    async def stream(self, upload_id: str) -> AsyncIterator[str]:
+        """SSE frames for an upload until it finishes, the client leaves or the stream times out"""
+        subscription = self.subscribe(upload_id)
+        last_at = 0.0
+        last_sent = time.monotonic()
+        stream_end = time.monotonic() + UPLOAD_PROGRESS_MAX_STREAM
+        try:
+            yield f"retry: {int(SHARED_POLL_INTERVAL * 1000)}\n\n"
+            snapshot = await run_in_threadpool(shared_state.get, 'upload_progress', upload_id)
+            if snapshot:
+                subscription.events.append(snapshot)
+
+            while time.monotonic() < stream_end:
+                while subscription.events:
+                    event = subscription.events.popleft()
+                    if event['at'] <= last_at:
+                        continue
+                    last_at = event['at']
+                    last_sent = time.monotonic()
+                    yield f"id: {event['at']:.6f}\ndata: {json.dumps(event)}\n\n"
+                    if event['stage'] in TERMINAL_STAGES:
+                        return
+
+                # Events published elsewhere arrive through the poller
+                wait = min(HEARTBEAT_INTERVAL - (time.monotonic() - last_sent), stream_end - time.monotonic())
+                try:
+                    await asyncio.wait_for(subscription.ready.wait(), max(wait, 0))
+                except asyncio.TimeoutError:
+                    pass
+                subscription.ready.clear()
+
+                if time.monotonic() - last_sent >= HEARTBEAT_INTERVAL:
+                    last_sent = time.monotonic()
+                    yield ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(upload_id, subscription)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            uploads = len(self._subscribers)
+            subscribers = sum(len(subscriptions) for subscriptions in self._subscribers.values())
+        return {
+            'uploadsWatched': uploads,
+            'subscribers': subscribers,
+            'published': self.stats['published'],
+            'delivered': self.stats['delivered'],
+            'sharedPolls': self.stats['polls']
+        }
+
+progress_bus = ProgressBus()
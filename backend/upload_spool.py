@@ -0,0 +1,257 @@
+"""
+Learnnect Upload Spool - Write-behind staging for uploads
+Uploads are fsynced to a local spool directory and recorded as jobs in shared
+state, so the request can return as soon as the bytes are durable. Worker
+threads push staged files to Drive with retries, renewing their claim while a
+push runs; a job left behind by a crashed worker is picked up again once its
+claim expires.
+"""
+
+import os
+import time
+import uuid
+import shutil
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+from shared_state import shared_state
+from upload_progress import current_upload, upload_progress, report_progress, report_result
+
+# Return a pending handle instead of waiting for Drive
+UPLOAD_WRITE_BEHIND = os.getenv('UPLOAD_WRITE_BEHIND', 'false').lower() == 'true'
+
+UPLOAD_SPOOL_DIR = os.getenv(
+    'UPLOAD_SPOOL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upload_spool')
+)
+UPLOAD_SPOOL_WORKERS = int(os.getenv('UPLOAD_SPOOL_WORKERS', 2))
+UPLOAD_SPOOL_MAX_ATTEMPTS = int(os.getenv('UPLOAD_SPOOL_MAX_ATTEMPTS', 8))
+UPLOAD_SPOOL_RETRY_DELAY = 5
+UPLOAD_SPOOL_RETRY_DELAY_MAX = 600
+
+# A claim not renewed for this long is assumed to have died with its worker; live
+# pushes renew theirs every UPLOAD_SPOOL_HEARTBEAT, however long Drive takes
+UPLOAD_SPOOL_CLAIM_TTL = 300
+UPLOAD_SPOOL_HEARTBEAT = UPLOAD_SPOOL_CLAIM_TTL / 3
+
+# Finished jobs stay queryable for a week
+UPLOAD_RESULT_TTL = 7 * 24 * 60 * 60
+
+POLL_INTERVAL = 1.0
+
+class UploadSpool:
+    """Durable local staging area plus the workers that drain it to Drive"""
+
+    def __init__(self, push: Callable[[Dict, UploadFile], Dict], directory: str = UPLOAD_SPOOL_DIR,
+                 workers: int = UPLOAD_SPOOL_WORKERS):
+        self.push = push
+        self.directory = directory
+        self.workers = workers
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._claims: Dict[str, str] = {}
+        self._claims_lock = threading.Lock()
+
+    def start(self):
+        """Start the push workers (they also recover jobs from earlier runs)"""
+        if any(thread.is_alive() for thread in self._threads):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f'upload-spool-{index}', daemon=True)
+            for index in range(self.workers)
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat, name='upload-spool-heartbeat', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        print(f"📮 Upload spool started ({self.workers} workers, {self.metrics()['backlog']} jobs queued)")
+
+    def stop(self):
+        """Stop the push workers; unfinished jobs stay spooled"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def stage(self, kind: str, user_id: str, user_email: str, file: UploadFile, file_name: str) -> Dict:
+        """Write an upload to disk durably and queue it; returns the job"""
+        os.makedirs(self.directory, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        path = os.path.join(self.directory, job_id)
+
+        # Write, fsync, then rename so a crash never leaves a partial file under the job name
+        with open(path + '.part', 'wb') as staged:
+            shutil.copyfileobj(file.file, staged)
+            staged.flush()
+            os.fsync(staged.fileno())
+            size = staged.tell()
+        os.replace(path + '.part', path)
+        self._fsync_directory()
+
+        now = time.time()
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'userId': user_id,
+            'userEmail': user_email,
+            'fileName': file_name,
+            'contentType': file.content_type,
+            'size': size,
+            'state': 'pending',
+            'progressId': current_upload.get(),
+            'attempts': 0,
+            'createdAt': now,
+            'nextAttemptAt': now
+        }
+        shared_state.set('upload_jobs', job_id, job)
+        self._wake.set()
+        print(f"📮 Staged {kind} upload {file_name} ({size} bytes) as job {job_id}")
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """A queued job, or the outcome of a finished one"""
+        return shared_state.get('upload_jobs', job_id) or shared_state.get('upload_results', job_id)
+
+    def pending_bytes(self, user_id: str) -> int:
+        """Bytes a user has staged but not yet pushed (counted against their quota)"""
+        return sum(job['size'] for _, job in shared_state.items('upload_jobs') if job['userId'] == user_id)
+
+    def metrics(self) -> Dict:
+        """Backlog size and age, plus push counters across all workers"""
+        jobs = [job for _, job in shared_state.items('upload_jobs')]
+        now = time.time()
+        oldest = min((job['createdAt'] for job in jobs), default=None)
+        return {
+            'enabled': UPLOAD_WRITE_BEHIND,
+            'backlog': len(jobs),
+            'backlogBytes': sum(job['size'] for job in jobs),
+            'oldestAgeSeconds': round(now - oldest, 1) if oldest else 0,
+            'retrying': sum(1 for job in jobs if job['attempts'] > 0),
+            'pushed': shared_state.get('upload_spool_stats', 'pushed', 0),
+            'retries': shared_state.get('upload_spool_stats', 'retries', 0),
+            'failed': shared_state.get('upload_spool_stats', 'failed', 0)
+        }
+
+    def _fsync_directory(self):
+        """Persist the rename itself (no-op where directories can't be opened)"""
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _run(self):
+        while not self._stop.is_set():
+            claimed = self._claim()
+            if claimed is None:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+                continue
+
+            job, owner = claimed
+            claim = f"upload-job:{job['id']}"
+            with self._claims_lock:
+                self._claims[claim] = owner
+            try:
+                with upload_progress(job.get('progressId')):
+                    self._push(job)
+            except Exception as e:
+                print(f"⚠️ Upload spool worker error on job {job['id']}: {e}")
+            finally:
+                with self._claims_lock:
+                    self._claims.pop(claim, None)
+                shared_state.release(claim, owner)
+
+    def _heartbeat(self):
+        """Renew the claims of pushes in progress so slow ones are never pushed twice"""
+        while not self._stop.wait(UPLOAD_SPOOL_HEARTBEAT):
+            with self._claims_lock:
+                claims = list(self._claims.items())
+            for claim, owner in claims:
+                try:
+                    if not shared_state.renew(claim, owner, UPLOAD_SPOOL_CLAIM_TTL):
+                        print(f"⚠️ Lost the claim on {claim} mid-push; another worker may push it again")
+                except Exception as e:
+                    print(f"⚠️ Could not renew {claim}: {e}")
+
+    def _claim(self) -> Optional[Tuple[Dict, str]]:
+        """Claim the oldest due job no other worker is pushing"""
+        now = time.time()
+        due = sorted(
+            (job for _, job in shared_state.items('upload_jobs') if job['nextAttemptAt'] <= now),
+            key=lambda job: job['createdAt']
+        )
+        for job in due:
+            owner = shared_state.try_acquire(f"upload-job:{job['id']}", ttl=UPLOAD_SPOOL_CLAIM_TTL)
+            if not owner:
+                continue
+            # It may have finished between listing and claiming
+            current = shared_state.get('upload_jobs', job['id'])
+            if current:
+                return current, owner
+            shared_state.release(f"upload-job:{job['id']}", owner)
+        return None
+
+    def _push(self, job: Dict):
+        """Push one staged file to Drive, then finish or reschedule the job"""
+        path = os.path.join(self.directory, job['id'])
+        if not os.path.exists(path):
+            self._finish(job, 'failed', {'error': 'Staged file is missing'})
+            report_result({'success': False, 'error': 'Staged file is missing'})
+            return
+
+        job['state'] = 'pushing'
+        job['attempts'] += 1
+        shared_state.set('upload_jobs', job['id'], job)
+
+        try:
+            with open(path, 'rb') as staged:
+                upload = UploadFile(
+                    file=staged,
+                    size=job['size'],
+                    filename=job['fileName'],
+                    headers=Headers({'content-type': job['contentType'] or 'application/octet-stream'})
+                )
+                result = self.push(job, upload)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+
+        if result.get('success'):
+            self._finish(job, 'done', result)
+            report_result(result)
+            shared_state.incr('upload_spool_stats', 'pushed')
+            print(f"✅ Pushed staged upload {job['fileName']} (job {job['id']}, attempt {job['attempts']})")
+        elif job['attempts'] >= UPLOAD_SPOOL_MAX_ATTEMPTS:
+            self._finish(job, 'failed', {'error': result.get('error', 'Upload failed')})
+            report_result({'success': False, 'error': result.get('error', 'Upload failed')})
+            shared_state.incr('upload_spool_stats', 'failed')
+            print(f"❌ Giving up on staged upload {job['fileName']} (job {job['id']}): {result.get('technical_error') or result.get('error')}")
+        else:
+            delay = min(UPLOAD_SPOOL_RETRY_DELAY * 2 ** (job['attempts'] - 1), UPLOAD_SPOOL_RETRY_DELAY_MAX)
+            job['state'] = 'pending'
+            job['nextAttemptAt'] = time.time() + delay
+            job['lastError'] = result.get('error')
+            shared_state.set('upload_jobs', job['id'], job)
+            shared_state.incr('upload_spool_stats', 'retries')
+            report_progress('retrying', attempt=job['attempts'], retryIn=delay)
+            print(f"🔁 Staged upload {job['fileName']} failed (attempt {job['attempts']}); retrying in {delay}s")
+
+    def _finish(self, job: Dict, state: str, result: Dict):
+        """Record the outcome and drop the job and its staged file"""
+        outcome = {key: job[key] for key in ('id', 'kind', 'userId', 'fileName', 'size', 'attempts', 'createdAt')}
+        outcome.update(result, state=state, finishedAt=time.time())
+        outcome.pop('technical_error', None)
+        shared_state.set('upload_results', job['id'], outcome, ttl=UPLOAD_RESULT_TTL)
+        shared_state.delete('upload_jobs', job['id'])
+        try:
+            os.remove(os.path.join(self.directory, job['id']))
+        except FileNotFoundError:
+            pass